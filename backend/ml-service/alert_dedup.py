@@ -0,0 +1,116 @@
+"""
+AniResQ ML Service - Alert Deduplication Index
+Suppresses repeat alerts per (camera, class, coarse location) with timing-wheel expiry
+"""
+
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class AlertDedupIndex:
+    def __init__(self, cooldown=30.0, cell_size=0.25, tick=1.0, max_keys=100000, match_neighbors=True):
+        """
+        Bounded-memory index of recently alerted detections
+
+        Args:
+            cooldown: Seconds an alerted (camera, class, cell) key suppresses repeats
+            cell_size: Grid cell size as a fraction of frame width/height (0.25 = 4x4 grid)
+            tick: Resolution of the timing wheel in seconds
+            max_keys: Hard cap on live keys; the soonest-expiring keys are evicted beyond it
+            match_neighbors: Also treat the 8 surrounding cells as duplicates, so an animal
+                             walking across a cell boundary doesn't re-alert
+        """
+        self.cooldown = cooldown
+        self.cell_size = cell_size
+        self.tick = tick
+        self.max_keys = max_keys
+        self.match_neighbors = match_neighbors
+        self.slots = int(math.ceil(cooldown / tick)) + 1
+        self.wheel = [[] for _ in range(self.slots)]
+        self.expiry = {}  # key -> tick at which it expires
+        self.current_tick = self._tick(time.monotonic())
+        self.lock = threading.Lock()
+
+    def _tick(self, now):
+        return int(now // self.tick)
+
+    def _advance(self, now):
+        # Each key sits in exactly one bucket per recording, so clearing buckets
+        # as the wheel turns costs amortized O(1) per recorded key
+        tick = self._tick(now)
+        if tick - self.current_tick >= self.slots:
+            for bucket in self.wheel:
+                bucket.clear()
+            self.expiry.clear()
+        else:
+            for t in range(self.current_tick + 1, tick + 1):
+                bucket = self.wheel[t % self.slots]
+                for key in bucket:
+                    if self.expiry.get(key) == t:
+                        del self.expiry[key]
+                bucket.clear()
+        self.current_tick = tick
+
+    def _evict(self):
+        for offset in range(1, self.slots + 1):
+            t = self.current_tick + offset
+            bucket = self.wheel[t % self.slots]
+            for key in bucket:
+                if self.expiry.get(key) == t:
+                    del self.expiry[key]
+            bucket.clear()
+            if len(self.expiry) < self.max_keys:
+                return
+
+    def _keys(self, cctv_id, detections, frame_shape):
+        """One (cctv_id, class_name, cell_x, cell_y) key per row of a DetectionResult"""
+        if frame_shape:
+            height, width = frame_shape[:2]
+            centers = (detections.boxes[:, :2] + detections.boxes[:, 2:]) / 2
+            cells = (centers / [max(width, 1), max(height, 1)] / self.cell_size).astype(np.int32).tolist()
+        else:
+            cells = [(0, 0)] * len(detections)
+        names = [name.lower() for name in detections.class_names()]
+        return [(cctv_id, name, cx, cy) for name, (cx, cy) in zip(names, cells)]
+
+    def _is_live(self, key):
+        if key in self.expiry:
+            return True
+        if not self.match_neighbors:
+            return False
+        cctv_id, class_name, cx, cy = key
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if (dx or dy) and (cctv_id, class_name, cx + dx, cy + dy) in self.expiry:
+                    return True
+        return False
+
+    def filter_new(self, cctv_id, detections, frame_shape=None):
+        """Return the rows of a DetectionResult that are not within an active cooldown"""
+        keys = self._keys(cctv_id, detections, frame_shape)
+        with self.lock:
+            self._advance(time.monotonic())
+            fresh = np.array([not self._is_live(key) for key in keys], dtype=bool).reshape(len(keys))
+        return detections.select(fresh)
+
+    def record(self, cctv_id, detections, frame_shape=None):
+        """Start the cooldown for every detection that was just alerted"""
+        keys = self._keys(cctv_id, detections, frame_shape)
+        with self.lock:
+            self._advance(time.monotonic())
+            expires = self.current_tick + self.slots - 1
+            bucket = self.wheel[expires % self.slots]
+            for key in keys:
+                if key not in self.expiry and len(self.expiry) >= self.max_keys:
+                    self._evict()
+                self.expiry[key] = expires
+                bucket.append(key)
+
+    def __len__(self):
+        return len(self.expiry)
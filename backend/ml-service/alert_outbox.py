@@ -0,0 +1,242 @@
+"""
+AniResQ ML Service - Alert Outbox
+Delivers detection alerts on a background thread, spooling undelivered ones to SQLite
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AlertOutbox:
+    def __init__(self, send_fn, spool_path='alert_spool.db', spool_dir='alert_spool',
+                 max_queue=100, max_attempts=3, backoff_base=1.0, backoff_max=60.0,
+                 replay_interval=15.0, max_spool=10000):
+        """
+        Bounded background alert delivery with a durable local spool
+
+        Alerts are handed to a worker thread and retried with exponential backoff.
+        Alerts that still fail, or that arrive while the queue is full or the
+        backend is known to be down, are written to a SQLite spool (clips are moved
+        into spool_dir) and replayed once the backend answers again, including
+        after a restart.
+
+        Args:
+            send_fn: Callable(payload, video) -> bool doing the actual HTTP delivery; video
+                is None, the clip's bytes, or the path of a clip file
+            spool_path: SQLite database file for undelivered alerts
+            spool_dir: Directory that holds clips belonging to spooled alerts
+            max_queue: Maximum number of alerts waiting in memory
+            max_attempts: Delivery attempts before an alert is spooled
+            backoff_base: First retry delay in seconds, doubled on each attempt
+            backoff_max: Upper bound for the retry delay in seconds
+            replay_interval: Seconds between attempts to drain the spool
+            max_spool: Maximum spooled alerts; the oldest are discarded beyond this
+        """
+        self.send_fn = send_fn
+        self.spool_dir = spool_dir
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.replay_interval = replay_interval
+        self.max_spool = max_spool
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stop_event = threading.Event()
+        self.backend_up = True
+        self.next_replay = 0.0
+        self.stats = {
+            'queued': 0,
+            'delivered': 0,
+            'retries': 0,
+            'spooled': 0,
+            'replayed': 0,
+            'discarded': 0,
+        }
+
+        os.makedirs(spool_dir, exist_ok=True)
+        self.db_lock = threading.Lock()
+        self.db = sqlite3.connect(spool_path, check_same_thread=False)
+        with self.db_lock, self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS alerts ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "payload TEXT NOT NULL, "
+                "video_path TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, "
+                "next_attempt_at REAL NOT NULL)"
+            )
+
+        self.thread = threading.Thread(target=self._run, name="alert-outbox", daemon=True)
+        self.thread.start()
+
+    def enqueue(self, payload, video_path=None, video_data=None):
+        """
+        Hand an alert to the outbox without touching the network
+
+        Args:
+            payload: JSON-serializable alert payload
+            video_path: Optional clip file; the outbox takes ownership and deletes it once delivered
+            video_data: Optional in-memory clip (bytes); only written to disk if the alert is spooled
+        """
+        alert = {'payload': payload, 'video_path': video_path, 'video_data': video_data, 'attempts': 0}
+        try:
+            self.queue.put_nowait(alert)
+            self.stats['queued'] += 1
+        except queue.Full:
+            logger.warning("Alert queue full, spooling alert to disk")
+            self._spool(alert)
+
+    def pending(self):
+        """Return (queued in memory, spooled on disk) alert counts"""
+        with self.db_lock:
+            spooled = self.db.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+        return self.queue.qsize(), spooled
+
+    def stop(self, timeout=10):
+        """Stop the worker and spool anything still queued"""
+        self.stop_event.set()
+        self.thread.join(timeout)
+        while True:
+            try:
+                self._spool(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        with self.db_lock:
+            self.db.close()
+
+    def _backoff(self, attempts):
+        # Cap the exponent: spooled rows keep counting attempts for as long as the backend is down
+        delay = min(self.backoff_max, self.backoff_base * (2 ** min(attempts - 1, 20)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _try_send(self, payload, video_path, video_data=None):
+        if video_path and not os.path.exists(video_path):
+            video_path = None
+        try:
+            return bool(self.send_fn(payload, video_data if video_data is not None else video_path))
+        except Exception as e:
+            logger.error(f"Alert delivery raised: {e}")
+            return False
+
+    def _discard_media(self, video_path):
+        try:
+            if video_path and os.path.exists(video_path):
+                os.remove(video_path)
+        except OSError:
+            pass
+
+    def _deliver(self, alert):
+        while alert['attempts'] < self.max_attempts:
+            alert['attempts'] += 1
+            if self._try_send(alert['payload'], alert['video_path'], alert.get('video_data')):
+                self.backend_up = True
+                self.stats['delivered'] += 1
+                self._discard_media(alert['video_path'])
+                return True
+
+            if alert['attempts'] < self.max_attempts:
+                self.stats['retries'] += 1
+                if self.stop_event.wait(self._backoff(alert['attempts'])):
+                    break
+
+        self.backend_up = False
+        return False
+
+    def _spool(self, alert):
+        video_path = alert.get('video_path')
+        if alert.get('video_data') is not None:
+            try:
+                video_path = os.path.join(self.spool_dir, f"{time.time_ns()}_media")
+                with open(video_path, 'wb') as f:
+                    f.write(alert['video_data'])
+            except OSError as e:
+                logger.error(f"Could not write clip into spool: {e}")
+                video_path = None
+        elif video_path and os.path.exists(video_path) and os.path.dirname(os.path.abspath(video_path)) != os.path.abspath(self.spool_dir):
+            try:
+                spooled_path = os.path.join(self.spool_dir, f"{time.time_ns()}_{os.path.basename(video_path)}")
+                shutil.move(video_path, spooled_path)
+                video_path = spooled_path
+            except OSError as e:
+                logger.error(f"Could not move clip into spool: {e}")
+                video_path = None
+
+        now = time.time()
+        with self.db_lock, self.db:
+            self.db.execute(
+                "INSERT INTO alerts (payload, video_path, attempts, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (json.dumps(alert['payload'], default=str), video_path, alert.get('attempts', 0), now, now)
+            )
+            overflow = self.db.execute(
+                "SELECT id, video_path FROM alerts ORDER BY id DESC LIMIT -1 OFFSET ?",
+                (self.max_spool,)
+            ).fetchall()
+            for row_id, old_video in overflow:
+                self.db.execute("DELETE FROM alerts WHERE id = ?", (row_id,))
+                self._discard_media(old_video)
+        self.stats['spooled'] += 1
+        if overflow:
+            self.stats['discarded'] += len(overflow)
+            logger.warning(f"Alert spool full, discarded {len(overflow)} oldest alert(s)")
+
+    def _replay_spool(self, limit=50):
+        self.next_replay = time.monotonic() + self.replay_interval
+        with self.db_lock:
+            rows = self.db.execute(
+                "SELECT id, payload, video_path, attempts FROM alerts "
+                "WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+
+        for row_id, payload, video_path, attempts in rows:
+            if self.stop_event.is_set():
+                return
+
+            if not self._try_send(json.loads(payload), video_path):
+                self.backend_up = False
+                with self.db_lock, self.db:
+                    self.db.execute(
+                        "UPDATE alerts SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+                        (attempts + 1, time.time() + self._backoff(attempts + 1), row_id)
+                    )
+                return
+
+            self.backend_up = True
+            with self.db_lock, self.db:
+                self.db.execute("DELETE FROM alerts WHERE id = ?", (row_id,))
+            self._discard_media(video_path)
+            self.stats['replayed'] += 1
+
+        if rows:
+            logger.info(f"Replayed {self.stats['replayed']} spooled alert(s) so far")
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                if time.monotonic() >= self.next_replay:
+                    self._replay_spool()
+
+                try:
+                    alert = self.queue.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+
+                # While the backend is down, don't stall the queue on retries: spool
+                # straight away and let the periodic replay probe for recovery
+                if not self.backend_up or not self._deliver(alert):
+                    self._spool(alert)
+            except Exception as e:
+                # Keep the outbox alive: a dead thread would silently stop all delivery
+                logger.error(f"Alert outbox error: {e}")
+                time.sleep(1.0)
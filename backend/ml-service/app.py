@@ -7,15 +7,34 @@ import cv2
 import numpy as np
 import requests
 import logging
-from ultralytics import YOLO
 from pathlib import Path
 from datetime import datetime, timedelta
 import time
 import os
+import threading
 from dotenv import load_dotenv
-from collections import defaultdict, deque
 import json
 
+import config
+from alert_dedup import AlertDedupIndex
+from alert_outbox import AlertOutbox
+from batch_inference import PRIORITY_CRITICAL, PRIORITY_HIGH, PRIORITY_NAMES, PRIORITY_NORMAL, BatchInferenceEngine
+from camera_sharding import open_store, run_shard_node
+from cascade import CascadeDetector
+from clip_buffer import JpegRingBuffer, clip_source
+from clip_encoder import ClipProfile, focus_region
+from cpu_resources import LatencyTracker, ResourceManager
+from detection_result import DetectionResult
+from frame_capture import open_capture
+from media_uploader import uploader_from_config
+from media_worker import MediaWorker
+from motion_gate import MotionGate
+from roi_zones import CameraZones
+from sampling_scheduler import SamplingScheduler
+from stream_health import StreamHealthManager
+from stream_supervisor import load_camera_settings, parse_stream_specs, run_supervisor
+from tiled_inference import TiledDetector
+
 # Load environment variables
 load_dotenv()
 
@@ -27,7 +46,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class MLService:
-    def __init__(self, model_path, backend_url, confidence_threshold=0.5):
+    def __init__(self, model_path, backend_url, confidence_threshold=0.5,
+                 batch_size=1, batch_wait_ms=20, capture_mode='sequential', capture_options=None,
+                 camera_settings=None, gate_model_path=None, gate_options=None, resources=None):
         """
         Initialize ML Service
 
@@ -35,10 +56,28 @@ class MLService:
             model_path: Path to YOLOv8 model file
             backend_url: Backend API URL for posting detections
             confidence_threshold: Minimum confidence score for detections
+            batch_size: Frames per model call across cameras (1 = no batching, frames are
+                still served from the shared priority queue)
+            batch_wait_ms: Longest time a frame waits for a batch to fill
+            capture_mode: 'sequential', 'latest' or 'keyframe' (see frame_capture.open_capture)
+            capture_options: Extra keyword arguments for the capture class
+            camera_settings: Per-camera overrides, {cctv_id: {option: value}}
+            gate_model_path: Optional small model that screens frames before the main model
+            gate_options: Extra keyword arguments for CascadeDetector
+            resources: ResourceManager splitting cores between inference, decode and encode
+                (default: unmanaged); apply() it before creating the service
         """
         self.model_path = model_path
         self.backend_url = backend_url
         self.confidence_threshold = confidence_threshold
+        self.capture_mode = capture_mode
+        self.capture_options = capture_options or {}
+        self.camera_settings = camera_settings or {}
+        self.resources = resources or ResourceManager('none')
+
+        # Imported here rather than at module level: shared-mode capture processes are
+        # spawned and re-import this module
+        from ultralytics import YOLO
 
         # Load YOLOv8 model
         try:
@@ -49,246 +88,545 @@ class MLService:
             logger.error(f"Failed to load model: {e}")
             raise
 
+        # Optional cascade: the main model only sees frames where the gate finds candidates
+        self.cascade = None
+        if gate_model_path:
+            logger.info(f"Loading gate model from {gate_model_path}")
+            self.cascade = CascadeDetector(YOLO(gate_model_path), self._run_model, **(gate_options or {}))
+
+        # Tiled mode (per camera): native-resolution tiles, batched and merged with NMS
+        self.tiler = TiledDetector(
+            self.infer_frames,
+            tile_size=config.TILE_SIZE,
+            overlap=config.TILE_OVERLAP,
+            min_tile_motion=config.TILE_MIN_MOTION
+        )
+
         # Track recent detections to avoid duplicates
-        self.detection_cache = defaultdict(list)  # {cctv_id: [(timestamp, detections)]}
-        self.cache_expiry_seconds = 30  # Keep detections for 30 seconds
-        # Frame buffer to capture short clips on detection
-        clip_frames = int(os.getenv('CLIP_FRAMES', 30))
-        self.frame_buffer = deque(maxlen=clip_frames)
+        self.alert_index = AlertDedupIndex(
+            cooldown=config.DUPLICATE_ALERT_THRESHOLD,
+            cell_size=config.ALERT_CELL_SIZE
+        )
+        # Per-camera compressed pre-event buffers for alert clips (used when the
+        # capture does not keep the stream's own packets)
+        self.clip_buffers = {}
+        self.motion_gates = {}
+        # Wall-clock sampling shared by every camera on this node
+        self.scheduler = SamplingScheduler(
+            fps_budget=config.INFERENCE_FPS_BUDGET,
+            idle_fps=config.CCTV_FPS,
+            active_fps=config.ACTIVE_CCTV_FPS,
+            active_hold=config.ACTIVE_HOLD_SECONDS
+        )
+        # Connections are opened, watched for stalls and reconnected in the background
+        self.stream_manager = StreamHealthManager(
+            stall_timeout=config.STREAM_TIMEOUT,
+            reconnect_workers=self.resources.threads('decode')
+        )
+        # The YOLO predictor is not thread-safe; cameras share the model through this lock
+        self.model_lock = threading.Lock()
+
+        # Shared inference queue: camera threads submit frames with a priority,
+        # one thread runs the model on the most urgent (batched when batch_size > 1)
+        self.batcher = BatchInferenceEngine(
+            self.process_frames, batch_size, batch_wait_ms, aging_ms=config.INFERENCE_AGING_MS,
+            thread_init=lambda: self.resources.pin_thread('inference')
+        )
+        # End-to-end inference latency (queue + model) per request, for jitter
+        self.latency = LatencyTracker()
+        self.batcher.start()
+        self.last_alert = {}  # cctv_id -> monotonic time of the last queued alert
+        self.load_sample = (time.monotonic(), 0.0)  # (wall time, model busy time) at the last node_load()
+
+        # Alerts are posted with a snapshot on a sender thread, then their clips are built after
+        # the post-roll, uploaded and attached; one worker per clip profile in use
+        self.uploader = uploader_from_config()
+        self.media_workers = {}
+        self.media_lock = threading.Lock()
+
+        # Alerts the sender could not post are retried, and spooled to disk, by the outbox
+        self.outbox = AlertOutbox(
+            self._post_detection,
+            spool_path=config.ALERT_SPOOL_PATH,
+            spool_dir=config.ALERT_SPOOL_DIR,
+            max_queue=config.ALERT_QUEUE_SIZE,
+            max_attempts=config.ALERT_MAX_ATTEMPTS
+        )
+
+    def get_clip_buffer(self, cctv_id):
+        """Return the JPEG clip buffer for a camera, creating it on first use"""
+        buffer = self.clip_buffers.get(cctv_id)
+        if buffer is None:
+            buffer = self.clip_buffers.setdefault(cctv_id, JpegRingBuffer(
+                seconds=config.CLIP_SECONDS + config.CLIP_POST_ROLL,
+                quality=config.CLIP_JPEG_QUALITY,
+                size=(config.FRAME_WIDTH, config.FRAME_HEIGHT)
+            ))
+        return buffer
+
+    def media_worker(self, cctv_id):
+        """Return the MediaWorker for the camera's clip profile, creating it on first use"""
+        name = self.camera_setting(cctv_id, 'clip_profile', config.CLIP_PROFILE)
+        with self.media_lock:
+            worker = self.media_workers.get(name)
+            if worker is None:
+                profile = ClipProfile.named(name, preview=config.CLIP_PREVIEW)
+                if profile is None and config.CLIP_PREVIEW:
+                    logger.warning("Clip previews need a clip profile other than 'source'")
+                worker = self.media_workers[name] = MediaWorker(
+                    self._upload_media,
+                    self._attach_media,
+                    profile=profile,
+                    post_roll=config.CLIP_POST_ROLL,
+                    thread_init=lambda: self.resources.pin_thread('encode'),
+                    send_fn=self._send_alert
+                )
+        return worker
+
+    def close(self):
+        """Stop background workers; pending clips are finished, queued alerts are spooled to disk"""
+        self.batcher.stop()
+        self.stream_manager.shutdown()
+        for worker in list(self.media_workers.values()):
+            worker.stop()
+        self.uploader.close()
+        self.outbox.stop()
+
+    def inference_stats(self):
+        """
+        Inference queue and cascade statistics
+
+        Returns:
+            dict: 'queue' maps priority names to queue latency stats; 'latency' holds
+                  end-to-end percentiles and jitter; 'cascade' holds the gate pass rate
+                  and estimated speedup (only with a gate model)
+        """
+        stats = {'queue': self.batcher.latency_stats(), 'latency': self.latency.summary()}
+        if self.cascade is not None:
+            stats['cascade'] = self.cascade.summary()
+        return stats
+
+    def node_load(self):
+        """
+        Measured inference capacity and current utilization of this node
+
+        Returns:
+            dict: 'capacity' (frames per second the model sustains when busy) and
+                  'utilization' (share of wall time spent in the model since the last call)
+        """
+        stats = self.batcher.stats
+        busy = stats['busy_time']
+        now = time.monotonic()
+        last_time, last_busy = self.load_sample
+        self.load_sample = (now, busy)
+        return {
+            'capacity': round(stats['frames'] / busy, 2) if busy > 0 else 0.0,
+            'utilization': round(min(1.0, (busy - last_busy) / (now - last_time)), 3) if now > last_time else 0.0,
+        }
+
+    def stream_health(self):
+        """Per-camera stream state, accumulated dead time and reconnect count"""
+        return self.stream_manager.metrics()
+
+    def camera_setting(self, cctv_id, key, default=None):
+        """Return a per-camera override, falling back to default"""
+        return self.camera_settings.get(cctv_id, {}).get(key, default)
+
+    def create_motion_gate(self, cctv_id):
+        """Build the motion gate for a camera, or None if gating is disabled for it"""
+        if not self.camera_setting(cctv_id, 'motion_gate', config.MOTION_GATE):
+            return None
+        gate = MotionGate(
+            threshold=self.camera_setting(cctv_id, 'motion_threshold', config.MOTION_THRESHOLD),
+            force_interval=self.camera_setting(cctv_id, 'motion_force_interval', config.MOTION_FORCE_INTERVAL),
+            method=self.camera_setting(cctv_id, 'motion_method', config.MOTION_METHOD)
+        )
+        self.motion_gates[cctv_id] = gate
+        return gate
+
+    def release_camera(self, cctv_id):
+        """Drop per-camera state once a camera is no longer processed"""
+        self.clip_buffers.pop(cctv_id, None)
+        self.motion_gates.pop(cctv_id, None)
+        self.last_alert.pop(cctv_id, None)
+        self.scheduler.unregister(cctv_id)
+
+    def open_stream(self, stream_url, capture_mode, capture_options):
+        """
+        Open a capture on the decode cores
 
-    def process_frame(self, frame):
+        Reader threads started by the capture inherit the opening thread's
+        affinity; a capture process is pinned explicitly.
+        """
+        self.resources.pin_thread('decode')
+        cap = open_capture(stream_url, capture_mode, **capture_options)
+        process = getattr(cap, 'process', None)
+        if process is not None and process.pid:
+            self.resources.pin_process(process.pid, 'decode')
+        return cap
+
+    def camera_priority(self, cctv_id):
+        """
+        Inference priority for a camera's next frame
+
+        Cameras tracking an animal come first, then cameras that alerted recently,
+        then the operator-set 'priority' ('critical', 'high', 'normal' or 'low').
+        """
+        operator = self.camera_setting(cctv_id, 'priority', 'normal')
+        priority = PRIORITY_NAMES.index(operator) if operator in PRIORITY_NAMES else PRIORITY_NORMAL
+        if self.scheduler.is_active(cctv_id):
+            return PRIORITY_CRITICAL
+        last_alert = self.last_alert.get(cctv_id)
+        if last_alert is not None and time.monotonic() - last_alert < config.DUPLICATE_ALERT_THRESHOLD:
+            return min(priority, PRIORITY_HIGH)
+        return priority
+
+    def process_frame(self, frame, priority=PRIORITY_NORMAL):
         """
         Run YOLOv8 inference on a frame
 
         Args:
             frame: Input frame (numpy array)
+            priority: Queue priority class (see batch_inference.PRIORITY_*)
 
         Returns:
-            dict: Contains detected objects with class names, confidence, bounding boxes
+            DetectionResult: Boxes, confidences and class IDs for the frame
         """
+        return self.infer_frames([frame], priority)[0]
+
+    def infer_frames(self, frames, priority=PRIORITY_NORMAL):
+        """Run several frames through the shared priority queue and wait for all results"""
+        started = time.monotonic()
+        try:
+            results = self.batcher.infer_many(frames, priority)
+            self.latency.record(time.monotonic() - started)
+            return results
+        except Exception as e:
+            logger.error(f"Error during queued inference: {e}")
+            return [DetectionResult.empty(self.model.names, error=str(e)) for _ in frames]
+
+    def process_frames(self, frames):
+        """
+        Run YOLOv8 inference on several frames in a single model call
+
+        Args:
+            frames: List of input frames (numpy arrays)
+
+        Returns:
+            list: One DetectionResult per frame, in the same order as frames
+        """
+        if self.cascade is not None:
+            try:
+                return self.cascade.detect(frames)
+            except Exception as e:
+                logger.error(f"Error during gate inference: {e}")
+                return [DetectionResult.empty(self.model.names, error=str(e)) for _ in frames]
+        return self._run_model(frames)
+
+    def _run_model(self, frames):
+        """Run the main model on a list of frames (or crops)"""
         try:
             # Run inference
-            results = self.model(frame, conf=self.confidence_threshold)
-
-            detections = {
-                'objects': [],
-                'raw_results': results
-            }
-
-            # Extract detection information
-            if results and results[0].boxes:
-                for box in results[0].boxes:
-                    detection = {
-                        'class_id': int(box.cls[0]),
-                        'class_name': self.model.names[int(box.cls[0])],
-                        'confidence': float(box.conf[0]),
-                        'bbox': {
-                            'x_min': float(box.xyxy[0][0]),
-                            'y_min': float(box.xyxy[0][1]),
-                            'x_max': float(box.xyxy[0][2]),
-                            'y_max': float(box.xyxy[0][3])
-                        }
-                    }
-                    detections['objects'].append(detection)
-
-            return detections
+            with self.model_lock:
+                results = self.model(frames, conf=self.confidence_threshold)
+
+            # Copy the boxes out so the Results (and the frame it holds) can be freed
+            return [DetectionResult.from_ultralytics(result, self.model.names) for result in results]
 
         except Exception as e:
             logger.error(f"Error during inference: {e}")
-            return {'objects': [], 'error': str(e)}
+            return [DetectionResult.empty(self.model.names, error=str(e)) for _ in frames]
 
-    def should_send_alert(self, cctv_id, detections):
+    def should_send_alert(self, cctv_id, detections, frame_shape=None):
         """
         Determine if an alert should be sent based on detections and timing
 
         Args:
             cctv_id: ID of the CCTV camera
-            detections: List of detected objects
+            detections: DetectionResult to check
+            frame_shape: Shape of the frame the bounding boxes refer to
 
         Returns:
-            bool: True if alert should be sent
+            bool: True if any detection's (class, location) is outside its cooldown
         """
-        current_time = datetime.now()
-
-        # Clean expired cache entries
-        if cctv_id in self.detection_cache:
-            self.detection_cache[cctv_id] = [
-                (ts, det) for ts, det in self.detection_cache[cctv_id]
-                if (current_time - ts).total_seconds() < self.cache_expiry_seconds
-            ]
-
         # If no detections, don't send alert
-        if not detections:
+        if not len(detections):
             return False
 
-        # Don't send alert if same detection was sent recently
-        if cctv_id in self.detection_cache and self.detection_cache[cctv_id]:
-            return False
-
-        return True
+        return len(self.alert_index.filter_new(cctv_id, detections, frame_shape)) > 0
 
-    def send_detection_to_backend(self, cctv_id, detections, frame_shape=None, video_path=None):
+    def send_detection_to_backend(self, cctv_id, detections, frame_shape=None, snapshot=None,
+                                  clip_buffer=None, focus=None):
         """
-        Send detection results to backend API
+        Queue detection results for delivery to the backend API
+
+        The alert is posted with its snapshot on a sender thread; the clip is
+        built from clip_buffer once the post-roll has been recorded and attached
+        to the posted alerts afterwards.
 
         Args:
             cctv_id: CCTV Camera ID
-            detections: Dictionary containing detected objects
+            detections: DetectionResult to report
             frame_shape: Tuple of (height, width) for frame
-            video_path: Optional path to video clip file to upload
+            snapshot: Optional JPEG (bytes) of the alert frame
+            clip_buffer: Optional clip source the camera keeps filling (None = no clip)
+            focus: Normalized region of the alerted animals (clip_encoder.focus_region)
 
         Returns:
-            bool: True if successfully sent
+            bool: True once the alert has been queued
         """
+        payload = {
+            'cctv_id': cctv_id,
+            'timestamp': datetime.now().isoformat(),
+            'detections': [
+                {
+                    'animal': detection['class_name'],
+                    'confidence': round(detection['confidence'] * 100, 2),  # percentage, as the backend stores it
+                    'bbox': detection['bbox']
+                }
+                for detection in detections.to_dicts()
+            ],
+            'total_detections': len(detections),
+            'frame_shape': list(frame_shape) if frame_shape else None
+        }
+        self.media_worker(cctv_id).send_alert(
+            cctv_id, clip_buffer, {'payload': payload, 'snapshot': snapshot}, focus
+        )
+        self.last_alert[cctv_id] = time.monotonic()
+
+        # Start the cooldown for what was just alerted
+        self.alert_index.record(cctv_id, detections, frame_shape)
+        return True
+
+    def _send_alert(self, cctv_id, alert):
+        """
+        Post an alert once (runs on a MediaWorker sender thread)
+
+        Alerts that fail are handed to the outbox, which retries and spools them;
+        those are delivered without a clip.
+
+        Returns:
+            list: Backend IDs of the created alerts (empty if it went to the outbox)
+        """
+        alert_ids = self._post_detection(alert['payload'], alert['snapshot'])
+        if not alert_ids:
+            logger.warning(f"Alert for CCTV {cctv_id} handed to the outbox; its clip is dropped")
+            self.outbox.enqueue(alert['payload'], video_data=alert['snapshot'])
+        return alert_ids
+
+    def _upload_media(self, data, resource_type='video'):
+        """Upload clip or preview bytes through the shared uploader; returns the URL or None"""
+        filename = 'clip.mp4' if resource_type == 'video' else 'preview.webp'
+        return self.uploader.upload(data, resource_type=resource_type, filename=filename)
+
+    def _attach_media(self, alert_ids, media):
+        """Set videoUrl (and previewUrl) on alerts that were posted before their clip was ready"""
         try:
-            # If video provided, send as multipart/form-data, else use JSON
-            if video_path and os.path.exists(video_path):
-                with open(video_path, 'rb') as f:
-                    files = {'video': f}
-                    data = {
-                        'cctv_id': cctv_id,
-                        'timestamp': datetime.now().isoformat(),
-                        'detections': json.dumps(detections['objects']),
-                        'total_detections': len(detections['objects']),
-                        'frame_shape': json.dumps(frame_shape) if frame_shape else None,
-                    }
-                    response = requests.post(
-                        f"{self.backend_url}/api/detections",
-                        files=files,
-                        data=data,
-                        timeout=30
-                    )
-            else:
-                payload = {
+            response = requests.patch(
+                f"{self.backend_url}/api/wildDetection/detections/media",
+                json={'ids': alert_ids, **media},
+                timeout=30
+            )
+            if response.status_code == 200:
+                return True
+            logger.warning(f"Backend returned status {response.status_code} attaching clip: {response.text}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to attach clip: {e}")
+        return False
+
+    def _post_detection(self, payload, snapshot=None):
+        """
+        POST one alert payload to the backend's batch endpoint
+
+        Args:
+            payload: Alert payload built by send_detection_to_backend
+            snapshot: Optional JPEG, as bytes or the path of a spooled file
+
+        Returns:
+            list: Backend IDs of the created alerts; empty if delivery failed
+        """
+        cctv_id = payload['cctv_id']
+        url = f"{self.backend_url}/api/wildDetection/detections/batch"
+        try:
+            # With a snapshot send multipart/form-data (flat fields, detections as JSON), else JSON
+            if isinstance(snapshot, str):
+                with open(snapshot, 'rb') as f:
+                    snapshot = f.read()
+            if snapshot:
+                files = {'media': (f"detection_{cctv_id}.jpg", snapshot, 'image/jpeg')}
+                data = {
                     'cctv_id': cctv_id,
-                    'timestamp': datetime.now().isoformat(),
-                    'detections': detections['objects'],
-                    'total_detections': len(detections['objects']),
-                    'frame_shape': frame_shape
+                    'timestamp': payload['timestamp'],
+                    'detections': json.dumps(payload['detections']),
+                    'total_detections': payload['total_detections'],
+                    'frame_shape': json.dumps(payload['frame_shape']) if payload['frame_shape'] else None,
                 }
-                response = requests.post(
-                    f"{self.backend_url}/api/detections",
-                    json=payload,
-                    timeout=5
-                )
+                response = requests.post(url, files=files, data=data, timeout=30)
+            else:
+                response = requests.post(url, json=payload, timeout=5)
 
             if response.status_code == 201:
                 logger.info(f"Detection sent successfully for CCTV {cctv_id}")
-                # Cache the detection
-                self.detection_cache[cctv_id].append((datetime.now(), detections['objects']))
-                return True
+                return [created['_id'] for created in response.json().get('data', []) if created.get('_id')]
             else:
                 logger.warning(f"Backend returned status {response.status_code}: {response.text}")
-                return False
+                return []
 
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to send detection to backend: {e}")
-            return False
+            return []
         except Exception as e:
             logger.error(f"Unexpected error sending detection: {e}")
-            return False
+            return []
 
-    def process_cctv_stream(self, cctv_id, stream_url, fps=1):
+    def process_cctv_stream(self, cctv_id, stream_url, fps=1, stop_event=None, capture_mode=None):
         """
         Process a CCTV stream continuously
 
         Args:
             cctv_id: Unique ID for this CCTV camera
             stream_url: URL of the CCTV stream (RTSP, HTTP, etc.)
-            fps: Frames per second to process (1 = process 1 frame per second)
+            fps: Frames per second to process while the camera is idle; the scheduler
+                 raises it while an animal is tracked, within INFERENCE_FPS_BUDGET
+            stop_event: Optional threading.Event; the loop exits once it is set
+            capture_mode: Overrides the service's capture mode for this stream
         """
         logger.info(f"Starting stream processing for CCTV {cctv_id}: {stream_url}")
 
+        capture_mode = capture_mode or self.capture_mode
+        capture_options = self.capture_options if capture_mode == self.capture_mode else {}
+        # In 'latest' mode every read is an inferred frame, so wait until one is due
+        latest_only = capture_mode == 'latest'
+        self.scheduler.register(
+            cctv_id,
+            idle_fps=self.camera_setting(cctv_id, 'idle_fps', fps),
+            active_fps=self.camera_setting(cctv_id, 'active_fps')
+        )
+
+        stop_event = stop_event or threading.Event()
+        # Reading, resizing and motion checks run here; keep them off the inference cores
+        self.resources.pin_thread('decode')
+        jpeg_buffer = self.get_clip_buffer(cctv_id)
+        motion_gate = self.create_motion_gate(cctv_id)
+        zones = CameraZones.from_settings(self.camera_settings.get(cctv_id))
+        tiled = self.camera_setting(cctv_id, 'tiled', config.TILED_INFERENCE)
+        # Tiles without motion are skipped; without a motion gate a private one supplies the mask
+        tile_motion = MotionGate(method=config.MOTION_METHOD) if tiled and motion_gate is None else None
+        cap = None
         try:
-            cap = cv2.VideoCapture(stream_url)
-
-            if not cap.isOpened():
-                logger.error(f"Failed to open stream: {stream_url}")
-                return
-
-            frame_count = 0
-            process_interval = int(cap.get(cv2.CAP_PROP_FPS) / fps) if fps > 0 else 1
+            # The manager connects (and later reconnects) the stream off this thread;
+            # reads fail fast until a connection is up
+            cap = self.stream_manager.open(
+                cctv_id,
+                lambda: self.open_stream(stream_url, capture_mode, capture_options)
+            )
+
+            while not stop_event.is_set():
+                if latest_only:
+                    delay = self.scheduler.next_delay(cctv_id)
+                    if delay > 0 and stop_event.wait(delay):
+                        break
 
-            while True:
                 ret, frame = cap.read()
 
                 if not ret:
-                    logger.warning(f"Failed to read frame from CCTV {cctv_id}, reconnecting...")
-                    cap.release()
-                    time.sleep(5)
-                    cap = cv2.VideoCapture(stream_url)
                     continue
 
-                frame_count += 1
+                # Captures that keep packets (keyframe) or compress in their own process (shared) need no copy; others get a JPEG
+                clip_buffer = clip_source(cap, jpeg_buffer)
+                if clip_buffer is jpeg_buffer:
+                    try:
+                        jpeg_buffer.append(frame)
+                    except Exception:
+                        pass
+
+                # Process frame when the scheduler says this camera is due (wall clock,
+                # independent of the FPS the stream reports)
+                if self.scheduler.is_due(cctv_id):
+                    # Shared-ring views are overwritten after `slots` frames, but this frame may
+                    # wait in the inference queue and end up in the snapshot: give it its own copy
+                    if hasattr(cap, 'copy_last'):
+                        frame = cap.copy_last()
+                        if frame is None:
+                            continue
 
-                # keep frame in buffer for potential short-clip saving
-                try:
-                    self.frame_buffer.append(frame)
-                except Exception:
-                    pass
-
-                # Process frame at specified FPS
-                if frame_count % process_interval == 0:
                     # Resize frame for faster processing
                     frame_resized = cv2.resize(frame, (640, 480))
+                    # Tiled mode keeps the native resolution so small, distant animals survive
+                    source = frame if tiled else frame_resized
+
+                    # Only the ROI's bounding region is passed on to the motion gate and the model
+                    model_input, (x_offset, y_offset) = (
+                        zones.crop(source) if zones is not None else (source, (0, 0))
+                    )
+
+                    # Skip the model while nothing in the scene has changed
+                    if motion_gate is not None:
+                        if not motion_gate.should_infer(model_input):
+                            continue
+                        if motion_gate.motion_detected and hasattr(cap, 'mark_activity'):
+                            cap.mark_activity()
 
                     # Run inference
-                    detections = self.process_frame(frame_resized)
+                    priority = self.camera_priority(cctv_id)
+                    if tiled:
+                        if motion_gate is not None:
+                            motion_mask = motion_gate.last_mask
+                        else:
+                            motion_mask = tile_motion.motion_mask(model_input)
+                        detections = self.tiler.detect(model_input, motion_mask, priority=priority)
+                    else:
+                        detections = self.process_frame(model_input, priority)
+                    detections = detections.offset(x_offset, y_offset)
 
                     # Filter out humans - only alert for animals
-                    animal_detections = [d for d in detections.get('objects', []) if d.get('class_name', '').lower() not in ('human', 'humans')]
+                    animal_detections = detections.exclude_classes(('human', 'humans'))
+
+                    # Drop boxes outside the camera's alert zones
+                    if zones is not None:
+                        animal_detections = animal_detections.select(
+                            zones.alert_mask(animal_detections, source.shape)
+                        )
+
+                    if len(animal_detections):
+                        # Sample this camera faster while the animal is in view
+                        self.scheduler.mark_active(cctv_id)
+
+                        # Keep decoding every frame while something is in view
+                        if hasattr(cap, 'mark_activity'):
+                            cap.mark_activity()
 
-                    if animal_detections:
                         # Print terminal alerts with class and confidence
-                        for d in animal_detections:
-                            logger.warning(f"ALERT: {d.get('class_name')} - Confidence: {d.get('confidence'):.2f}")
+                        for class_name, confidence in zip(animal_detections.class_names(),
+                                                          animal_detections.scores.tolist()):
+                            logger.warning(f"ALERT: {class_name} - Confidence: {confidence:.2f}")
 
                     # Check if alert should be sent (use animal-only list)
-                    if self.should_send_alert(cctv_id, animal_detections):
-                        # create short clip from frame buffer (if available)
-                        video_path = None
-                        try:
-                            if len(self.frame_buffer) > 0:
-                                tmp_dir = os.getenv('TMPDIR', '/tmp')
-                                tmp_path = os.path.join(tmp_dir, f"detection_{cctv_id}_{int(time.time())}.mp4")
-                                height, width = frame_resized.shape[:2]
-                                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                                out = cv2.VideoWriter(tmp_path, fourcc, 10.0, (width, height))
-                                for f in list(self.frame_buffer):
-                                    try:
-                                        f_resized = cv2.resize(f, (width, height))
-                                        out.write(f_resized)
-                                    except Exception:
-                                        pass
-                                out.release()
-                                video_path = tmp_path
-                        except Exception as e:
-                            logger.error(f"Error creating clip: {e}")
-
-                        # Attach only animal detections when sending
-                        send_detections = {'objects': animal_detections, 'raw_results': detections.get('raw_results')}
-
-                        sent = self.send_detection_to_backend(
+                    if self.should_send_alert(cctv_id, animal_detections, source.shape):
+                        # Only the snapshot is encoded here; the clip is built after the post-roll
+                        ok, encoded = cv2.imencode('.jpg', source, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                        queued = self.send_detection_to_backend(
                             cctv_id,
-                            send_detections,
-                            frame_shape=frame_resized.shape,
-                            video_path=video_path
+                            animal_detections,
+                            frame_shape=source.shape,
+                            snapshot=encoded.tobytes() if ok else None,
+                            clip_buffer=clip_buffer,
+                            focus=focus_region(animal_detections.boxes.tolist(), source.shape)
                         )
 
-                        # cleanup temp video if created
-                        try:
-                            if video_path and os.path.exists(video_path):
-                                os.remove(video_path)
-                        except Exception:
-                            pass
-
-                        if sent:
-                            logger.info(f"Alert sent: {len(send_detections['objects'])} objects detected")
+                        if queued:
+                            logger.info(f"Alert queued: {len(animal_detections)} objects detected")
 
         except Exception as e:
             logger.error(f"Error processing stream {cctv_id}: {e}")
         finally:
-            cap.release()
+            if cap is not None:
+                cap.release()
+            if motion_gate is not None:
+                logger.info(f"CCTV {cctv_id} motion gate saved {motion_gate.stats['skipped']} of "
+                            f"{motion_gate.stats['checked']} inferences ({motion_gate.savings():.0%})")
+            if tiled:
+                logger.info(f"Tiled inference skipped {self.tiler.tile_savings():.0%} of tiles (all cameras)")
             logger.info(f"Stream processing stopped for CCTV {cctv_id}")
 
 def main():
@@ -303,16 +641,79 @@ def main():
     logger.info(f"Model Path: {model_path}")
     logger.info(f"Confidence Threshold: {confidence_threshold}")
 
-    # Initialize ML Service
-    service = MLService(model_path, backend_url, confidence_threshold)
+    # Size torch/OpenCV thread pools before the model is loaded
+    resources = ResourceManager(config.CPU_PROFILE, pin=config.CPU_PINNING)
+    resources.apply()
+
+    # Initialize ML Service (one model shared by every camera)
+    service = MLService(
+        model_path,
+        backend_url,
+        confidence_threshold,
+        batch_size=config.INFERENCE_BATCH_SIZE,
+        batch_wait_ms=config.INFERENCE_BATCH_WAIT_MS,
+        capture_mode=config.CAPTURE_MODE,
+        capture_options={
+            'quiet_period': config.KEYFRAME_QUIET_PERIOD,
+            'clip_seconds': config.CLIP_SECONDS + config.CLIP_POST_ROLL
+        } if config.CAPTURE_MODE == 'keyframe' else {
+            'clip_seconds': config.CLIP_SECONDS + config.CLIP_POST_ROLL,
+            'clip_quality': config.CLIP_JPEG_QUALITY,
+            'clip_size': (config.FRAME_WIDTH, config.FRAME_HEIGHT),
+            'max_ring_mb': config.SHARED_RING_MB
+        } if config.CAPTURE_MODE == 'shared' else None,
+        camera_settings=load_camera_settings(config.CAMERA_CONFIG_FILE),
+        gate_model_path=config.GATE_MODEL_PATH,
+        gate_options={
+            'gate_imgsz': config.GATE_IMGSZ,
+            'gate_conf': config.GATE_CONFIDENCE,
+            'gate_classes': config.GATE_CLASSES,
+            'crop': config.GATE_CROP
+        },
+        resources=resources
+    )
+
+    stream_specs = parse_stream_specs(config.CCTV_STREAM_URLS)
+
+    # Sharded mode: cameras are spread over every node sharing SHARD_STORE
+    if config.SHARD_ROLE:
+        logger.info(f"Node {config.NODE_ID} joining shard store {config.SHARD_STORE} as {config.SHARD_ROLE}")
+        try:
+            run_shard_node(
+                service,
+                open_store(config.SHARD_STORE),
+                config.NODE_ID,
+                config.SHARD_ROLE,
+                stream_specs,
+                fps=config.CCTV_FPS,
+                interval=config.SHARD_INTERVAL,
+                node_ttl=config.SHARD_NODE_TTL,
+                saturation=config.SHARD_SATURATION
+            )
+        finally:
+            service.close()
+        return
+
+    # Supervisor mode: run every stream from CCTV_STREAM_URLS concurrently
+    if stream_specs:
+        logger.info(f"Supervising {len(stream_specs)} CCTV stream(s)")
+        try:
+            run_supervisor(service, stream_specs, fps=config.CCTV_FPS)
+        finally:
+            service.close()
+        return
 
-    # Example: Process a single CCTV stream
-    # In production, this would be managed by the backend API
+    # Fallback: process a single CCTV stream
     cctv_id = "cctv_001"
     stream_url = os.getenv('CCTV_STREAM_URL', 'rtsp://localhost/stream')
 
     # Start processing (this runs indefinitely)
-    service.process_cctv_stream(cctv_id, stream_url, fps=1)
+    try:
+        service.process_cctv_stream(cctv_id, stream_url, fps=config.CCTV_FPS)
+    except KeyboardInterrupt:
+        logger.info("Interrupted")
+    finally:
+        service.close()
 
 if __name__ == "__main__":
     main()
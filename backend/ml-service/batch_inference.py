@@ -0,0 +1,195 @@
+"""
+AniResQ ML Service - Cross-camera Batched Inference
+Collects frames from many camera threads into a shared priority queue and
+runs them through the model in batches
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+PRIORITY_CRITICAL = 0  # camera with an active animal track
+PRIORITY_HIGH = 1      # recent alert, or operator-raised camera
+PRIORITY_NORMAL = 2
+PRIORITY_LOW = 3       # operator-lowered camera (e.g. parking lot)
+PRIORITY_NAMES = ('critical', 'high', 'normal', 'low')
+
+
+class InferenceRequest:
+    __slots__ = ('frame', 'future', 'submitted_at', 'priority')
+
+    def __init__(self, frame, priority=PRIORITY_NORMAL):
+        self.frame = frame
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+        self.priority = priority
+
+
+class BatchInferenceEngine:
+    def __init__(self, infer_fn, max_batch_size=8, max_wait_ms=20, aging_ms=250, latency_window=1000,
+                 thread_init=None):
+        """
+        Batch frames submitted from several threads into single model calls,
+        most urgent first
+
+        Requests are ordered by submitted_at + priority * aging, so a request
+        outranks any request one class more urgent that arrived more than
+        aging_ms after it. Every request is eventually served.
+
+        Args:
+            infer_fn: Callable taking a list of frames and returning one result per frame
+            max_batch_size: Maximum number of frames per model call
+            max_wait_ms: Longest time the first frame of a batch waits for company
+            aging_ms: Queue wait that is worth one priority class
+            latency_window: Recent queue latencies kept per priority class for the stats
+            thread_init: Optional callable run on the batching thread before the first batch
+                         (e.g. to pin it to the inference cores)
+        """
+        self.infer_fn = infer_fn
+        self.thread_init = thread_init
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.aging = max(0.0, aging_ms / 1000.0)
+        self.requests = []  # heap of (effective_time, seq, request)
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.latencies = {priority: deque(maxlen=latency_window) for priority in range(len(PRIORITY_NAMES))}
+        self.stats = {
+            'batches': 0,
+            'frames': 0,
+            'largest_batch': 0,
+            'busy_time': 0.0,  # seconds spent inside infer_fn
+        }
+
+    def start(self):
+        """Start the batching thread"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="batch-inference", daemon=True)
+        self.thread.start()
+        logger.info(f"Batched inference started (max batch {self.max_batch_size}, "
+                    f"max wait {self.max_wait * 1000:.0f} ms)")
+
+    def stop(self, timeout=5):
+        """Stop the batching thread; pending requests are failed"""
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        with self.cond:
+            pending, self.requests = self.requests, []
+        for _, _, request in pending:
+            request.future.set_exception(RuntimeError("Batch inference engine stopped"))
+
+    def submit(self, frame, priority=PRIORITY_NORMAL):
+        """Queue a frame and return a Future resolving to its result (failed if the engine stopped)"""
+        priority = min(max(int(priority), 0), len(PRIORITY_NAMES) - 1)
+        request = InferenceRequest(frame, priority)
+        with self.cond:
+            # Checked under the lock: stop() drains the queue once, after setting the event,
+            # so a request pushed after that would never be resolved
+            if self.stop_event.is_set():
+                request.future.set_exception(RuntimeError("Batch inference engine stopped"))
+                return request.future
+            heapq.heappush(self.requests, (request.submitted_at + priority * self.aging, next(self.seq), request))
+            self.cond.notify()
+        return request.future
+
+    def infer(self, frame, priority=PRIORITY_NORMAL, timeout=None):
+        """Submit a frame and block until its result is ready"""
+        return self.submit(frame, priority).result(timeout)
+
+    def infer_many(self, frames, priority=PRIORITY_NORMAL, timeout=None):
+        """Submit several frames at one priority and wait for all results"""
+        futures = [self.submit(frame, priority) for frame in frames]
+        return [future.result(timeout) for future in futures]
+
+    def average_batch_size(self):
+        return self.stats['frames'] / self.stats['batches'] if self.stats['batches'] else 0.0
+
+    def latency_stats(self):
+        """
+        Queue latency per priority class over the recent window
+
+        Returns:
+            dict: {priority_name: {'count', 'avg_ms', 'p95_ms', 'max_ms'}} for classes with traffic
+        """
+        stats = {}
+        for priority, samples in self.latencies.items():
+            waits = sorted(samples)
+            if not waits:
+                continue
+            stats[PRIORITY_NAMES[priority]] = {
+                'count': len(waits),
+                'avg_ms': round(sum(waits) / len(waits) * 1000, 1),
+                'p95_ms': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1),
+                'max_ms': round(waits[-1] * 1000, 1),
+            }
+        return stats
+
+    def _collect_batch(self):
+        with self.cond:
+            if not self.requests:
+                self.cond.wait(0.5)
+            if not self.requests:
+                return []
+
+            # Give a partial batch up to max_wait (from its oldest request) to fill up
+            oldest = min(request.submitted_at for _, _, request in self.requests)
+            deadline = oldest + self.max_wait
+            while len(self.requests) < self.max_batch_size and not self.stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            batch = [heapq.heappop(self.requests)[2]
+                     for _ in range(min(self.max_batch_size, len(self.requests)))]
+
+        now = time.monotonic()
+        for request in batch:
+            self.latencies[request.priority].append(now - request.submitted_at)
+        return batch
+
+    def _run(self):
+        if self.thread_init is not None:
+            self.thread_init()
+        while not self.stop_event.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            try:
+                results = self.infer_fn([request.frame for request in batch])
+            except Exception as e:
+                logger.error(f"Batched inference failed: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finally:
+                self.stats['busy_time'] += time.monotonic() - started
+
+            results = list(results)
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+            # Never leave a caller waiting on a frame infer_fn returned no result for
+            for request in batch[len(results):]:
+                request.future.set_exception(
+                    RuntimeError(f"Inference returned {len(results)} results for {len(batch)} frames")
+                )
+
+            self.stats['batches'] += 1
+            self.stats['frames'] += len(batch)
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
@@ -0,0 +1,180 @@
+"""
+AniResQ ML Service - Sparse Temporal Inference
+Carries detector boxes across skipped frames with sparse optical flow,
+and adapts how many frames the detector may skip
+"""
+
+import logging
+
+import cv2
+import numpy as np
+
+from detection_result import DetectionResult
+
+logger = logging.getLogger(__name__)
+
+
+class BoxPropagator:
+    def __init__(self, max_corners=20, min_points=4, max_fb_error=1.0, max_scale_step=0.1):
+        """
+        Move boxes from one frame to the next with Lucas-Kanade optical flow
+
+        Args:
+            max_corners: Feature points sampled inside each box
+            min_points: Points that must survive the forward-backward check for a box to be trusted
+            max_fb_error: Largest forward-backward error (pixels) for a point to be kept
+            max_scale_step: Largest per-frame change in box size (0.1 = +/-10%)
+        """
+        self.max_corners = max_corners
+        self.min_points = min_points
+        self.max_fb_error = max_fb_error
+        self.max_scale_step = max_scale_step
+        self.lk_params = dict(winSize=(15, 15), maxLevel=2,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+        self.prev_gray = None
+        self.result = DetectionResult.empty()
+
+    def reset(self, gray, result):
+        """Start propagating from a fresh detector result on this (grayscale) frame"""
+        self.prev_gray = gray
+        self.result = result
+
+    def _sample_points(self, gray, boxes):
+        height, width = gray.shape[:2]
+        points = []
+        owners = []
+        for index, (x1, y1, x2, y2) in enumerate(boxes.astype(int).tolist()):
+            x1, y1 = max(x1, 0), max(y1, 0)
+            x2, y2 = min(x2, width), min(y2, height)
+            if x2 - x1 < 4 or y2 - y1 < 4:
+                continue
+            corners = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], self.max_corners, 0.01, 3)
+            if corners is None:
+                continue
+            corners = corners.reshape(-1, 2) + (x1, y1)
+            points.append(corners)
+            owners.append(np.full(len(corners), index))
+        if not points:
+            return None, None
+        return np.concatenate(points).astype(np.float32), np.concatenate(owners)
+
+    def propagate(self, gray):
+        """
+        Shift the current boxes onto a new frame
+
+        Args:
+            gray: Grayscale frame, same size as the one given to reset()
+
+        Returns:
+            tuple: (DetectionResult with moved boxes, reliability in [0, 1] = share of
+                   boxes backed by enough consistent flow points)
+        """
+        result = self.result
+        if self.prev_gray is None or not len(result):
+            self.prev_gray = gray
+            return result, 1.0
+
+        boxes = result.boxes.copy()
+        reliable = np.zeros(len(boxes), dtype=bool)
+        points, owners = self._sample_points(self.prev_gray, boxes)
+
+        if points is not None:
+            # One forward and one backward LK call for the points of every box
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, points, None, **self.lk_params)
+            back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, moved, None, **self.lk_params)
+            fb_error = np.linalg.norm(points - back, axis=1)
+            good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < self.max_fb_error)
+
+            for index in range(len(boxes)):
+                keep = good & (owners == index)
+                if keep.sum() < self.min_points:
+                    continue
+                before, after = points[keep], moved[keep]
+                shift = np.median(after - before, axis=0)
+                spread_before = np.median(np.linalg.norm(before - before.mean(axis=0), axis=1))
+                spread_after = np.median(np.linalg.norm(after - after.mean(axis=0), axis=1))
+                scale = spread_after / spread_before if spread_before > 0 else 1.0
+                scale = float(np.clip(scale, 1 - self.max_scale_step, 1 + self.max_scale_step))
+
+                center = (boxes[index, :2] + boxes[index, 2:]) / 2 + shift
+                half = (boxes[index, 2:] - boxes[index, :2]) / 2 * scale
+                boxes[index] = np.concatenate([center - half, center + half])
+                reliable[index] = True
+
+        self.result = DetectionResult(
+            boxes=boxes,
+            scores=result.scores,
+            class_ids=result.class_ids,
+            track_ids=result.track_ids,
+            names=result.names
+        )
+        self.prev_gray = gray
+        return self.result, float(reliable.mean())
+
+
+class AdaptiveInterval:
+    def __init__(self, k_min=1, k_max=15, k_start=5, min_reliability=0.6):
+        """
+        Decide when the detector must run again
+
+        The interval K grows by one after every detector run that confirms the
+        propagated tracks, and halves when tracks appear, disappear or the flow
+        becomes unreliable (additive increase, multiplicative decrease).
+
+        Args:
+            k_min: Smallest number of frames between detector runs
+            k_max: Largest number of frames between detector runs
+            k_start: Initial interval
+            min_reliability: Propagation reliability below which the detector runs immediately
+        """
+        self.k_min = k_min
+        self.k_max = k_max
+        self.k = k_start
+        self.min_reliability = min_reliability
+        self.frames_since_detection = k_start  # run the detector on the first frame
+        self.force = False
+        self.stats = {'frames': 0, 'detector_runs': 0, 'propagated': 0, 'forced': 0}
+
+    def due(self):
+        """
+        Count a frame and check whether the detector should run on it
+
+        Returns:
+            bool: True if this frame goes to the detector
+        """
+        self.stats['frames'] += 1
+        if self.force or self.frames_since_detection >= self.k:
+            return True
+        self.frames_since_detection += 1
+        self.stats['propagated'] += 1
+        return False
+
+    def on_propagation(self, reliability, has_tracks):
+        """Force the next frame to the detector if propagated boxes can't be trusted"""
+        if has_tracks and reliability < self.min_reliability:
+            self.force = True
+            self.stats['forced'] += 1
+
+    def on_detection(self, expected_ids, detected_ids):
+        """
+        Adapt K after a detector run
+
+        Args:
+            expected_ids: Track IDs that were being propagated before the run
+            detected_ids: Track IDs the detector + tracker returned
+        """
+        self.stats['detector_runs'] += 1
+        uncertain = self.force or set(expected_ids) != set(detected_ids)
+        if uncertain:
+            self.k = max(self.k_min, self.k // 2)
+        else:
+            self.k = min(self.k_max, self.k + 1)
+        self.force = False
+        self.frames_since_detection = 1
+
+    def savings(self, baseline_interval=5):
+        """Detector calls saved relative to running it every baseline_interval-th frame"""
+        baseline = self.stats['frames'] / baseline_interval
+        if baseline <= 0:
+            return 0.0
+        return 1.0 - self.stats['detector_runs'] / baseline
@@ -0,0 +1,373 @@
+"""
+AniResQ ML Service - Camera Sharding
+Spreads cameras over several ML nodes with a capacity-weighted consistent-hash
+ring, and rebalances when nodes join, leave or saturate
+"""
+
+import bisect
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    def __init__(self, weights, vnodes=64):
+        """
+        Consistent-hash ring where each node owns a share proportional to its weight
+
+        Args:
+            weights: {node_id: weight}; a node with twice the weight gets twice the virtual nodes
+            vnodes: Virtual nodes for a node of average weight
+        """
+        self.points = []
+        self.owners = []
+        total = sum(weights.values())
+        if not total:
+            return
+        average = total / len(weights)
+        ring = []
+        for node_id, weight in weights.items():
+            for replica in range(max(1, round(vnodes * weight / average))):
+                ring.append((_hash(f"{node_id}#{replica}"), node_id))
+        ring.sort()
+        self.points = [point for point, _ in ring]
+        self.owners = [owner for _, owner in ring]
+
+    def node_for(self, key):
+        """Return the node owning a key, or None if the ring is empty"""
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, _hash(key)) % len(self.points)
+        return self.owners[index]
+
+
+class CoordinationStore:
+    """
+    Shared state for coordinator and workers: {'nodes': {...}, 'cameras': {...}, 'assignments': {...}}
+
+    Backends only implement _read() and _update(fn); fn mutates the state in place
+    and runs atomically with respect to other processes using the same store.
+    """
+
+    def _read(self):
+        raise NotImplementedError
+
+    def _update(self, fn):
+        raise NotImplementedError
+
+    @staticmethod
+    def _empty():
+        return {'nodes': {}, 'cameras': {}, 'assignments': {}}
+
+    def heartbeat(self, node_id, info):
+        """Register or refresh a node with its capacity/load info"""
+        def apply(state):
+            state['nodes'][node_id] = dict(info, seen=time.time())
+        self._update(apply)
+
+    def remove_node(self, node_id):
+        self._update(lambda state: state['nodes'].pop(node_id, None))
+
+    def nodes(self, ttl=None):
+        """Return {node_id: info}, leaving out nodes silent for more than ttl seconds"""
+        nodes = self._read()['nodes']
+        if ttl is None:
+            return nodes
+        now = time.time()
+        return {node_id: info for node_id, info in nodes.items() if now - info.get('seen', 0) <= ttl}
+
+    def set_cameras(self, cameras):
+        def apply(state):
+            state['cameras'] = dict(cameras)
+        self._update(apply)
+
+    def cameras(self):
+        return self._read()['cameras']
+
+    def set_assignments(self, assignments):
+        def apply(state):
+            state['assignments'] = dict(assignments)
+        self._update(apply)
+
+    def assignments(self):
+        return self._read()['assignments']
+
+
+class InMemoryStore(CoordinationStore):
+    """Store shared by coordinator and workers running in one process (tests, single host)"""
+
+    def __init__(self):
+        self.state = self._empty()
+        self.lock = threading.Lock()
+
+    def _read(self):
+        with self.lock:
+            return copy.deepcopy(self.state)
+
+    def _update(self, fn):
+        with self.lock:
+            fn(self.state)
+
+
+class FileStore(CoordinationStore):
+    def __init__(self, path, lock_timeout=10):
+        """
+        JSON file store for nodes on one host (or a shared filesystem)
+
+        Args:
+            path: State file; a sibling '.lock' file serializes updates via portalocker
+            lock_timeout: Seconds to wait for the lock
+        """
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.lock_timeout = lock_timeout
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return self._empty()
+        return {**self._empty(), **state}
+
+    def _read(self):
+        # Writers replace the file atomically, so readers need no lock
+        return self._load()
+
+    def _update(self, fn):
+        import portalocker
+
+        with portalocker.Lock(self.lock_path, timeout=self.lock_timeout):
+            state = self._load()
+            fn(state)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def open_store(spec):
+    """Build a store from SHARD_STORE: 'memory' or 'file:<path>'"""
+    if spec.startswith('file:'):
+        return FileStore(spec[len('file:'):])
+    if spec != 'memory':
+        logger.warning(f"Unknown shard store '{spec}', using in-memory store")
+    return InMemoryStore()
+
+
+class Coordinator:
+    def __init__(self, store, node_ttl=30, saturation=0.9, saturated_share=0.5, weight_tolerance=0.25,
+                 saturation_exit=0.7, saturation_hold=60.0, utilization_smoothing=0.3, default_capacity=10.0):
+        """
+        Assign cameras to live nodes and rebalance as the node set or load changes
+
+        Args:
+            store: CoordinationStore shared with the workers
+            node_ttl: Seconds without a heartbeat after which a node counts as gone
+            saturation: Smoothed utilization above which a node counts as saturated
+            saturated_share: Factor applied to a saturated node's weight, so it sheds cameras
+            weight_tolerance: Relative weight change that triggers a rebalance (avoids flapping)
+            saturation_exit: Smoothed utilization a saturated node must drop below to recover
+            saturation_hold: Minimum seconds a node stays saturated before its weight is restored
+            utilization_smoothing: EWMA factor for heartbeat utilization (1 = no smoothing)
+            default_capacity: Capacity assumed for unmeasured nodes when no live node has measured one
+        """
+        self.store = store
+        self.node_ttl = node_ttl
+        self.saturation = saturation
+        self.saturated_share = saturated_share
+        self.weight_tolerance = weight_tolerance
+        self.saturation_exit = min(saturation_exit, saturation)
+        self.saturation_hold = saturation_hold
+        self.utilization_smoothing = utilization_smoothing
+        self.default_capacity = default_capacity
+        self.weights = {}
+        self.load = {}  # node_id -> {'seen', 'utilization' (EWMA), 'saturated_since' (None = not saturated)}
+        self.rebalances = 0
+
+    def _update_load(self, node_id, info, now):
+        """Fold a new heartbeat into the node's smoothed utilization and saturation state"""
+        utilization = float(info.get('utilization') or 0)
+        load = self.load.get(node_id)
+        if load is None:
+            load = self.load[node_id] = {'seen': None, 'utilization': utilization, 'saturated_since': None}
+        elif info.get('seen') == load['seen']:
+            return load
+        else:
+            alpha = self.utilization_smoothing
+            load['utilization'] = alpha * utilization + (1 - alpha) * load['utilization']
+        load['seen'] = info.get('seen')
+
+        # Separate enter/exit levels plus a hold time, so a node hovering around the
+        # threshold doesn't shed and regain cameras (stream reconnects) every rebalance
+        if load['saturated_since'] is None:
+            if load['utilization'] > self.saturation:
+                load['saturated_since'] = now
+        elif load['utilization'] < self.saturation_exit and now - load['saturated_since'] >= self.saturation_hold:
+            load['saturated_since'] = None
+        return load
+
+    def node_weights(self, nodes, now=None):
+        """
+        Weight of every live node: measured capacity, discounted while the node is saturated
+
+        Nodes that have not run inference yet report no capacity; they get the average
+        measured capacity of the live nodes so a joining node receives its share of cameras.
+        """
+        now = time.monotonic() if now is None else now
+        for node_id in set(self.load) - set(nodes):
+            del self.load[node_id]
+
+        measured = [float(info['capacity']) for info in nodes.values() if float(info.get('capacity') or 0) > 0]
+        fallback = sum(measured) / len(measured) if measured else self.default_capacity
+
+        weights = {}
+        for node_id, info in nodes.items():
+            capacity = float(info.get('capacity') or 0)
+            weight = capacity if capacity > 0 else fallback
+            if self._update_load(node_id, info, now)['saturated_since'] is not None:
+                weight *= self.saturated_share
+            weights[node_id] = weight
+        return weights
+
+    def _weights_changed(self, weights):
+        if set(weights) != set(self.weights):
+            return True
+        return any(abs(weight - self.weights[node_id]) > self.weight_tolerance * self.weights[node_id]
+                   for node_id, weight in weights.items())
+
+    def rebalance(self, force=False):
+        """
+        Recompute assignments if nodes joined, left or their weights moved
+
+        Returns:
+            dict: {cctv_id: (old_node, new_node)} for every camera that moved
+        """
+        nodes = self.store.nodes(ttl=self.node_ttl)
+        weights = self.node_weights(nodes)
+        cameras = self.store.cameras()
+        current = self.store.assignments()
+        stale = set(current) != set(cameras) or any(node not in weights for node in current.values())
+        if not force and not stale and not self._weights_changed(weights):
+            return {}
+
+        ring = HashRing(weights)
+        assignments = {cctv_id: ring.node_for(cctv_id) for cctv_id in cameras}
+        assignments = {cctv_id: node for cctv_id, node in assignments.items() if node is not None}
+        moves = {cctv_id: (current.get(cctv_id), node) for cctv_id, node in assignments.items()
+                 if current.get(cctv_id) != node}
+
+        self.weights = weights
+        if moves or set(current) != set(assignments):
+            self.store.set_assignments(assignments)
+            self.rebalances += 1
+            logger.info(f"Rebalanced {len(cameras)} camera(s) over {len(weights)} node(s), {len(moves)} moved")
+        return moves
+
+    def run(self, stop_event, interval=5.0):
+        while not stop_event.wait(interval):
+            try:
+                self.rebalance()
+            except Exception as e:
+                logger.error(f"Rebalance failed: {e}")
+
+
+class ShardWorker:
+    def __init__(self, node_id, store, supervisor, load_fn, interval=5.0):
+        """
+        Keep this node's StreamSupervisor in line with its camera assignments
+
+        Args:
+            node_id: Unique name of this node
+            store: CoordinationStore shared with the coordinator
+            supervisor: StreamSupervisor running this node's cameras
+            load_fn: Callable returning {'capacity': fps, 'utilization': 0..1} for heartbeats
+            interval: Seconds between heartbeats/syncs
+        """
+        self.node_id = node_id
+        self.store = store
+        self.supervisor = supervisor
+        self.load_fn = load_fn
+        self.interval = interval
+
+    def sync(self):
+        """Send a heartbeat, then start/stop cameras to match the assignments"""
+        if self.supervisor.shutdown_event.is_set():
+            return
+        info = self.load_fn()
+        info['cameras'] = len(self.supervisor.cameras())
+        self.store.heartbeat(self.node_id, info)
+
+        cameras = self.store.cameras()
+        mine = {cctv_id for cctv_id, node in self.store.assignments().items() if node == self.node_id}
+        running = self.supervisor.cameras()
+
+        for cctv_id in set(running) - mine:
+            self.supervisor.remove_camera(cctv_id)
+        for cctv_id in mine - set(running):
+            if cctv_id in cameras:
+                self.supervisor.add_camera(cctv_id, cameras[cctv_id])
+
+    def run(self, stop_event):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Shard sync failed on {self.node_id}: {e}")
+            if stop_event.wait(self.interval):
+                break
+        # Leave the ring so the coordinator moves our cameras right away
+        self.store.remove_node(self.node_id)
+
+
+def run_shard_node(service, store, node_id, role, stream_specs, fps=1, interval=5.0, node_ttl=30, saturation=0.9):
+    """
+    Run this process as a coordinator, a worker or both, and block until interrupted
+
+    Args:
+        service: Shared MLService (used by the worker role)
+        store: CoordinationStore
+        node_id: Unique name of this node
+        role: 'coordinator', 'worker' or 'both'
+        stream_specs: (cctv_id, stream_url) pairs the coordinator publishes
+        fps: Frames per second to process per camera
+        interval: Seconds between heartbeats and rebalances
+        node_ttl: Seconds without a heartbeat after which a node is dropped
+        saturation: Utilization above which a node's share is reduced
+    """
+    from stream_supervisor import StreamSupervisor
+
+    stop_event = threading.Event()
+    threads = []
+
+    if role in ('coordinator', 'both'):
+        store.set_cameras(dict(stream_specs))
+        coordinator = Coordinator(store, node_ttl=node_ttl, saturation=saturation)
+        threads.append(threading.Thread(target=coordinator.run, args=(stop_event, interval),
+                                        name="shard-coordinator", daemon=True))
+
+    supervisor = StreamSupervisor(service, fps=fps)
+    if role in ('worker', 'both'):
+        worker = ShardWorker(node_id, store, supervisor, service.node_load, interval=interval)
+        threads.append(threading.Thread(target=worker.run, args=(stop_event,),
+                                        name="shard-worker", daemon=True))
+
+    for thread in threads:
+        thread.start()
+    logger.info(f"Shard node {node_id} running as {role}")
+    try:
+        supervisor.run_forever()
+    finally:
+        stop_event.set()
+        for thread in threads:
+            thread.join(interval + 5)
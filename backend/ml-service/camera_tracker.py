@@ -0,0 +1,184 @@
+"""
+AniResQ ML Service - Per-camera Object Tracking
+Each camera owns its own ByteTrack state, fed from a shared (stateless) detector
+"""
+
+import logging
+import threading
+import time
+
+from detection_result import DetectionResult
+
+logger = logging.getLogger(__name__)
+
+
+def load_tracker_config(tracker='bytetrack.yaml'):
+    """Load a ByteTrack config (a bundled name like 'bytetrack.yaml' or a path)"""
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+
+    args = IterableSimpleNamespace(**yaml_load(check_yaml(tracker)))
+    if args.tracker_type != 'bytetrack':
+        raise ValueError(f"Only bytetrack is supported for per-camera tracking, got '{args.tracker_type}'")
+    return args
+
+
+class _TrackerInput:
+    """DetectionResult seen through the Boxes attributes BYTETracker.update reads"""
+    __slots__ = ('result',)
+
+    def __init__(self, result):
+        self.result = result
+
+    def __len__(self):
+        return len(self.result)
+
+    def __getitem__(self, mask):
+        return _TrackerInput(self.result.select(mask))
+
+    @property
+    def conf(self):
+        return self.result.scores
+
+    @property
+    def cls(self):
+        return self.result.class_ids
+
+    @property
+    def xyxy(self):
+        return self.result.boxes
+
+    @property
+    def xywh(self):
+        boxes = self.result.boxes
+        xywh = boxes.copy()
+        xywh[:, :2] = (boxes[:, :2] + boxes[:, 2:]) / 2
+        xywh[:, 2:] = boxes[:, 2:] - boxes[:, :2]
+        return xywh
+
+
+class CameraTracker:
+    def __init__(self, tracker_args, frame_rate=30, stale_after=60.0):
+        """
+        Tracker state for a single camera
+
+        Args:
+            tracker_args: Config from load_tracker_config()
+            frame_rate: Rate at which update() is called; scales how long lost tracks are kept
+            stale_after: Seconds a track ID may go unseen before its alert history is dropped
+        """
+        from ultralytics.trackers.byte_tracker import BYTETracker
+
+        self.tracker = BYTETracker(tracker_args, frame_rate=frame_rate)
+        self.stale_after = stale_after
+        self.last_seen = {}   # track_id -> monotonic time last seen
+        self.last_alert = {}  # track_id -> monotonic time last alerted
+        self.last_update = time.monotonic()
+
+    def update(self, detections, frame=None):
+        """
+        Associate this frame's detections with the camera's tracks
+
+        Args:
+            detections: DetectionResult from the shared detector
+            frame: Frame the detections refer to (unused by ByteTrack itself)
+
+        Returns:
+            DetectionResult: Confirmed tracks, with track_ids filled in
+        """
+        tracks = self.tracker.update(_TrackerInput(detections), frame)
+        now = time.monotonic()
+        self.last_update = now
+
+        if len(tracks) == 0:
+            result = DetectionResult.empty(detections.names)
+        else:
+            # Rows are x1, y1, x2, y2, track_id, score, cls, detection index
+            result = DetectionResult(
+                boxes=tracks[:, :4],
+                scores=tracks[:, 5],
+                class_ids=tracks[:, 6],
+                track_ids=tracks[:, 4],
+                names=detections.names
+            )
+
+        for track_id in result.track_ids.tolist():
+            self.last_seen[track_id] = now
+        self._prune(now)
+        return result
+
+    def claim_alert(self, track_id, cooldown):
+        """
+        Check whether a track may alert again; records the alert if so
+
+        Returns:
+            bool: True if the track has not alerted within the last cooldown seconds
+        """
+        now = time.monotonic()
+        last = self.last_alert.get(track_id)
+        if last is not None and now - last <= cooldown:
+            return False
+        self.last_alert[track_id] = now
+        return True
+
+    def _prune(self, now):
+        stale = [track_id for track_id, seen in self.last_seen.items() if now - seen > self.stale_after]
+        for track_id in stale:
+            del self.last_seen[track_id]
+            self.last_alert.pop(track_id, None)
+
+    def reset(self):
+        self.tracker.reset()
+        self.last_seen.clear()
+        self.last_alert.clear()
+
+
+class TrackerPool:
+    def __init__(self, tracker='bytetrack.yaml', frame_rate=30, stale_after=60.0, idle_timeout=300.0):
+        """
+        Lazily created CameraTracker per camera, all sharing one tracker config
+
+        Args:
+            tracker: ByteTrack config name or path
+            frame_rate: Rate at which each camera's tracker is updated
+            stale_after: Seconds an unseen track ID keeps its alert history
+            idle_timeout: Seconds without updates after which a camera's tracker is dropped
+        """
+        self.args = load_tracker_config(tracker)
+        self.frame_rate = frame_rate
+        self.stale_after = stale_after
+        self.idle_timeout = idle_timeout
+        self.trackers = {}
+        self.lock = threading.Lock()
+
+    def get(self, cctv_id):
+        """Return the tracker for a camera, creating it on first use"""
+        with self.lock:
+            tracker = self.trackers.get(cctv_id)
+            if tracker is None:
+                tracker = CameraTracker(self.args, self.frame_rate, self.stale_after)
+                self.trackers[cctv_id] = tracker
+            return tracker
+
+    def update(self, cctv_id, detections, frame=None):
+        """Feed one camera's detections to its own tracker"""
+        self.evict_idle()
+        return self.get(cctv_id).update(detections, frame)
+
+    def release(self, cctv_id):
+        with self.lock:
+            self.trackers.pop(cctv_id, None)
+
+    def evict_idle(self):
+        """Drop trackers of cameras that stopped sending frames"""
+        now = time.monotonic()
+        with self.lock:
+            idle = [cctv_id for cctv_id, tracker in self.trackers.items()
+                    if now - tracker.last_update > self.idle_timeout]
+            for cctv_id in idle:
+                del self.trackers[cctv_id]
+        for cctv_id in idle:
+            logger.info(f"Dropped idle tracker for CCTV {cctv_id}")
+
+    def __len__(self):
+        return len(self.trackers)
@@ -0,0 +1,280 @@
+"""
+AniResQ ML Service - Pre-event Clip Buffers
+Keep the seconds before an alert as compressed data (the source stream's own
+packets when PyAV demuxes it, JPEG frames otherwise) and build clips in memory
+"""
+
+import io
+import logging
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from clip_encoder import ClipProfile, encode_clip, encode_preview
+
+logger = logging.getLogger(__name__)
+
+
+class PacketRingBuffer:
+    def __init__(self, stream, seconds=3.0):
+        """
+        Ring of a stream's encoded packets, always starting at a keyframe
+
+        Without a clip profile a clip is a remux of these packets: no decoding
+        or re-encoding. With one, the packets are decoded and re-encoded.
+
+        Args:
+            stream: PyAV input video stream the packets come from (codec parameters, time base)
+            seconds: History to keep; up to one extra GOP is held so the clip starts on a keyframe
+        """
+        self.stream = stream
+        self.time_base = stream.time_base
+        self.max_ticks = int(seconds / float(stream.time_base)) if stream.time_base else 0
+        self.packets = deque()  # (pts, dts, duration, is_keyframe, data)
+        self.keyframes = deque()  # dts of the keyframes in self.packets
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def append(self, packet):
+        """Add a demuxed packet; packets before the first keyframe are ignored"""
+        if packet.dts is None or not packet.size:
+            return
+        with self.lock:
+            if self.packets and packet.dts < self.packets[-1][1]:
+                # Timestamps went backwards (stream restarted): the old history no longer fits
+                self._clear()
+            if not self.packets and not packet.is_keyframe:
+                return
+
+            pts = packet.pts if packet.pts is not None else packet.dts
+            self.packets.append((pts, packet.dts, packet.duration or 0, packet.is_keyframe, bytes(packet)))
+            self.nbytes += packet.size
+            if packet.is_keyframe:
+                self.keyframes.append(packet.dts)
+
+            # Drop the oldest GOP once the next one alone still covers the window
+            while len(self.keyframes) > 1 and packet.dts - self.keyframes[1] >= self.max_ticks:
+                self.keyframes.popleft()
+                while self.packets[0][1] < self.keyframes[0] or not self.packets[0][3]:
+                    self.nbytes -= len(self.packets.popleft()[4])
+
+    def _clear(self):
+        self.packets.clear()
+        self.keyframes.clear()
+        self.nbytes = 0
+
+    def clear(self):
+        with self.lock:
+            self._clear()
+
+    def duration(self):
+        """Seconds of video currently buffered"""
+        with self.lock:
+            if len(self.packets) < 2:
+                return 0.0
+            return float((self.packets[-1][1] - self.packets[0][1]) * self.time_base)
+
+    def fps(self):
+        rate = self.stream.average_rate
+        if rate:
+            return float(rate)
+        duration = self.duration()
+        return (len(self.packets) - 1) / duration if duration > 0 else None
+
+    def frames(self):
+        """Decode the buffered packets; yields BGR frames"""
+        import av
+
+        with self.lock:
+            packets = list(self.packets)
+        source = self.stream.codec_context
+        decoder = av.CodecContext.create(source.name, 'r')
+        if source.extradata:
+            decoder.extradata = source.extradata
+        for packet in packets:
+            for frame in decoder.decode(av.Packet(packet[4])):
+                yield frame.to_ndarray(format='bgr24')
+        for frame in decoder.decode(None):
+            yield frame.to_ndarray(format='bgr24')
+
+    def clip(self, profile=None, focus=None):
+        """
+        Build an MP4 held in memory
+
+        Args:
+            profile: ClipProfile to re-encode to; None remuxes the source packets untouched
+            focus: Optional normalized region to keep in view when re-encoding
+
+        Returns:
+            bytes: MP4 data, or None if no keyframe has been buffered yet
+        """
+        if profile is not None:
+            return encode_clip(self.frames, self.fps(), profile, focus, self.duration())
+
+        import av
+
+        with self.lock:
+            packets = list(self.packets)
+        if not packets:
+            return None
+
+        output_file = io.BytesIO()
+        output = av.open(output_file, mode='w', format='mp4')
+        try:
+            out_stream = output.add_stream_from_template(self.stream)
+            start = packets[0][1]
+            for pts, dts, duration, is_keyframe, data in packets:
+                packet = av.Packet(data)
+                packet.pts = pts - start
+                packet.dts = dts - start
+                packet.duration = duration
+                packet.time_base = self.time_base
+                packet.is_keyframe = is_keyframe
+                packet.stream = out_stream
+                output.mux(packet)
+        finally:
+            output.close()
+        return output_file.getvalue()
+
+    def preview(self, profile, focus=None):
+        """Animated WebP preview (see clip_encoder.encode_preview)"""
+        return encode_preview(self.frames(), self.fps(), profile, focus)
+
+
+class JpegRingBuffer:
+    def __init__(self, seconds=3.0, max_frames=300, quality=80, size=None, codec='mpeg4'):
+        """
+        Ring of JPEG-compressed frames for captures without packet access (webcams, cv2 readers)
+
+        Args:
+            seconds: History to keep
+            max_frames: Hard cap on buffered frames
+            quality: JPEG quality (0-100)
+            size: Optional (width, height) frames are resized to once, before compression
+            codec: PyAV encoder for clips built without a profile
+        """
+        self.seconds = seconds
+        self.quality = int(quality)
+        self.size = tuple(size) if size else None
+        self.codec = codec
+        self.frames = deque(maxlen=max_frames)  # (monotonic time, JPEG bytes as np.ndarray)
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def append(self, frame):
+        """Compress and add a BGR frame"""
+        if self.size is not None and frame.shape[1::-1] != self.size:
+            frame = cv2.resize(frame, self.size)
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if len(self.frames) == self.frames.maxlen:
+                self.nbytes -= self.frames[0][1].nbytes
+            self.frames.append((now, encoded))
+            self.nbytes += encoded.nbytes
+            while self.frames and now - self.frames[0][0] > self.seconds:
+                self.nbytes -= self.frames.popleft()[1].nbytes
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.nbytes = 0
+
+    def entries(self):
+        """Snapshot of the buffered (time, JPEG) pairs, oldest first"""
+        with self.lock:
+            return list(self.frames)
+
+    def load(self, entries):
+        """Replace the buffered frames with (time, JPEG) pairs taken from entries()"""
+        with self.lock:
+            self.frames.clear()
+            self.frames.extend(entries)
+            self.nbytes = sum(encoded.nbytes for _, encoded in self.frames)
+
+    def duration(self):
+        """Seconds between the oldest and newest buffered frame"""
+        with self.lock:
+            return self.frames[-1][0] - self.frames[0][0] if len(self.frames) > 1 else 0.0
+
+    def fps(self):
+        """Rate frames were actually appended at"""
+        duration = self.duration()
+        return (len(self.frames) - 1) / duration if duration > 0 else None
+
+    def decoded(self):
+        """Decode the buffered JPEGs; yields BGR frames"""
+        with self.lock:
+            frames = list(self.frames)
+        for _, encoded in frames:
+            yield cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+    def clip(self, profile=None, focus=None):
+        """
+        Encode the buffered frames into an MP4 held in memory
+
+        Args:
+            profile: ClipProfile; None encodes every frame at full size with this buffer's codec
+            focus: Optional normalized region to keep in view
+
+        Returns:
+            bytes: MP4 data, or None if the buffer is empty
+        """
+        if profile is None:
+            profile = ClipProfile(codec=self.codec, bitrate=None, max_width=None, fps=None,
+                                  max_bytes=None, focus=False)
+        return encode_clip(self.decoded, self.fps(), profile, focus, self.duration())
+
+    def preview(self, profile, focus=None):
+        """Animated WebP preview (see clip_encoder.encode_preview)"""
+        return encode_preview(self.decoded(), self.fps(), profile, focus)
+
+
+class ProcessJpegBuffer:
+    def __init__(self, capture, seconds=3.0, codec='mpeg4'):
+        """
+        Clip source over the JpegRingBuffer a frame_bus.SharedFrameCapture process fills
+
+        The capture process compresses every frame it decodes; the JPEGs are only
+        sent over to this process when a clip or preview is built.
+
+        Args:
+            capture: SharedFrameCapture started with clip_seconds
+            seconds: History a clip covers
+            codec: PyAV encoder for clips built without a profile
+        """
+        self.capture = capture
+        self.seconds = seconds
+        self.codec = codec
+
+    def snapshot(self):
+        """Local JpegRingBuffer holding the capture process's current frames"""
+        buffer = JpegRingBuffer(self.seconds, max_frames=None, codec=self.codec)
+        buffer.load(self.capture.clip_entries())
+        return buffer
+
+    def duration(self):
+        return self.snapshot().duration()
+
+    def fps(self):
+        return self.snapshot().fps()
+
+    def clear(self):
+        pass
+
+    def clip(self, profile=None, focus=None):
+        """MP4 of the capture process's buffered frames (see JpegRingBuffer.clip)"""
+        return self.snapshot().clip(profile, focus)
+
+    def preview(self, profile, focus=None):
+        """Animated WebP preview (see clip_encoder.encode_preview)"""
+        return self.snapshot().preview(profile, focus)
+
+
+def clip_source(cap, fallback):
+    """The capture's own packet buffer if it keeps one, otherwise the JPEG fallback"""
+    return getattr(cap, 'clip_buffer', None) or fallback
@@ -0,0 +1,253 @@
+"""
+AniResQ ML Service - Alert Clip Encoding
+Encodes alert clips to a profile (codec, bitrate, resolution, frame rate and
+size cap) through PyAV, optionally cropped around the animal, plus small
+animated previews
+"""
+
+import functools
+import io
+import logging
+from fractions import Fraction
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# None = keep the source: remux stream packets (or encode buffered JPEGs as they are)
+CLIP_PROFILES = {
+    'source': None,
+    'low': {'codec': 'h264', 'bitrate': 250_000, 'max_width': 640, 'fps': 8, 'max_bytes': 750_000},
+    'standard': {'codec': 'h264', 'bitrate': 600_000, 'max_width': 960, 'fps': 12, 'max_bytes': 2_000_000},
+    'high': {'codec': 'h264', 'bitrate': 1_500_000, 'max_width': 1280, 'fps': 15, 'max_bytes': 5_000_000},
+}
+
+# Tried in order when the profile's codec has no encoder in this FFmpeg build
+FALLBACK_CODECS = ('libx264', 'libopenh264', 'mpeg4')
+
+
+class ClipProfile:
+    def __init__(self, codec='h264', bitrate=600_000, max_width=960, fps=12, max_bytes=2_000_000,
+                 focus=True, focus_min=0.5, focus_margin=0.25,
+                 preview=False, preview_width=320, preview_fps=4, preview_frames=12, preview_quality=50):
+        """
+        How alert clips are encoded
+
+        Args:
+            codec: Preferred encoder (falls back along FALLBACK_CODECS)
+            bitrate: Target bits per second (None = encoder default)
+            max_width: Output width cap in pixels; height keeps the aspect ratio (None = no cap)
+            fps: Output frame rate cap (None = source rate)
+            max_bytes: Size cap; the bitrate is lowered to fit (None = no cap)
+            focus: Crop to a window around the alert's boxes before scaling down
+            focus_min: Smallest crop window, as a fraction of the frame's width/height
+            focus_margin: Padding around the boxes, as a fraction of their size on each side
+            preview: Also produce an animated WebP preview
+            preview_width: Preview width in pixels
+            preview_fps: Preview frame rate
+            preview_frames: Maximum frames in the preview
+            preview_quality: WebP quality (0-100)
+        """
+        self.codec = codec
+        self.bitrate = bitrate
+        self.max_width = max_width
+        self.fps = fps
+        self.max_bytes = max_bytes
+        self.focus = focus
+        self.focus_min = focus_min
+        self.focus_margin = focus_margin
+        self.preview = preview
+        self.preview_width = preview_width
+        self.preview_fps = preview_fps
+        self.preview_frames = preview_frames
+        self.preview_quality = preview_quality
+
+    @classmethod
+    def named(cls, name, **overrides):
+        """Build a profile from CLIP_PROFILES; returns None for 'source' (no re-encode)"""
+        if name not in CLIP_PROFILES:
+            logger.warning(f"Unknown clip profile '{name}', using 'standard'")
+            name = 'standard'
+        settings = CLIP_PROFILES[name]
+        if settings is None:
+            return None
+        return cls(**{**settings, **overrides})
+
+
+@functools.lru_cache(maxsize=None)
+def pick_codec(preferred):
+    """First encoder available in this PyAV/FFmpeg build, starting with the preferred one"""
+    import av
+
+    for name in (preferred,) + FALLBACK_CODECS:
+        try:
+            av.codec.Codec(name, 'w')
+        except Exception:
+            continue
+        if name != preferred:
+            logger.warning(f"Encoder '{preferred}' not available, encoding clips with '{name}'")
+        return name
+    raise ValueError(f"No video encoder available (tried {preferred}, {', '.join(FALLBACK_CODECS)})")
+
+
+def focus_region(boxes, frame_shape):
+    """
+    Normalized (x1, y1, x2, y2) union of pixel boxes in a frame, or None without boxes
+
+    Args:
+        boxes: Iterable of (x1, y1, x2, y2) in pixels
+        frame_shape: Shape of the frame the boxes refer to
+    """
+    boxes = [tuple(map(float, box)) for box in boxes]
+    if not boxes:
+        return None
+    height, width = frame_shape[:2]
+    return (
+        max(0.0, min(box[0] for box in boxes) / width),
+        max(0.0, min(box[1] for box in boxes) / height),
+        min(1.0, max(box[2] for box in boxes) / width),
+        min(1.0, max(box[3] for box in boxes) / height),
+    )
+
+
+def focus_window(focus, width, height, min_fraction=0.5, margin=0.25):
+    """
+    Pixel crop (x1, y1, x2, y2) around a normalized region, with the frame's aspect ratio
+
+    The window is the padded region, grown to at least min_fraction of the frame so
+    the animal keeps some surroundings, and shifted to stay inside the frame.
+    """
+    x1, y1, x2, y2 = focus
+    scale = max(min_fraction, (x2 - x1) * (1 + 2 * margin), (y2 - y1) * (1 + 2 * margin))
+    if scale >= 1.0:
+        return 0, 0, width, height
+    crop_width, crop_height = scale * width, scale * height
+    left = min(max(0.0, (x1 + x2) / 2 * width - crop_width / 2), width - crop_width)
+    top = min(max(0.0, (y1 + y2) / 2 * height - crop_height / 2), height - crop_height)
+    return int(left), int(top), int(left + crop_width), int(top + crop_height)
+
+
+def _output_size(width, height, max_width, even=True):
+    if max_width and width > max_width:
+        height = height * max_width / width
+        width = max_width
+    if even:
+        return max(2, int(width) // 2 * 2), max(2, int(height) // 2 * 2)
+    return max(1, int(width)), max(1, int(height))
+
+
+def _prepared_frames(frames, source_fps, fps, focus, profile, max_width, even=True):
+    """Subsample to fps, crop to the focus window and scale down; yields BGR frames of one size"""
+    step = source_fps / fps if source_fps and fps and fps < source_fps else 1.0
+    next_pick = 0.0
+    crop = size = shape = None
+    for index, frame in enumerate(frames):
+        if index < next_pick:
+            continue
+        next_pick += step
+
+        if shape is None:
+            shape = frame.shape[:2]
+            height, width = shape
+            if focus is not None and profile.focus:
+                crop = focus_window(focus, width, height, profile.focus_min, profile.focus_margin)
+            else:
+                crop = (0, 0, width, height)
+            size = _output_size(crop[2] - crop[0], crop[3] - crop[1], max_width, even)
+        elif frame.shape[:2] != shape:
+            # Resolution changed mid-clip (reconnect): map it onto the first frame's geometry
+            frame = cv2.resize(frame, (shape[1], shape[0]))
+
+        x1, y1, x2, y2 = crop
+        yield cv2.resize(frame[y1:y2, x1:x2], size, interpolation=cv2.INTER_AREA)
+
+
+def _encode(frames, source_fps, profile, focus, codec, bitrate):
+    import av
+
+    fps = min(profile.fps, source_fps) if profile.fps and source_fps else (profile.fps or source_fps or 10.0)
+    output_file = io.BytesIO()
+    output = av.open(output_file, mode='w', format='mp4')
+    stream = None
+    try:
+        for image in _prepared_frames(frames, source_fps, fps, focus, profile, profile.max_width):
+            if stream is None:
+                stream = output.add_stream(codec, rate=Fraction(fps).limit_denominator(1000))
+                stream.height, stream.width = image.shape[:2]
+                stream.pix_fmt = 'yuv420p'
+                if bitrate:
+                    stream.bit_rate = int(bitrate)
+                if codec == 'libx264':
+                    stream.options = {'preset': 'veryfast'}
+            output.mux(stream.encode(av.VideoFrame.from_ndarray(image, format='bgr24')))
+        if stream is not None:
+            output.mux(stream.encode())
+    finally:
+        output.close()
+    return output_file.getvalue() if stream is not None else None
+
+
+def encode_clip(frames_fn, source_fps, profile, focus=None, duration=None, max_attempts=3):
+    """
+    Encode frames into an MP4 held in memory, within the profile's size cap
+
+    Args:
+        frames_fn: Callable returning an iterable of BGR frames; called again for each retry
+        source_fps: Rate the frames were captured at (None if unknown)
+        profile: ClipProfile
+        focus: Optional normalized (x1, y1, x2, y2) region to keep in view (see focus_region)
+        duration: Clip length in seconds, used to fit the bitrate to max_bytes up front
+        max_attempts: Encodes tried before returning an oversized clip
+
+    Returns:
+        bytes: MP4 data, or None if there were no frames
+    """
+    codec = pick_codec(profile.codec)
+    bitrate = profile.bitrate
+    if bitrate and profile.max_bytes and duration:
+        # Leave ~10% for container overhead and rate-control overshoot
+        bitrate = min(bitrate, int(profile.max_bytes * 8 * 0.9 / duration))
+
+    data = None
+    for attempt in range(max_attempts):
+        data = _encode(frames_fn(), source_fps, profile, focus, codec, bitrate)
+        if data is None or not profile.max_bytes or len(data) <= profile.max_bytes:
+            return data
+        # Overshot the cap: scale the bitrate down by the overshoot, with headroom
+        bitrate = int((bitrate or len(data) * 8 / (duration or 1)) * profile.max_bytes / len(data) * 0.85)
+        logger.debug(f"Clip of {len(data)} bytes exceeds {profile.max_bytes}, retrying at {bitrate} bps")
+
+    logger.warning(f"Clip still {len(data)} bytes after {max_attempts} attempts (cap {profile.max_bytes})")
+    return data
+
+
+def encode_preview(frames, source_fps, profile, focus=None):
+    """
+    Animated WebP preview of a clip
+
+    Returns:
+        bytes: WebP data, or None if there were no frames
+    """
+    from PIL import Image
+
+    images = []
+    prepared = _prepared_frames(frames, source_fps, profile.preview_fps, focus, profile,
+                                profile.preview_width, even=False)
+    for image in prepared:
+        images.append(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+        if len(images) >= profile.preview_frames:
+            break
+    if not images:
+        return None
+
+    output_file = io.BytesIO()
+    images[0].save(
+        output_file,
+        format='WEBP',
+        save_all=True,
+        append_images=images[1:],
+        duration=int(1000 / profile.preview_fps),
+        loop=0,
+        quality=profile.preview_quality
+    )
+    return output_file.getvalue()
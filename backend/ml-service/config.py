@@ -3,6 +3,7 @@ Configuration for ML Service
 """
 
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,11 +18,35 @@ BACKEND_API_KEY = os.getenv('BACKEND_API_KEY', '')
 
 # CCTV Stream Configuration
 CCTV_STREAM_URLS = os.getenv('CCTV_STREAM_URLS', '').split(',')
-CCTV_FPS = int(os.getenv('CCTV_FPS', 1))  # Frames per second to process
-STREAM_TIMEOUT = int(os.getenv('STREAM_TIMEOUT', 30))  # Seconds to wait before reconnecting
+CCTV_FPS = float(os.getenv('CCTV_FPS', 1))  # Frames per second to process while a camera is idle
+ACTIVE_CCTV_FPS = float(os.getenv('ACTIVE_CCTV_FPS', 5))  # Frames per second while an animal is tracked
+ACTIVE_HOLD_SECONDS = float(os.getenv('ACTIVE_HOLD_SECONDS', 10))  # Seconds a camera stays active after a detection
+INFERENCE_FPS_BUDGET = float(os.getenv('INFERENCE_FPS_BUDGET', 0))  # Node-wide inferences per second (0 = unlimited)
+STREAM_TIMEOUT = int(os.getenv('STREAM_TIMEOUT', 30))  # Seconds a read may hang before the stream is reconnected
+CAMERA_CONFIG_FILE = os.getenv('CAMERA_CONFIG_FILE', '')  # JSON file with per-camera overrides
+CAPTURE_MODE = os.getenv('CAPTURE_MODE', 'sequential')  # 'sequential', 'latest' (threaded, newest frame only), 'keyframe' (PyAV) or 'shared' (capture process)
+KEYFRAME_QUIET_PERIOD = float(os.getenv('KEYFRAME_QUIET_PERIOD', 10))  # Seconds without activity before keyframe-only decode resumes
 
 # Alert Configuration
-DUPLICATE_ALERT_THRESHOLD = int(os.getenv('DUPLICATE_ALERT_THRESHOLD', 30))  # Seconds between alerts
+DUPLICATE_ALERT_THRESHOLD = int(os.getenv('DUPLICATE_ALERT_THRESHOLD', 30))  # Seconds between alerts for the same class and location
+ALERT_CELL_SIZE = float(os.getenv('ALERT_CELL_SIZE', 0.25))  # Dedup grid cell as a fraction of the frame (0.25 = 4x4)
+ALERT_QUEUE_SIZE = int(os.getenv('ALERT_QUEUE_SIZE', 100))  # Alerts waiting in memory before spooling to disk
+ALERT_MAX_ATTEMPTS = int(os.getenv('ALERT_MAX_ATTEMPTS', 3))  # Delivery attempts before an alert is spooled
+ALERT_SPOOL_PATH = os.getenv('ALERT_SPOOL_PATH', 'alert_spool.db')  # SQLite spool for undelivered alerts
+ALERT_SPOOL_DIR = os.getenv('ALERT_SPOOL_DIR', 'alert_spool')  # Clips belonging to spooled alerts
+CLIP_SECONDS = float(os.getenv('CLIP_SECONDS', 3))  # Pre-event history kept per camera for alert clips
+CLIP_POST_ROLL = float(os.getenv('CLIP_POST_ROLL', 2))  # Seconds recorded after an alert before its clip is built
+CLIP_JPEG_QUALITY = int(os.getenv('CLIP_JPEG_QUALITY', 80))  # Quality of buffered frames when the capture has no packet buffer
+SHARED_RING_MB = int(os.getenv('SHARED_RING_MB', 128))  # Memory cap per camera for the shared-mode decode ring
+CLIP_PROFILE = os.getenv('CLIP_PROFILE', 'standard')  # 'low', 'standard', 'high' or 'source' (no re-encode); see clip_encoder.py
+CLIP_PREVIEW = os.getenv('CLIP_PREVIEW', 'False').lower() == 'true'  # Also attach an animated WebP preview
+
+# Media Upload Configuration
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'cloudinary')  # 'cloudinary' or 'local:<dir>' (offline stand-in)
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 4))  # Concurrent uploads
+UPLOAD_INDEX_PATH = os.getenv('UPLOAD_INDEX_PATH', 'upload_index.json')  # Hashes of uploaded media, to skip re-uploads (empty = off)
+UPLOAD_CHUNK_THRESHOLD_MB = float(os.getenv('UPLOAD_CHUNK_THRESHOLD_MB', 20))  # Files at least this large are uploaded in resumable chunks
+UPLOAD_CHUNK_SIZE_MB = float(os.getenv('UPLOAD_CHUNK_SIZE_MB', 6))  # Chunk size (Cloudinary requires >= 5 MB)
 
 # Logging Configuration
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -31,3 +56,39 @@ LOG_FILE = os.getenv('LOG_FILE', 'ml_service.log')
 FRAME_HEIGHT = int(os.getenv('FRAME_HEIGHT', 480))
 FRAME_WIDTH = int(os.getenv('FRAME_WIDTH', 640))
 USE_GPU = os.getenv('USE_GPU', 'False').lower() == 'true'
+
+# Motion Gate Configuration (defaults; override per camera in CAMERA_CONFIG_FILE)
+MOTION_GATE = os.getenv('MOTION_GATE', 'False').lower() == 'true'  # Skip YOLO while the scene is static
+MOTION_THRESHOLD = float(os.getenv('MOTION_THRESHOLD', 0.01))  # Fraction of changed pixels that counts as motion
+MOTION_FORCE_INTERVAL = float(os.getenv('MOTION_FORCE_INTERVAL', 60))  # Seconds between forced inferences
+MOTION_METHOD = os.getenv('MOTION_METHOD', 'diff')  # 'diff' (frame differencing) or 'mog2' (background subtraction)
+
+# Batched Inference Configuration
+INFERENCE_BATCH_SIZE = int(os.getenv('INFERENCE_BATCH_SIZE', 1))  # Frames per model call across cameras (1 = off)
+INFERENCE_BATCH_WAIT_MS = int(os.getenv('INFERENCE_BATCH_WAIT_MS', 20))  # Max wait for a batch to fill
+INFERENCE_AGING_MS = int(os.getenv('INFERENCE_AGING_MS', 250))  # Queue wait worth one priority class (prevents starvation)
+
+# CPU Resource Configuration
+CPU_PROFILE = os.getenv('CPU_PROFILE', 'balanced')  # 'balanced', 'inference', 'capture' or 'none' (library defaults)
+CPU_PINNING = os.getenv('CPU_PINNING', 'false').lower() == 'true'  # Pin inference/decode work to its share of cores
+
+# Tiled Inference Configuration (default; override per camera with "tiled" in CAMERA_CONFIG_FILE)
+TILED_INFERENCE = os.getenv('TILED_INFERENCE', 'False').lower() == 'true'  # Detect on native-resolution tiles
+TILE_SIZE = int(os.getenv('TILE_SIZE', 640))  # Tile edge in native pixels
+TILE_OVERLAP = float(os.getenv('TILE_OVERLAP', 0.2))  # Fraction of a tile shared with its neighbour
+TILE_MIN_MOTION = float(os.getenv('TILE_MIN_MOTION', 0.002))  # Changed-pixel fraction a tile needs to be inferred (0 = all)
+
+# Sharding Configuration (spread cameras over several ML nodes)
+SHARD_ROLE = os.getenv('SHARD_ROLE', '')  # '' (off), 'coordinator', 'worker' or 'both'
+SHARD_STORE = os.getenv('SHARD_STORE', 'memory')  # 'memory' (single process) or 'file:<path>' (shared JSON file)
+NODE_ID = os.getenv('NODE_ID') or socket.gethostname()  # Unique name of this node (defaults to the hostname)
+SHARD_INTERVAL = float(os.getenv('SHARD_INTERVAL', 5))  # Seconds between heartbeats and rebalances
+SHARD_NODE_TTL = float(os.getenv('SHARD_NODE_TTL', 30))  # Seconds without a heartbeat before a node is dropped
+SHARD_SATURATION = float(os.getenv('SHARD_SATURATION', 0.9))  # Model utilization above which a node sheds cameras
+
+# Cascade Configuration
+GATE_MODEL_PATH = os.getenv('GATE_MODEL_PATH', '')  # Small screening model run before MODEL_PATH (empty = off)
+GATE_IMGSZ = int(os.getenv('GATE_IMGSZ', 320))  # Inference size for the gate model
+GATE_CONFIDENCE = float(os.getenv('GATE_CONFIDENCE', 0.15))  # Gate threshold; low so candidates aren't missed
+GATE_CLASSES = [c for c in os.getenv('GATE_CLASSES', '').split(',') if c.strip()]  # Gate classes that pass a frame (empty = any)
+GATE_CROP = os.getenv('GATE_CROP', 'True').lower() == 'true'  # Run the main model on the candidate region only
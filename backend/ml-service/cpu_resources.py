@@ -0,0 +1,243 @@
+"""
+AniResQ ML Service - CPU Resource Manager
+Splits the host's cores between inference, decode and encode so torch,
+OpenCV and capture workers stop oversubscribing the machine
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+ROLES = ('inference', 'decode', 'encode')
+
+# Share of the usable cores per role, plus torch inter-op threads
+CPU_PROFILES = {
+    'balanced': {'inference': 0.5, 'decode': 0.3, 'encode': 0.2, 'interop': 1},
+    'inference': {'inference': 0.7, 'decode': 0.2, 'encode': 0.1, 'interop': 1},
+    'capture': {'inference': 0.4, 'decode': 0.45, 'encode': 0.15, 'interop': 1},
+}
+
+
+def available_cpus():
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ResourceManager:
+    def __init__(self, profile='balanced', cpus=None, pin=False):
+        """
+        Partition cores between inference, decode and encode work
+
+        Args:
+            profile: Name in CPU_PROFILES, or 'none' to leave every library at its defaults
+            cpus: CPUs to partition (default: all CPUs available to the process)
+            pin: Also restrict threads/processes to their role's cores (CPU affinity)
+        """
+        self.profile = profile if profile in CPU_PROFILES else 'none'
+        if profile not in CPU_PROFILES and profile != 'none':
+            logger.warning(f"Unknown CPU profile '{profile}', leaving thread pools unmanaged")
+        self.cpus = list(cpus) if cpus else available_cpus()
+        self.pin_enabled = pin and self.profile != 'none'
+        self.plan = self._split()
+
+    def _split(self):
+        cpus = self.cpus
+        if self.profile == 'none' or len(cpus) < len(ROLES):
+            # Too few cores to partition: every role shares all of them
+            return {role: list(cpus) for role in ROLES}
+
+        shares = CPU_PROFILES[self.profile]
+        counts = {role: max(1, int(shares[role] * len(cpus))) for role in ROLES}
+        counts['inference'] += len(cpus) - sum(counts.values())
+
+        plan = {}
+        start = 0
+        for role in ROLES:
+            plan[role] = cpus[start:start + counts[role]]
+            start += counts[role]
+        return plan
+
+    def threads(self, role):
+        """Number of worker threads a role should use"""
+        return max(1, len(self.plan[role]))
+
+    def apply(self):
+        """Size the torch and OpenCV thread pools; call before the model runs its first inference"""
+        if self.profile == 'none':
+            return
+
+        import cv2
+        import torch
+
+        torch.set_num_threads(self.threads('inference'))
+        try:
+            torch.set_num_interop_threads(CPU_PROFILES[self.profile]['interop'])
+        except RuntimeError:
+            # Only settable before the first inter-op parallel work in this process
+            logger.debug("torch inter-op threads already initialized")
+        # OpenCV's pool serves resize/convert/decode work on the capture side
+        cv2.setNumThreads(self.threads('decode'))
+
+        logger.info(f"CPU profile '{self.profile}': inference {self.plan['inference']}, "
+                    f"decode {self.plan['decode']}, encode {self.plan['encode']}"
+                    f"{' (pinned)' if self.pin_enabled else ''}")
+
+    def pin_thread(self, role):
+        """
+        Restrict the calling thread to a role's cores (Linux only)
+
+        Threads the caller starts afterwards, such as torch's pool when pinned
+        before the first inference, inherit the mask.
+        """
+        if not self.pin_enabled or not hasattr(os, 'sched_setaffinity'):
+            return False
+        try:
+            os.sched_setaffinity(0, self.plan[role])
+            return True
+        except OSError as e:
+            logger.warning(f"Could not pin {role} thread: {e}")
+            return False
+
+    def pin_process(self, pid, role):
+        """Restrict another process (e.g. a capture process) to a role's cores"""
+        if not self.pin_enabled:
+            return False
+        try:
+            import psutil
+        except ImportError:
+            psutil = None
+        # A failed pin must never fail the caller (e.g. a stream connect): log and carry on
+        try:
+            if psutil is not None:
+                psutil.Process(pid).cpu_affinity(self.plan[role])
+                return True
+            if hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(pid, self.plan[role])
+                return True
+        except Exception as e:
+            logger.warning(f"Could not pin process {pid} to {role} cores: {e}")
+        return False
+
+
+class LatencyTracker:
+    def __init__(self, window=500):
+        """
+        Rolling per-frame latency statistics
+
+        Args:
+            window: Number of recent samples kept
+        """
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def summary(self):
+        """
+        Returns:
+            dict: count, mean/p50/p95/p99 in ms and jitter (standard deviation, ms); empty without samples
+        """
+        with self.lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return {}
+
+        def percentile(fraction):
+            return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+        return {
+            'count': len(samples),
+            'mean_ms': round(statistics.fmean(samples) * 1000, 1),
+            'p50_ms': round(percentile(0.5), 1),
+            'p95_ms': round(percentile(0.95), 1),
+            'p99_ms': round(percentile(0.99), 1),
+            'jitter_ms': round(statistics.pstdev(samples) * 1000, 1),
+        }
+
+
+def benchmark(model_path, profile, cameras=4, duration=30.0, pin=False):
+    """
+    Run simulated cameras the way MLService does and measure inference latency jitter
+
+    One decode thread per camera (pinned to 'decode') decodes and resizes frames
+    into a shared queue; a single inference thread (pinned to 'inference') runs
+    the model on them.
+
+    Returns:
+        dict: LatencyTracker summary of per-frame inference latency
+    """
+    import queue
+
+    import cv2
+    import numpy as np
+    from ultralytics import YOLO
+
+    resources = ResourceManager(profile, pin=pin)
+    resources.apply()
+    model = YOLO(model_path)
+    tracker = LatencyTracker(window=100000)
+    stop_event = threading.Event()
+    frames = queue.Queue(maxsize=cameras * 2)
+    # Encoded frames stand in for a stream, so every camera pays for decoding too
+    _, encoded = cv2.imencode('.jpg', np.random.randint(0, 255, (1080, 1920, 3), dtype=np.uint8))
+
+    def camera():
+        resources.pin_thread('decode')
+        while not stop_event.is_set():
+            frame = cv2.resize(cv2.imdecode(encoded, cv2.IMREAD_COLOR), (640, 480))
+            try:
+                frames.put(frame, timeout=0.5)
+            except queue.Full:
+                continue
+
+    def inference():
+        resources.pin_thread('inference')
+        model(np.zeros((480, 640, 3), dtype=np.uint8), verbose=False)  # warmup on the pinned thread
+        while not stop_event.is_set():
+            try:
+                frame = frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            started = time.perf_counter()
+            model(frame, verbose=False)
+            tracker.record(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=inference, daemon=True)]
+    threads += [threading.Thread(target=camera, daemon=True) for _ in range(cameras)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+    return tracker.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure inference latency jitter under a CPU profile")
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--profile', default='balanced', help="CPU profile, or 'none' for library defaults")
+    parser.add_argument('--cameras', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--pin', action='store_true', help="Pin threads to their role's cores")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    stats = benchmark(args.model, args.profile, args.cameras, args.duration, args.pin)
+    print(f"profile={args.profile} cameras={args.cameras} pin={args.pin}")
+    for key, value in stats.items():
+        print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+AniResQ ML Service - Compact Detection Results
+Boxes, scores and class IDs held in NumPy arrays, converted to dicts only for JSON
+"""
+
+import numpy as np
+
+_EMPTY_BOXES = np.empty((0, 4), dtype=np.float32)
+
+
+class DetectionResult:
+    __slots__ = ('boxes', 'scores', 'class_ids', 'track_ids', 'names', 'error')
+
+    def __init__(self, boxes=None, scores=None, class_ids=None, track_ids=None, names=None, error=None):
+        """
+        Detections for one frame, detached from the model's Results object
+
+        Args:
+            boxes: (N, 4) array of x_min, y_min, x_max, y_max in frame pixels
+            scores: (N,) array of confidences
+            class_ids: (N,) array of class indices
+            track_ids: Optional (N,) array of tracker IDs (-1 when untracked)
+            names: Class index -> name mapping (shared with the model, not copied)
+            error: Error message if inference failed
+        """
+        self.boxes = _EMPTY_BOXES if boxes is None else np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        count = len(self.boxes)
+        self.scores = np.zeros(0, np.float32) if scores is None else np.asarray(scores, dtype=np.float32).reshape(count)
+        self.class_ids = np.zeros(0, np.int32) if class_ids is None else np.asarray(class_ids, dtype=np.int32).reshape(count)
+        if track_ids is None:
+            self.track_ids = np.full(count, -1, dtype=np.int32)
+        else:
+            self.track_ids = np.asarray(track_ids, dtype=np.int32).reshape(count)
+        self.names = names or {}
+        self.error = error
+
+    @classmethod
+    def from_ultralytics(cls, result, names=None):
+        """
+        Copy the boxes out of an ultralytics Results object
+
+        The returned object holds no reference to the Results, its image or its
+        tensors, so those are freed as soon as the caller drops them.
+        """
+        names = names if names is not None else result.names
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return cls(names=names)
+
+        # Single device->host transfer; columns are x1, y1, x2, y2, [track_id,] conf, cls
+        data = boxes.data.cpu().numpy()
+        track_ids = data[:, 4] if data.shape[1] == 7 else None
+        return cls(
+            boxes=data[:, :4],
+            scores=data[:, -2],
+            class_ids=data[:, -1],
+            track_ids=track_ids,
+            names=names
+        )
+
+    @classmethod
+    def empty(cls, names=None, error=None):
+        return cls(names=names, error=error)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def class_names(self):
+        return [self.names.get(c, str(c)) for c in self.class_ids.tolist()]
+
+    def select(self, mask):
+        """Return a new result holding only the rows picked by a boolean mask or index array"""
+        return DetectionResult(
+            boxes=self.boxes[mask],
+            scores=self.scores[mask],
+            class_ids=self.class_ids[mask],
+            track_ids=self.track_ids[mask],
+            names=self.names,
+            error=self.error
+        )
+
+    def offset(self, dx, dy):
+        """Return a copy with boxes shifted by (dx, dy), e.g. from crop to frame coordinates"""
+        if not dx and not dy:
+            return self
+        return DetectionResult(
+            boxes=self.boxes + np.array([dx, dy, dx, dy], dtype=np.float32),
+            scores=self.scores,
+            class_ids=self.class_ids,
+            track_ids=self.track_ids,
+            names=self.names,
+            error=self.error
+        )
+
+    def class_mask(self, class_names):
+        """Boolean mask of rows whose class name (case-insensitive) is in class_names"""
+        wanted = {str(name).lower() for name in class_names}
+        return np.array([name.lower() in wanted for name in self.class_names()], dtype=bool).reshape(len(self))
+
+    def exclude_classes(self, class_names):
+        return self.select(~self.class_mask(class_names))
+
+    def keep_classes(self, class_names):
+        return self.select(self.class_mask(class_names))
+
+    def to_dicts(self, **extra):
+        """
+        Convert to the detection dicts used in API payloads
+
+        Args:
+            **extra: Fields prepended to every dict (e.g. frame=12)
+
+        Returns:
+            list: [{'class_id', 'class_name', 'confidence', 'bbox': {...}}, ...]
+        """
+        detections = []
+        for (x_min, y_min, x_max, y_max), score, class_id, class_name in zip(
+                self.boxes.tolist(), self.scores.tolist(), self.class_ids.tolist(), self.class_names()):
+            detections.append({
+                **extra,
+                'class_id': class_id,
+                'class_name': class_name,
+                'confidence': score,
+                'bbox': {
+                    'x_min': x_min,
+                    'y_min': y_min,
+                    'x_max': x_max,
+                    'y_max': y_max
+                }
+            })
+        return detections
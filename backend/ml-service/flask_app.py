@@ -5,16 +5,14 @@ Provides REST endpoints for animal detection using YOLOv8
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import cv2
-import numpy as np
 import logging
 import os
-from ultralytics import YOLO
 from dotenv import load_dotenv
 from datetime import datetime
 import base64
 import io
-from PIL import Image
+
+from model_loader import ModelLoader, parse_image_sizes
 
 # Load environment variables
 load_dotenv()
@@ -30,33 +28,51 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global model instance
-model = None
+# Model is loaded and warmed up once, in the background, when the server starts (create_app);
+# cv2/numpy/torch are only imported where they are used so importing this module stays cheap
+loader = ModelLoader(
+    os.getenv('MODEL_PATH', './models/best (3).pt'),
+    image_sizes=parse_image_sizes(os.getenv('WARMUP_IMAGE_SIZES', '640')),
+    warmup_runs=int(os.getenv('WARMUP_RUNS', 1))
+)
 
-def load_model():
-    """Load YOLOv8 model"""
-    global model
-    try:
-        model_path = os.getenv('MODEL_PATH', './models/best (3).pt')
-        logger.info(f"🔄 Loading YOLOv8 model from: {model_path}")
-        model = YOLO(model_path)
-        logger.info("✅ Model loaded successfully!")
-        return model
-    except Exception as e:
-        logger.error(f"❌ Failed to load model: {e}")
-        raise
+# Endpoints that work before the model is ready
+MODEL_FREE_ENDPOINTS = {'health_check', 'readiness_check', 'model_info', 'static'}
+
+def parse_detections(results, **extra):
+    """Convert model results for one frame into JSON-ready detection dicts"""
+    from detection_result import DetectionResult
+
+    if not results:
+        return []
+    return DetectionResult.from_ultralytics(results[0], loader.model.names).to_dicts(**extra)
+
+def decode_image(image_bytes):
+    """Decode uploaded image bytes (any PIL format) into a BGR frame"""
+    import cv2
+    import numpy as np
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
 
 @app.before_request
-def initialize_model():
-    """Initialize model on first request"""
-    global model
-    if model is None:
-        load_model()
+def require_model():
+    """Answer 503 instead of blocking while the model is still loading"""
+    if request.endpoint in MODEL_FREE_ENDPOINTS or loader.ready():
+        return None
+    status = loader.status()
+    return jsonify({'error': f"Model not ready ({status['state']})", **status}), 503, {'Retry-After': '5'}
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({'status': 'ok', 'service': 'AniResQ ML Service'}), 200
+    """Liveness check: the process is up (see /ready for the model)"""
+    return jsonify({'status': 'ok', 'service': 'AniResQ ML Service', 'model': loader.state}), 200
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness check: 200 once the model is loaded and warmed up, with load/warmup timings"""
+    return jsonify(loader.status()), 200 if loader.ready() else 503
 
 @app.route('/api/detect/image', methods=['POST'])
 def detect_image():
@@ -70,17 +86,13 @@ def detect_image():
         # Handle image from file upload
         if 'image' in request.files:
             file = request.files['image']
-            image_bytes = file.read()
-            image = Image.open(io.BytesIO(image_bytes))
-            frame = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+            frame = decode_image(file.read())
             logger.info(f"✓ Image uploaded: {file.filename}")
 
         # Handle image from base64
         elif 'base64' in request.json:
             base64_data = request.json.get('base64')
-            image_bytes = base64.b64decode(base64_data.split(',')[1] if ',' in base64_data else base64_data)
-            image = Image.open(io.BytesIO(image_bytes))
-            frame = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+            frame = decode_image(base64.b64decode(base64_data.split(',')[1] if ',' in base64_data else base64_data))
             logger.info("✓ Base64 image decoded")
         else:
             logger.error("❌ No image data provided")
@@ -88,24 +100,11 @@ def detect_image():
 
         # Run detection
         confidence_threshold = float(request.json.get('confidence', 0.5)) if request.json else 0.5
-        results = model(frame, conf=confidence_threshold)
-
-        detections = []
-        if results and results[0].boxes:
-            for box in results[0].boxes:
-                detection = {
-                    'class_id': int(box.cls[0]),
-                    'class_name': model.names[int(box.cls[0])],
-                    'confidence': float(box.conf[0]),
-                    'bbox': {
-                        'x_min': float(box.xyxy[0][0]),
-                        'y_min': float(box.xyxy[0][1]),
-                        'x_max': float(box.xyxy[0][2]),
-                        'y_max': float(box.xyxy[0][3])
-                    }
-                }
-                detections.append(detection)
-                logger.info(f"🐾 Detected: {detection['class_name']} ({detection['confidence']:.2%})")
+        results = loader.model(frame, conf=confidence_threshold)
+
+        detections = parse_detections(results)
+        for detection in detections:
+            logger.info(f"🐾 Detected: {detection['class_name']} ({detection['confidence']:.2%})")
 
         logger.info(f"✅ Detection complete: Found {len(detections)} animal(s)")
 
@@ -124,8 +123,13 @@ def detect_image():
 def detect_frame():
     """
     Detect animals in a video frame
-    Expects: base64 encoded frame
+    Expects: base64 encoded frame, optional 'roi' polygon(s) in normalized [x, y] points
     """
+    import cv2
+    import numpy as np
+    from detection_result import DetectionResult
+    from roi_zones import CameraZones
+
     try:
         logger.info("🎬 Processing frame detection request...")
 
@@ -146,25 +150,19 @@ def detect_frame():
             logger.error("❌ Failed to decode frame")
             return jsonify({'error': 'Failed to decode frame'}), 400
 
-        # Run detection
-        results = model(frame, conf=confidence_threshold)
-
-        detections = []
-        if results and results[0].boxes:
-            for box in results[0].boxes:
-                detection = {
-                    'class_id': int(box.cls[0]),
-                    'class_name': model.names[int(box.cls[0])],
-                    'confidence': float(box.conf[0]),
-                    'bbox': {
-                        'x_min': float(box.xyxy[0][0]),
-                        'y_min': float(box.xyxy[0][1]),
-                        'x_max': float(box.xyxy[0][2]),
-                        'y_max': float(box.xyxy[0][3])
-                    }
-                }
-                detections.append(detection)
-                logger.info(f"🐾 Detected: {detection['class_name']} ({detection['confidence']:.2%})")
+        # Run detection, only on the region of interest if one was given
+        zones = CameraZones(roi=data['roi']) if data.get('roi') else None
+        model_input, (x_offset, y_offset) = zones.crop(frame) if zones is not None else (frame, (0, 0))
+        results = loader.model(model_input, conf=confidence_threshold)
+
+        result = DetectionResult.from_ultralytics(results[0], loader.model.names).offset(x_offset, y_offset)
+        del results
+        if zones is not None:
+            result = result.select(zones.alert_mask(result, frame.shape))
+
+        detections = result.to_dicts()
+        for detection in detections:
+            logger.info(f"🐾 Detected: {detection['class_name']} ({detection['confidence']:.2%})")
 
         logger.info(f"✅ Frame processing complete: Found {len(detections)} animal(s)")
 
@@ -185,6 +183,8 @@ def detect_video():
     Detect animals in a video file
     Expects: video file upload or video path
     """
+    import cv2
+
     try:
         logger.info("🎥 Processing video detection request...")
 
@@ -231,25 +231,10 @@ def detect_video():
                 processed_frames += 1
 
                 # Run detection
-                results = model(frame, conf=confidence_threshold)
-
-                detections_in_frame = []
-                if results and results[0].boxes:
-                    for box in results[0].boxes:
-                        detection = {
-                            'frame': frame_count,
-                            'class_id': int(box.cls[0]),
-                            'class_name': model.names[int(box.cls[0])],
-                            'confidence': float(box.conf[0]),
-                            'bbox': {
-                                'x_min': float(box.xyxy[0][0]),
-                                'y_min': float(box.xyxy[0][1]),
-                                'x_max': float(box.xyxy[0][2]),
-                                'y_max': float(box.xyxy[0][3])
-                            }
-                        }
-                        detections_in_frame.append(detection)
-                        all_detections.append(detection)
+                results = loader.model(frame, conf=confidence_threshold)
+
+                detections_in_frame = parse_detections(results, frame=frame_count)
+                all_detections.extend(detections_in_frame)
 
                 if detections_in_frame:
                     logger.info(f"[Frame {frame_count}] 🐾 Found {len(detections_in_frame)} animal(s)")
@@ -275,6 +260,8 @@ def detect_camera():
     Process camera stream in real-time
     Expects: duration_seconds and sample_interval_ms
     """
+    import cv2
+
     try:
         logger.info("📹 Starting camera detection...")
 
@@ -308,25 +295,10 @@ def detect_camera():
 
             # Run detection
             try:
-                results = model(frame, conf=confidence_threshold)
-
-                detections_in_frame = []
-                if results and results[0].boxes:
-                    for box in results[0].boxes:
-                        detection = {
-                            'frame': frame_count,
-                            'class_id': int(box.cls[0]),
-                            'class_name': model.names[int(box.cls[0])],
-                            'confidence': float(box.conf[0]),
-                            'bbox': {
-                                'x_min': float(box.xyxy[0][0]),
-                                'y_min': float(box.xyxy[0][1]),
-                                'x_max': float(box.xyxy[0][2]),
-                                'y_max': float(box.xyxy[0][3])
-                            }
-                        }
-                        detections_in_frame.append(detection)
-                        all_detections.append(detection)
+                results = loader.model(frame, conf=confidence_threshold)
+
+                detections_in_frame = parse_detections(results, frame=frame_count)
+                all_detections.extend(detections_in_frame)
 
                 if detections_in_frame:
                     logger.info(f"🚨 [Frame {frame_count}] ALERT: {len(detections_in_frame)} animal(s) detected!")
@@ -364,9 +336,10 @@ def model_info():
     try:
         info = {
             'model_name': 'YOLOv8',
-            'model_path': os.getenv('MODEL_PATH', './models/best (3).pt'),
-            'classes': model.names if model else {},
-            'total_classes': len(model.names) if model else 0,
+            'model_path': loader.model_path,
+            'classes': loader.model.names if loader.model else {},
+            'total_classes': len(loader.model.names) if loader.model else 0,
+            'state': loader.state,
         }
         logger.info("ℹ️ Model info requested")
         return jsonify(info), 200
@@ -374,14 +347,20 @@ def model_info():
         logger.error(f"❌ Error getting model info: {e}")
         return jsonify({'error': str(e)}), 500
 
-# Initialize model on startup
-@app.before_first_request
-def startup():
-    """Initialize on first request"""
-    load_model()
+def create_app():
+    """
+    Start loading the model and return the app
+
+    Call this in the serving process (e.g. gunicorn 'flask_app:create_app()'),
+    not at import time, so tools importing this module do not load the model.
+
+    Returns:
+        Flask: The application
+    """
+    loader.start()
+    return app
 
 if __name__ == '__main__':
     logger.info("🚀 AniResQ ML Service Starting...")
-    load_model()
-    logger.info("🌐 Flask server running on http://0.0.0.0:5000")
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    logger.info("🌐 Flask server running on http://0.0.0.0:5000 (model loading in the background, see /ready)")
+    create_app().run(host='0.0.0.0', port=5000, debug=False, threaded=True)
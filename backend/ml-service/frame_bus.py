@@ -0,0 +1,350 @@
+"""
+AniResQ ML Service - Shared-memory Frame Bus
+Capture/decode runs in its own process and writes frames into preallocated
+shared-memory ring slots; inference reads them without copying. For alert clips the capture process
+also keeps the last seconds JPEG-compressed and hands them over on request
+"""
+
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Header layout (int64): latest complete sequence, closed flag, then the sequence held by each slot
+_LATEST = 0
+_CLOSED = 1
+_SLOTS = 2
+
+
+def _attach(name):
+    """Attach to an existing block without letting this process's resource tracker unlink it"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Before 3.13 attaching registers the block again. Capture processes are spawned by the
+    # owner and share its resource tracker, so that is a no-op; unregistering here would drop
+    # the owner's registration and make its unlink() fail in the tracker
+    return shared_memory.SharedMemory(name=name)
+
+
+class FrameBus:
+    def __init__(self, shape, slots=32):
+        """
+        Ring of uint8 frame slots in shared memory
+
+        The creating process owns (and finally frees) the memory; other
+        processes attach with FrameBus.attach(). One writer, any number of readers.
+
+        Args:
+            shape: Frame shape, e.g. (1080, 1920, 3)
+            slots: Frames kept in the ring; readers can look back this far
+        """
+        frame_bytes = int(np.prod(shape))
+        self.frames_shm = shared_memory.SharedMemory(create=True, size=frame_bytes * slots)
+        self.header_shm = shared_memory.SharedMemory(create=True, size=8 * (_SLOTS + slots))
+        self._map(shape, slots, owner=True)
+        self.header[:] = -1
+        self.header[_CLOSED] = 0
+
+    def _map(self, shape, slots, owner):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.owner = owner
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.frames_shm.buf)
+        self.header = np.ndarray((_SLOTS + slots,), dtype=np.int64, buffer=self.header_shm.buf)
+
+    @property
+    def name(self):
+        """Names needed by attach(): (frames block, header block)"""
+        return self.frames_shm.name, self.header_shm.name
+
+    @classmethod
+    def attach(cls, names, shape, slots):
+        """Map an existing bus created by another process"""
+        bus = cls.__new__(cls)
+        bus.frames_shm = _attach(names[0])
+        bus.header_shm = _attach(names[1])
+        bus._map(shape, slots, owner=False)
+        return bus
+
+    def write(self, frame):
+        """Copy a frame into the next slot (writer side); returns its sequence number"""
+        seq = int(self.header[_LATEST]) + 1
+        slot = seq % self.slots
+        # Mark the slot as being written so readers never accept a torn frame
+        self.header[_SLOTS + slot] = -1
+        self.frames[slot] = frame
+        self.header[_SLOTS + slot] = seq
+        self.header[_LATEST] = seq
+        return seq
+
+    def latest(self):
+        """Sequence number of the newest complete frame (-1 if none yet)"""
+        return int(self.header[_LATEST])
+
+    def view(self, seq):
+        """
+        Zero-copy view of a frame, or None if it has already been overwritten
+
+        The view stays valid until the writer wraps around the ring; check
+        is_current(seq) after using it if that matters.
+        """
+        slot = seq % self.slots
+        if seq < 0 or self.header[_SLOTS + slot] != seq:
+            return None
+        return self.frames[slot]
+
+    def is_current(self, seq):
+        return seq >= 0 and self.header[_SLOTS + seq % self.slots] == seq
+
+    def copy(self, seq):
+        """Copy a frame out; None if it was overwritten before or during the copy"""
+        frame = self.view(seq)
+        if frame is None:
+            return None
+        frame = frame.copy()
+        return frame if self.is_current(seq) else None
+
+    def close_writer(self):
+        self.header[_CLOSED] = 1
+
+    @property
+    def closed(self):
+        return bool(self.header[_CLOSED])
+
+    def close(self):
+        """Detach; the owner also frees the memory"""
+        self.frames = None
+        self.header = None
+        for shm in (self.frames_shm, self.header_shm):
+            shm.close()
+            if self.owner:
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+def _serve_clips(conn, clip_buffer):
+    """Capture process: answer the parent's clip requests with the buffered JPEG frames until told to stop"""
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:
+            return
+        try:
+            conn.send((request, clip_buffer.entries()))
+        except OSError:
+            return
+
+
+def _capture_main(stream_url, conn, clip_options=None):
+    """Capture process: report the frame shape, attach to the bus, then write every decoded frame"""
+    cap = cv2.VideoCapture(stream_url)
+    ret, frame = cap.read() if cap.isOpened() else (False, None)
+    if not ret:
+        conn.send(None)
+        cap.release()
+        return
+
+    conn.send((frame.shape, cap.get(cv2.CAP_PROP_FPS)))
+    names, slots = conn.recv()
+    bus = FrameBus.attach(names, frame.shape, slots)
+    height, width = frame.shape[:2]
+
+    server = None
+    clip_buffer = None
+    if clip_options:
+        # Compressing here keeps the clip history off the shared ring and off the inference process
+        from clip_buffer import JpegRingBuffer
+        clip_buffer = JpegRingBuffer(**clip_options)
+        server = threading.Thread(target=_serve_clips, args=(conn, clip_buffer), name="clip-server", daemon=True)
+        server.start()
+    try:
+        while ret and not bus.closed:
+            if frame.shape != bus.shape:
+                frame = cv2.resize(frame, (width, height))
+            bus.write(frame)
+            if clip_buffer is not None:
+                clip_buffer.append(frame)
+            ret, frame = cap.read()
+    finally:
+        bus.close_writer()
+        cap.release()
+        bus.close()
+    if server is not None:
+        # Clips of the last seconds can still be requested until the parent releases the capture
+        server.join()
+
+
+class SharedFrameCapture:
+    def __init__(self, stream_url, slots=32, poll_interval=0.002, read_timeout=5.0, open_timeout=30.0,
+                 clip_seconds=0.0, clip_quality=80, clip_size=None, max_ring_mb=128):
+        """
+        cv2.VideoCapture-compatible reader fed by a capture process over a FrameBus
+
+        read() returns zero-copy views into shared memory. A view is only valid
+        until the ring wraps, so consumers that keep frames past the current loop
+        iteration (inference queues, snapshots) should take copy_last() instead of
+        holding on to views.
+
+        Args:
+            stream_url: URL of the stream (RTSP, HTTP, file path or camera index)
+            slots: Ring size in frames (decode depth)
+            poll_interval: Seconds between checks for a new frame
+            read_timeout: Seconds read() waits for a new frame before failing
+            open_timeout: Seconds to wait for the capture process to open the stream
+            clip_seconds: Seconds of JPEG frames the capture process keeps for alert
+                          clips (0 = none); exposed as clip_buffer
+            clip_quality: JPEG quality of the clip frames
+            clip_size: Optional (width, height) clip frames are resized to before compression
+            max_ring_mb: Memory cap for the ring; large frames get fewer slots
+        """
+        self.stream_url = stream_url
+        self.slots = slots
+        self.poll_interval = poll_interval
+        self.read_timeout = read_timeout
+        self.bus = None
+        self.fps = 0.0
+        self.next_seq = 0
+        self.last_seq = -1
+        self.clip_buffer = None
+        self.clip_requests = 0
+        self.conn_lock = threading.Lock()
+        self.stats = {'read': 0, 'dropped': 0}
+
+        clip_options = None
+        if clip_seconds > 0:
+            clip_options = {'seconds': clip_seconds, 'quality': clip_quality, 'size': clip_size}
+
+        # spawn: the parent runs torch and other threads, which don't survive fork safely. The
+        # child re-imports the parent's __main__, so entry points keep torch/ultralytics imports
+        # out of module level (app.py, live_detection.py)
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_capture_main,
+            args=(stream_url, child_conn, clip_options),
+            name=f"capture-{stream_url}",
+            daemon=True
+        )
+        self.process.start()
+
+        if not self.conn.poll(open_timeout):
+            logger.error(f"Capture process for {stream_url} did not start in {open_timeout}s")
+            self.process.terminate()
+            return
+        info = self.conn.recv()
+        if info is None:
+            logger.error(f"Capture process could not open {stream_url}")
+            self.process.join(1)
+            return
+
+        shape, self.fps = info
+        frame_bytes = int(np.prod(shape))
+        affordable = max(2, int(max_ring_mb * 1024 * 1024 // frame_bytes))
+        if slots > affordable:
+            logger.warning(f"Shared ring for {stream_url} capped at {affordable} frames ({max_ring_mb} MB)")
+            self.slots = slots = affordable
+
+        self.bus = FrameBus(shape, slots)
+        self.conn.send((self.bus.name, slots))
+
+        if clip_options:
+            from clip_buffer import ProcessJpegBuffer
+            self.clip_buffer = ProcessJpegBuffer(self, clip_seconds)
+
+    def isOpened(self):
+        return self.bus is not None
+
+    def get(self, prop):
+        if self.bus is None:
+            return 0
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.bus.shape[1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.bus.shape[0]
+        return 0
+
+    def read(self):
+        """Return (True, view) for the next unread frame, skipping ahead if the reader fell behind"""
+        if self.bus is None:
+            return False, None
+
+        deadline = time.monotonic() + self.read_timeout
+        while True:
+            latest = self.bus.latest()
+            if latest >= self.next_seq:
+                # Frames older than the ring are gone; continue from the oldest one still held
+                oldest = max(self.next_seq, latest - self.slots + 2)
+                self.stats['dropped'] += oldest - self.next_seq
+                frame = self.bus.view(oldest)
+                if frame is not None:
+                    self.last_seq = oldest
+                    self.next_seq = oldest + 1
+                    self.stats['read'] += 1
+                    return True, frame
+                self.next_seq = latest
+                continue
+            if self.bus.closed or not self.process.is_alive() or time.monotonic() >= deadline:
+                return False, None
+            time.sleep(self.poll_interval)
+
+    def copy_last(self):
+        """Own copy of the frame last returned by read(), or None if the ring has overwritten it"""
+        if self.bus is None:
+            return None
+        return self.bus.copy(self.last_seq)
+
+    def clip_entries(self, timeout=5.0):
+        """
+        Fetch the capture process's buffered clip frames
+
+        Returns:
+            list: (monotonic time, JPEG bytes) pairs, oldest first; empty if the process is gone
+        """
+        with self.conn_lock:
+            if self.bus is None or not self.process.is_alive():
+                return []
+            self.clip_requests += 1
+            request = self.clip_requests
+            try:
+                self.conn.send(request)
+                deadline = time.monotonic() + timeout
+                # Skip late replies to requests that already timed out
+                while self.conn.poll(max(0.0, deadline - time.monotonic())):
+                    answer, entries = self.conn.recv()
+                    if answer == request:
+                        return entries
+            except (EOFError, OSError) as e:
+                logger.warning(f"Clip request to capture process for {self.stream_url} failed: {e}")
+                return []
+        logger.warning(f"Capture process for {self.stream_url} did not return clip frames in {timeout}s")
+        return []
+
+    def release(self):
+        if self.bus is not None:
+            self.bus.close_writer()
+            if self.clip_buffer is not None:
+                with self.conn_lock:
+                    try:
+                        self.conn.send(None)
+                    except OSError:
+                        pass
+        if self.process.is_alive():
+            self.process.join(2)
+            if self.process.is_alive():
+                self.process.terminate()
+        if self.bus is not None:
+            self.bus.close()
+            self.bus = None
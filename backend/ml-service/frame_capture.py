@@ -0,0 +1,290 @@
+"""
+AniResQ ML Service - Frame Capture Sources
+cv2.VideoCapture-compatible readers used by the stream loops
+"""
+
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_MODES = ('sequential', 'latest', 'keyframe', 'shared')
+
+
+class LatestFrameCapture:
+    def __init__(self, stream_url, read_timeout=5.0):
+        """
+        Drain a stream on its own thread and hand out only the newest frame
+
+        Frames are grabbed (demuxed) continuously so the RTSP buffer never
+        backs up, but only retrieved (decoded/converted) when a consumer is
+        waiting in read(). Everything grabbed in between is dropped and counted.
+
+        Args:
+            stream_url: URL of the stream (RTSP, HTTP, file path or camera index)
+            read_timeout: Seconds read() waits for a fresh frame before failing
+        """
+        self.stream_url = stream_url
+        self.read_timeout = read_timeout
+        self.cap = cv2.VideoCapture(stream_url)
+        try:
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        except Exception:
+            pass
+
+        self.cond = threading.Condition()
+        self.want_frame = threading.Event()
+        self.frame = None
+        self.frame_id = 0
+        self.failed = False
+        self.running = False
+        self.last_frame_time = None
+        self.stats = {
+            'grabbed': 0,
+            'decoded': 0,
+            'dropped': 0,
+        }
+
+        self.thread = None
+        if self.cap.isOpened():
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name=f"capture-{stream_url}", daemon=True)
+            self.thread.start()
+
+    def isOpened(self):
+        return self.running and not self.failed
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def _run(self):
+        while self.running:
+            if not self.cap.grab():
+                with self.cond:
+                    self.failed = True
+                    self.cond.notify_all()
+                break
+
+            self.stats['grabbed'] += 1
+            if not self.want_frame.is_set():
+                self.stats['dropped'] += 1
+                continue
+
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                continue
+
+            with self.cond:
+                self.stats['decoded'] += 1
+                self.frame = frame
+                self.frame_id += 1
+                self.last_frame_time = time.monotonic()
+                self.want_frame.clear()
+                self.cond.notify_all()
+
+    def read(self):
+        """Return (ret, frame) for the first frame grabbed after this call"""
+        with self.cond:
+            if self.failed or not self.running:
+                return False, None
+
+            start_id = self.frame_id
+            self.want_frame.set()
+            self.cond.wait_for(lambda: self.frame_id > start_id or self.failed, timeout=self.read_timeout)
+
+            if self.frame_id > start_id:
+                return True, self.frame
+            return False, None
+
+    def release(self):
+        self.running = False
+        self.want_frame.clear()
+        if self.thread is not None:
+            self.thread.join(self.read_timeout)
+        self.cap.release()
+        logger.info(f"Capture {self.stream_url}: grabbed {self.stats['grabbed']}, "
+                    f"decoded {self.stats['decoded']}, dropped {self.stats['dropped']}")
+
+
+class KeyframeCapture:
+    def __init__(self, stream_url, quiet_period=10.0, motion_threshold=0.02, read_timeout=5.0, clip_seconds=0.0):
+        """
+        PyAV reader that decodes only keyframes while the camera is idle
+
+        Non-key packets are demuxed but not decoded until mark_activity() is called
+        (on a detection) or two consecutive keyframes differ by more than
+        motion_threshold. Full decode then continues until quiet_period seconds
+        pass without further activity. Packets since the last keyframe are kept
+        so switching to full decode mid-GOP does not produce a corrupt frame.
+        With clip_seconds, every demuxed packet (decoded or not) is also kept in
+        clip_buffer, so pre-event clips are a remux of the source stream.
+
+        Args:
+            stream_url: URL of the stream (RTSP, HTTP or file path)
+            quiet_period: Seconds of inactivity before dropping back to keyframes only
+            motion_threshold: Fraction of changed pixels between keyframes that counts as motion
+            read_timeout: Network timeout in seconds for opening and reading the stream
+            clip_seconds: Seconds of encoded packets to keep for clips (0 = none)
+        """
+        import av  # PyAV is only needed for this capture mode
+
+        self.stream_url = stream_url
+        self.quiet_period = quiet_period
+        self.motion_threshold = motion_threshold
+        self.active_until = 0.0
+        self.gop_packets = None  # None until the first keyframe has been seen
+        self.decoder_synced = False
+        self.prev_keyframe = None
+        self.container = None
+        self.clip_buffer = None
+        self.stats = {
+            'packets': 0,
+            'keyframes_decoded': 0,
+            'frames_decoded': 0,
+            'packets_skipped': 0,
+            'wakeups': 0,
+        }
+
+        try:
+            options = {'rtsp_transport': 'tcp'} if str(stream_url).startswith('rtsp') else {}
+            self.container = av.open(str(stream_url), options=options, timeout=read_timeout)
+            self.stream = self.container.streams.video[0]
+            self.packets = self.container.demux(self.stream)
+            if clip_seconds > 0:
+                from clip_buffer import PacketRingBuffer
+                self.clip_buffer = PacketRingBuffer(self.stream, clip_seconds)
+        except Exception as e:
+            logger.error(f"Failed to open {stream_url} with PyAV: {e}")
+            self.container = None
+
+    @property
+    def keyframes_only(self):
+        """True while the camera is idle and only keyframes are decoded"""
+        return time.monotonic() >= self.active_until
+
+    def mark_activity(self):
+        """Switch to (or stay in) full decode for another quiet period"""
+        if self.keyframes_only:
+            self.stats['wakeups'] += 1
+            logger.info(f"Capture {self.stream_url}: activity, switching to full decode")
+        self.active_until = time.monotonic() + self.quiet_period
+
+    def isOpened(self):
+        return self.container is not None
+
+    def get(self, prop):
+        if self.container is None:
+            return 0
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.stream.average_rate or 0)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.stream.codec_context.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.stream.codec_context.height
+        return 0
+
+    def _decode(self, packet):
+        frames = packet.decode()
+        return frames[-1] if frames else None
+
+    def _keyframe_motion(self, frame):
+        small = frame.reformat(width=64, height=36, format='gray').to_ndarray()
+        prev, self.prev_keyframe = self.prev_keyframe, small
+        if prev is None:
+            return False
+        changed = np.count_nonzero(cv2.absdiff(small, prev) > 25)
+        return changed / small.size >= self.motion_threshold
+
+    def read(self):
+        """Return (ret, frame) for the next decoded frame as a BGR array"""
+        if self.container is None:
+            return False, None
+
+        try:
+            for packet in self.packets:
+                if packet.dts is None:
+                    continue
+                self.stats['packets'] += 1
+                if self.clip_buffer is not None:
+                    self.clip_buffer.append(packet)
+
+                if packet.is_keyframe:
+                    self.gop_packets = []
+                    self.decoder_synced = True
+                    frame = self._decode(packet)
+                    if frame is None:
+                        continue
+                    if self.keyframes_only:
+                        self.stats['keyframes_decoded'] += 1
+                        if self._keyframe_motion(frame):
+                            self.mark_activity()
+                    else:
+                        self.stats['frames_decoded'] += 1
+                    return True, frame.to_ndarray(format='bgr24')
+
+                if self.gop_packets is None:
+                    # Joined mid-GOP: nothing decodable until the first keyframe
+                    self.stats['packets_skipped'] += 1
+                    continue
+
+                if self.keyframes_only:
+                    self.gop_packets.append(packet)
+                    self.decoder_synced = False
+                    self.stats['packets_skipped'] += 1
+                    continue
+
+                if not self.decoder_synced:
+                    # Catch the decoder up on the packets skipped since the keyframe
+                    for skipped in self.gop_packets:
+                        self._decode(skipped)
+                    self.gop_packets = []
+                    self.decoder_synced = True
+
+                frame = self._decode(packet)
+                if frame is not None:
+                    self.stats['frames_decoded'] += 1
+                    return True, frame.to_ndarray(format='bgr24')
+
+        except Exception as e:
+            logger.warning(f"PyAV read failed for {self.stream_url}: {e}")
+
+        return False, None
+
+    def release(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+        logger.info(f"Capture {self.stream_url}: {self.stats['packets']} packets, "
+                    f"{self.stats['keyframes_decoded']} idle keyframes, "
+                    f"{self.stats['frames_decoded']} full-decode frames, "
+                    f"{self.stats['packets_skipped']} packets not decoded")
+
+
+def open_capture(stream_url, mode='sequential', **kwargs):
+    """
+    Open a stream with the requested capture mode
+
+    Args:
+        stream_url: URL of the stream
+        mode: 'sequential' (plain cv2.VideoCapture, decodes every frame on the caller's
+              thread), 'latest' (LatestFrameCapture), 'keyframe' (KeyframeCapture) or
+              'shared' (frame_bus.SharedFrameCapture, decodes in a separate process)
+        **kwargs: Extra options for the capture class
+
+    Returns:
+        An object with the cv2.VideoCapture read()/isOpened()/get()/release() interface
+    """
+    if mode == 'latest':
+        return LatestFrameCapture(stream_url, **kwargs)
+    if mode == 'keyframe':
+        return KeyframeCapture(stream_url, **kwargs)
+    if mode == 'shared':
+        from frame_bus import SharedFrameCapture
+        return SharedFrameCapture(stream_url, **kwargs)
+    if mode != 'sequential':
+        logger.warning(f"Unknown capture mode '{mode}', falling back to sequential")
+    return cv2.VideoCapture(stream_url)
@@ -2,18 +2,27 @@
 import cv2
 import numpy as np
 import requests
+import json
 import logging
+import math
 import os
+import threading
 import time
-import torch
-from ultralytics import YOLO
 from datetime import datetime
-from collections import deque
-import tempfile
 import platform
 from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
+
+from box_propagation import AdaptiveInterval, BoxPropagator
+from camera_tracker import TrackerPool
+from clip_buffer import JpegRingBuffer, clip_source
+from clip_encoder import ClipProfile, focus_region
+from cpu_resources import LatencyTracker, ResourceManager
+from detection_result import DetectionResult
+from media_uploader import uploader_from_config
+from media_worker import MediaWorker
+from frame_capture import open_capture
+from roi_zones import CameraZones
+from sampling_scheduler import SamplingScheduler
 
 # ================= LOAD ENV =================
 load_dotenv(dotenv_path=r"C:\Users\Shraddha\Desktop\CapP\aniresqget\AniResQ\backend\.env")
@@ -22,17 +31,19 @@ CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
 API_KEY = os.getenv("CLOUDINARY_API_KEY")
 API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
 
-# ================= CLOUDINARY CONFIG =================
-cloudinary.config(
-    cloud_name=CLOUD_NAME,
-    api_key=API_KEY,
-    api_secret=API_SECRET,
-    secure=True
-)
+# torch, ultralytics and cloudinary are imported by the detector, not here: shared-mode
+# capture processes are spawned and re-import this module
 
-# ================= CPU OPTIMIZATION =================
-torch.set_num_threads(os.cpu_count())
-torch.backends.mkldnn.enabled = True
+# ================= CLOUDINARY CONFIG =================
+def configure_cloudinary():
+    import cloudinary
+
+    cloudinary.config(
+        cloud_name=CLOUD_NAME,
+        api_key=API_KEY,
+        api_secret=API_SECRET,
+        secure=True
+    )
 
 # ================= LOGGING =================
 logging.basicConfig(
@@ -44,89 +55,157 @@ logger = logging.getLogger(__name__)
 # ================= DETECTOR CLASS =================
 class LiveAnimalDetector:
     def __init__(self, model_path, backend_url, confidence_threshold=0.6,
-                 clip_duration_sec=3, track_cooldown_sec=20):
+                 clip_duration_sec=3, track_cooldown_sec=20, idle_fps=2.0, active_fps=6.0,
+                 cpu_profile="balanced", cpu_pinning=False, post_roll_sec=2,
+                 clip_profile="standard", clip_preview=False, uploader=None):
         self.backend_url = backend_url
         self.confidence_threshold = confidence_threshold
         self.clip_duration_sec = clip_duration_sec
+        self.post_roll_sec = post_roll_sec
         self.track_cooldown_sec = track_cooldown_sec
+        # Wall-clock sampling: faster while an animal is tracked, slower when idle
+        self.scheduler = SamplingScheduler(idle_fps=idle_fps, active_fps=active_fps,
+                                           active_hold=track_cooldown_sec)
+
+        # One tracker per camera; the model itself stays stateless so cameras can share it
+        self.trackers = TrackerPool(frame_rate=math.ceil(active_fps), stale_after=track_cooldown_sec * 3)
 
         self.animal_classes = {"porcupine", "animal_redfox", "hyena", "tiger"}
-        self.active_tracks = {}
         self.stats = {
             "total_frames": 0,
             "total_detections": 0,
             "animal_counts": {},
             "alerts_sent": 0,
+            "detector_runs": 0,
             "start_time": time.time()
         }
 
+        # Split cores between torch, OpenCV and capture before the model runs
+        self.resources = ResourceManager(cpu_profile, pin=cpu_pinning)
+        self.resources.apply()
+        self.latency = LatencyTracker()
+
+        # ================= CPU OPTIMIZATION =================
+        # Thread pools are sized by the ResourceManager above, not to every core here
+        import torch
+        from ultralytics import YOLO
+
+        torch.backends.mkldnn.enabled = True
+
         logger.info(f"Loading model: {model_path}")
         self.model = YOLO(model_path)
+        self.model_lock = threading.Lock()
         logger.info("Model loaded successfully")
 
+        # Shared uploader: skips clips it has uploaded before, chunks only large ones
+        if uploader is None:
+            configure_cloudinary()
+        self.uploader = uploader or uploader_from_config()
+
+        # Alerts (with a snapshot) are posted, and their clips built, uploaded and attached, in the background
+        # Clip profile: codec/bitrate/resolution/size cap ("source" keeps the stream as is)
+        profile = ClipProfile.named(clip_profile, preview=clip_preview)
+        if profile is None and clip_preview:
+            logger.warning("Clip previews need a clip profile other than 'source'")
+        self.media = MediaWorker(
+            self.upload_video,
+            self.attach_video,
+            profile=profile,
+            post_roll=post_roll_sec,
+            thread_init=lambda: self.resources.pin_thread("encode"),
+            send_fn=lambda cctv_id, alert: self.send_alert(cctv_id=cctv_id, **alert)
+        )
+
+    def close(self):
+        """Finish pending alerts and clip uploads"""
+        self.media.stop()
+        self.uploader.close()
+
     def is_animal(self, class_name):
         return str(class_name).lower() in self.animal_classes
 
-    def capture_clip(self, frame_buffer, fps=10):
-        if len(frame_buffer) == 0:
-            return None
-        h, w = frame_buffer[0].shape[:2]
-        temp_file = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
-        path = temp_file.name
-        temp_file.close()
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(path, fourcc, fps, (w, h))
-        for frame in frame_buffer:
-            out.write(frame)
-        out.release()
-        logger.info(f"Clip saved locally: {path}")
-        return path
-
-    def upload_video(self, video_path):
+    def capture_snapshot(self, frame):
+        """JPEG-encode the alert frame"""
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        return encoded.tobytes() if ok else None
+
+    def upload_video(self, data, resource_type="video"):
+        """Upload clip or preview bytes through the shared uploader; returns the URL or None"""
+        filename = "clip.mp4" if resource_type == "video" else "preview.webp"
+        return self.uploader.upload(data, resource_type=resource_type, filename=filename)
+
+    def attach_video(self, alert_ids, media):
+        """Set videoUrl (and previewUrl) on alerts that were posted before their clip was ready"""
         try:
-            result = cloudinary.uploader.upload_large(video_path, resource_type="video")
-            url = result.get("secure_url")
-            logger.info(f"Video uploaded to Cloudinary: {url}")
-            return url
+            r = requests.patch(
+                f"{self.backend_url}/api/wildDetection/detections/media",
+                json={"ids": alert_ids, **media},
+                timeout=30
+            )
+            if r.status_code == 200:
+                return True
+            logger.warning(f"Backend responded with {r.status_code} attaching clip: {r.text}")
         except Exception as e:
-            logger.error(f"Cloudinary upload failed: {e}")
-            return None
+            logger.error(f"Failed to attach clip: {e}")
+        return False
 
-    def send_alert(self, detections, cctv_id, video_path=None, location=None):
+    def send_alert(self, detections, cctv_id, snapshot=None, location=None):
         """
-        Send alert to backend.
+        Send one event's alerts to the backend in a single batch request.
         detections: list of dicts, each with 'track_id', 'animal', 'confidence'
+        snapshot: JPEG bytes of the alert frame, shared by every alert of the event
         location: dict {"locationName": ..., "latitude": ..., "longitude": ...}
+        Returns the backend IDs of the alerts created (for attaching the clip later).
         """
-        video_url = self.upload_video(video_path) if video_path else None
-
-        for d in detections:
-            payload = {
-                "cctv_id": cctv_id,
-                "animal": d["animal"],
-                "confidence": round(d["confidence"]*100, 2),  # convert to percentage
-                "behavior": "",  # optional
-                "distance": "",  # optional
-                "locationName": location.get("locationName") if location else None,
-                "latitude": location.get("latitude") if location else None,
-                "longitude": location.get("longitude") if location else None,
-                "videoUrl": video_url,
-                "timestamp": datetime.now().isoformat()
-            }
-
-            try:
+        if not detections:
+            return []
+
+        payload = {
+            "cctv_id": cctv_id,
+            "locationName": location.get("locationName") if location else None,
+            "latitude": location.get("latitude") if location else None,
+            "longitude": location.get("longitude") if location else None,
+            "timestamp": datetime.now().isoformat(),
+            "detections": [
+                {
+                    "animal": d["animal"],
+                    "confidence": round(d["confidence"]*100, 2),  # convert to percentage
+                    "behavior": "",  # optional
+                    "distance": "",  # optional
+                }
+                for d in detections
+            ]
+        }
+
+        try:
+            if snapshot:
+                # Multipart fields are flat strings: the detections travel as JSON
+                fields = {k: v for k, v in payload.items() if k != "detections" and v is not None}
+                fields["detections"] = json.dumps(payload["detections"])
                 r = requests.post(
-                    f"{self.backend_url}/api/wildDetection/detections",
+                    f"{self.backend_url}/api/wildDetection/detections/batch",
+                    data=fields,
+                    files={"media": (f"{cctv_id}.jpg", snapshot, "image/jpeg")},
+                    timeout=30
+                )
+            else:
+                r = requests.post(
+                    f"{self.backend_url}/api/wildDetection/detections/batch",
                     json=payload,
                     timeout=30
                 )
-                if r.status_code == 201:
-                    logger.info(f"Alert for {d['animal']} sent successfully")
-                    self.stats["alerts_sent"] += 1
-                else:
-                    logger.warning(f"Backend responded with {r.status_code}: {r.text}")
-            except Exception as e:
-                logger.error(f"Failed to send alert: {e}")
+            if r.status_code != 201:
+                logger.warning(f"Backend responded with {r.status_code}: {r.text}")
+                return []
+        except Exception as e:
+            logger.error(f"Failed to send alert: {e}")
+            return []
+
+        created = r.json().get("data", [])
+        self.stats["alerts_sent"] += len(created)
+        animals = ", ".join(d["animal"] for d in detections)
+        logger.info(f"Alert for {animals} sent successfully ({len(created)} detection(s))")
+        return [c["_id"] for c in created if c.get("_id")]
 
     def print_summary(self, cctv_id):
         end_time = time.time()
@@ -141,7 +220,12 @@ class LiveAnimalDetector:
         print(f"Total Frames Processed: {self.stats['total_frames']}")
         print(f"Total Animal Detections: {self.stats['total_detections']}")
         print(f"Total Alerts Sent: {self.stats['alerts_sent']}")
+        print(f"Detector Runs: {self.stats['detector_runs']}")
         print(f"Average FPS: {fps:.2f}")
+        latency = self.latency.summary()
+        if latency:
+            print(f"Detector Latency: p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, "
+                  f"jitter {latency['jitter_ms']} ms")
         print("\nAnimal Counts:")
         for animal, count in self.stats["animal_counts"].items():
             print(f"{animal}: {count}")
@@ -150,15 +234,57 @@ class LiveAnimalDetector:
         print(f"OS: {platform.system()}")
         print("="*60)
 
-    def detect(self, camera_index=0, cctv_id="cam_001", show=True):
-        cap = cv2.VideoCapture(camera_index)
+    def run_detector(self, cctv_id, frame, zones=None):
+        """Run the shared model on a frame (cropped to the ROI, if any) and feed the camera's tracker"""
+        model_input, (x_offset, y_offset) = zones.crop(frame) if zones is not None else (frame, (0, 0))
+        started = time.monotonic()
+        with self.model_lock:
+            results = self.model.predict(
+                model_input,
+                conf=self.confidence_threshold,
+                device="cpu",
+                verbose=False
+            )
+        self.latency.record(time.monotonic() - started)
+        self.stats["detector_runs"] += 1
+
+        return self.trackers.update(
+            cctv_id,
+            DetectionResult.from_ultralytics(results[0], self.model.names).offset(x_offset, y_offset),
+            frame
+        )
+
+    def detect(self, camera_index=0, cctv_id="cam_001", show=True, capture_mode="sequential", sparse=False,
+               roi=None, zones=None):
+        # capture_mode="keyframe" decodes only keyframes of a network stream until something moves
+        # capture_mode="shared" decodes in a separate process into a shared-memory ring; frames
+        # are read zero-copy
+        # sparse=True runs the detector every K frames and moves boxes with optical flow in between
+        # roi/zones are normalized polygons: the model only sees the ROI, alerts only fire inside zones
+        camera_zones = CameraZones(roi, zones) if roi or zones else None
+
+        # Clips cover clip_duration_sec before the alert plus the post-roll after it
+        clip_seconds = self.clip_duration_sec + self.post_roll_sec
+        if capture_mode in ("keyframe", "shared"):
+            # The capture keeps the stream's own packets (keyframe) or compresses frames in its
+            # own process (shared); clips are built from those instead of a JPEG copy made here
+            cap = open_capture(camera_index, capture_mode, clip_seconds=clip_seconds)
+        else:
+            cap = open_capture(camera_index, capture_mode)
         if not cap.isOpened():
             logger.error("Camera not opened")
             return
-
-        fps = 10
-        frame_buffer = deque(maxlen=fps*self.clip_duration_sec)
-        frame_count = 0
+        # This thread runs the model; a capture process decodes on its own cores
+        self.resources.pin_thread("inference")
+        if getattr(cap, "process", None) is not None:
+            self.resources.pin_process(cap.process.pid, "decode")
+
+        # Webcams and cv2 readers expose no packets: keep JPEG-compressed frames instead
+        clip_buffer = clip_source(cap, JpegRingBuffer(seconds=clip_seconds))
+        self.scheduler.register(cctv_id)
+        if sparse:
+            propagator = BoxPropagator()
+            interval = AdaptiveInterval()
         logger.info("Starting live detection")
         cv2.namedWindow("AniResQ Live Detection", cv2.WINDOW_NORMAL)
 
@@ -168,60 +294,76 @@ class LiveAnimalDetector:
                 break
 
             self.stats["total_frames"] += 1
-            frame_buffer.append(frame.copy())
-            frame_count += 1
-            if frame_count % 5 != 0:
-                continue
-
-            resized = cv2.resize(frame, (320, 256))
-            results = self.model.track(
-                resized,
-                conf=self.confidence_threshold,
-                persist=True,
-                tracker="bytetrack.yaml",
-                device="cpu"
-            )
+            if isinstance(clip_buffer, JpegRingBuffer):
+                clip_buffer.append(frame)
+
+            if sparse:
+                resized = cv2.resize(frame, (320, 256))
+                gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+                if interval.due():
+                    expected_ids = propagator.result.track_ids.tolist()
+                    result = self.run_detector(cctv_id, resized, camera_zones)
+                    interval.on_detection(expected_ids, result.track_ids.tolist())
+                    propagator.reset(gray, result)
+                    detected = True
+                else:
+                    result, reliability = propagator.propagate(gray)
+                    interval.on_propagation(reliability, len(result) > 0)
+                    detected = False
+            else:
+                if not self.scheduler.is_due(cctv_id):
+                    continue
+                resized = cv2.resize(frame, (320, 256))
+                result = self.run_detector(cctv_id, resized, camera_zones)
+                detected = True
+
+            if camera_zones is not None:
+                in_zone = camera_zones.alert_mask(result, resized.shape).tolist()
+            else:
+                in_zone = [True] * len(result)
 
             detections = []
-            if results[0].boxes is not None:
-                for box in results[0].boxes:
-                    cls_id = int(box.cls[0])
-                    class_name = self.model.names[cls_id]
-                    conf = float(box.conf[0])
-                    track_id = int(box.id[0]) if box.id is not None else -1
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-                    if self.is_animal(class_name):
-                        detections.append({
-                            "track_id": track_id,
-                            "animal": class_name,
-                            "confidence": conf
-                        })
-                        self.stats["total_detections"] += 1
-                        self.stats["animal_counts"][class_name] = self.stats["animal_counts"].get(class_name, 0) + 1
-                        color = (0, 255, 0)
-                    else:
-                        color = (255, 255, 0)
-
-                    cv2.rectangle(resized, (x1, y1), (x2, y2), color, 2)
-                    cv2.putText(resized, f"{class_name} ID:{track_id} {conf:.2f}", (x1, y1 - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+            for (x1, y1, x2, y2), conf, class_name, track_id, alertable in zip(
+                    result.boxes.astype(int).tolist(), result.scores.tolist(),
+                    result.class_names(), result.track_ids.tolist(), in_zone):
+                # Propagated boxes are only drawn; alerts and counts come from detector runs
+                if self.is_animal(class_name) and detected and alertable:
+                    detections.append({
+                        "track_id": track_id,
+                        "animal": class_name,
+                        "confidence": conf,
+                        "box": (x1, y1, x2, y2)
+                    })
+                    self.stats["total_detections"] += 1
+                    self.stats["animal_counts"][class_name] = self.stats["animal_counts"].get(class_name, 0) + 1
+                    color = (0, 255, 0)
+                elif self.is_animal(class_name):
+                    color = (0, 200, 0)
+                else:
+                    color = (255, 255, 0)
+
+                cv2.rectangle(resized, (x1, y1), (x2, y2), color, 2)
+                cv2.putText(resized, f"{class_name} ID:{track_id} {conf:.2f}", (x1, y1 - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
 
             # Alert logic
             alert = False
             valid_detections = []
-            current_time = time.time()
+            tracker = self.trackers.get(cctv_id)
+
+            if detections:
+                self.scheduler.mark_active(cctv_id)
+                if hasattr(cap, "mark_activity"):
+                    cap.mark_activity()
 
             for d in detections:
-                tid = d["track_id"]
-                if tid not in self.active_tracks or current_time - self.active_tracks[tid] > self.track_cooldown_sec:
-                    self.active_tracks[tid] = current_time
+                if tracker.claim_alert(d["track_id"], self.track_cooldown_sec):
                     alert = True
                     valid_detections.append(d)
 
             if alert and valid_detections:
                 logger.warning("Animal detected — sending alert")
-                clip_path = self.capture_clip(frame_buffer)
+                snapshot = self.capture_snapshot(frame)
 
                 location_info = {
                     "locationName": "Forest Zone 1",
@@ -229,18 +371,33 @@ class LiveAnimalDetector:
                     "longitude": 77.5946
                 }
 
-                self.send_alert(valid_detections, cctv_id, clip_path, location_info)
-
-                if clip_path and os.path.exists(clip_path):
-                    os.remove(clip_path)
+                # Only the JPEG encode happens here: the POST runs on the media worker's sender
+                # thread, then the clip (keeping the alerted animals in view when the profile
+                # crops) is built from the buffer, which keeps filling during post-roll
+                focus = focus_region([d["box"] for d in valid_detections], resized.shape)
+                self.media.send_alert(
+                    cctv_id,
+                    clip_buffer,
+                    {"detections": valid_detections, "snapshot": snapshot, "location": location_info},
+                    focus
+                )
 
             if show:
                 cv2.imshow("AniResQ Live Detection", resized)
                 if cv2.waitKey(1) & 0xFF == ord("q"):
                     break
 
+        # Pending alerts are posted and clips still waiting for post-roll built now, while the
+        # capture's packets are valid
+        self.media.flush()
         cap.release()
         cv2.destroyAllWindows()
+        self.trackers.release(cctv_id)
+        self.scheduler.unregister(cctv_id)
+        if sparse:
+            logger.info(f"Sparse inference: {interval.stats['detector_runs']} detector runs over "
+                        f"{interval.stats['frames']} frames (final K={interval.k}), "
+                        f"{interval.savings():.0%} fewer than every 5th frame")
         self.print_summary(cctv_id)
 
 # ================= MAIN =================
@@ -255,7 +412,10 @@ def main():
         clip_duration_sec=3,
         track_cooldown_sec=20
     )
-    detector.detect(camera_index=0, cctv_id="aniresq_cam_1", show=True)
+    try:
+        detector.detect(camera_index=0, cctv_id="aniresq_cam_1", show=True)
+    finally:
+        detector.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
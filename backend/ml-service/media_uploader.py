@@ -0,0 +1,430 @@
+"""
+AniResQ ML Service - Media Uploader
+Shared, concurrent uploader for clips, previews and database media: skips
+content it has uploaded before, sends small files in one request and large ones
+in resumable chunks, against a pluggable storage backend
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_READ_BLOCK = 1024 * 1024
+
+
+class StorageBackend:
+    """
+    Where media ends up
+
+    Backends implement upload_single() and upload_chunk(); both return the
+    public URL once the object is complete (upload_chunk returns None for
+    every chunk but the last).
+    """
+
+    def upload_single(self, data, key, resource_type, filename):
+        raise NotImplementedError
+
+    def upload_chunk(self, chunk, key, resource_type, filename, upload_id, offset, total):
+        raise NotImplementedError
+
+
+class CloudinaryBackend(StorageBackend):
+    """Cloudinary; expects cloudinary.config() to have been called"""
+
+    def __init__(self, folder='aniresq'):
+        self.folder = folder
+
+    def _options(self, key, resource_type):
+        return {'resource_type': resource_type, 'public_id': f"{self.folder}/{key}", 'overwrite': False}
+
+    def upload_single(self, data, key, resource_type, filename):
+        import cloudinary.uploader
+
+        result = cloudinary.uploader.upload((filename, data), **self._options(key, resource_type))
+        return result.get('secure_url')
+
+    def upload_chunk(self, chunk, key, resource_type, filename, upload_id, offset, total):
+        import cloudinary.uploader
+
+        # Same Content-Range/X-Unique-Upload-Id protocol as upload_large, one part at a time,
+        # so an interrupted upload can continue from the last acknowledged part
+        headers = {
+            'Content-Range': f"bytes {offset}-{offset + len(chunk) - 1}/{total}",
+            'X-Unique-Upload-Id': upload_id,
+        }
+        result = cloudinary.uploader.upload_large_part(
+            (filename, chunk), http_headers=headers, **self._options(key, resource_type)
+        )
+        return result.get('secure_url') if offset + len(chunk) >= total else None
+
+
+class LocalStorageBackend(StorageBackend):
+    def __init__(self, root, base_url=None, latency=0.0, bandwidth=None):
+        """
+        Filesystem stand-in for offline runs and benchmarks
+
+        Args:
+            root: Directory objects are written to
+            base_url: URL prefix for returned URLs (default: file:// URLs)
+            latency: Simulated seconds per request
+            bandwidth: Simulated bytes per second per request (None = unlimited)
+        """
+        self.root = Path(root)
+        self.base_url = base_url
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def _simulate(self, size):
+        delay = self.latency + (size / self.bandwidth if self.bandwidth else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _path(self, key, resource_type, filename):
+        return self.root / resource_type / f"{key}{Path(filename).suffix}"
+
+    def _url(self, path):
+        if self.base_url:
+            return f"{self.base_url.rstrip('/')}/{path.relative_to(self.root).as_posix()}"
+        return path.resolve().as_uri()
+
+    def upload_single(self, data, key, resource_type, filename):
+        self._simulate(len(data))
+        path = self._path(key, resource_type, filename)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return self._url(path)
+
+    def upload_chunk(self, chunk, key, resource_type, filename, upload_id, offset, total):
+        self._simulate(len(chunk))
+        path = self._path(key, resource_type, filename)
+        part_path = path.with_name(f"{path.name}.{upload_id}.part")
+        part_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(part_path, 'r+b' if part_path.exists() else 'wb') as f:
+            f.seek(offset)
+            f.write(chunk)
+        if offset + len(chunk) < total:
+            return None
+        os.replace(part_path, path)
+        return self._url(path)
+
+
+def open_backend(spec):
+    """Build a backend from MEDIA_STORAGE: 'cloudinary' or 'local:<dir>'"""
+    if spec.startswith('local:'):
+        return LocalStorageBackend(spec[len('local:'):])
+    if spec != 'cloudinary':
+        logger.warning(f"Unknown media storage '{spec}', using Cloudinary")
+    return CloudinaryBackend()
+
+
+def uploader_from_config():
+    """MediaUploader set up from the UPLOAD_* / MEDIA_STORAGE settings"""
+    import config
+
+    return MediaUploader(
+        open_backend(config.MEDIA_STORAGE),
+        workers=config.UPLOAD_WORKERS,
+        index_path=config.UPLOAD_INDEX_PATH or None,
+        chunk_threshold=int(config.UPLOAD_CHUNK_THRESHOLD_MB * 1024 * 1024),
+        chunk_size=int(config.UPLOAD_CHUNK_SIZE_MB * 1024 * 1024)
+    )
+
+
+class UploadIndex:
+    def __init__(self, path=None):
+        """
+        Content hashes already uploaded (and chunked uploads in progress), kept in a JSON file
+
+        Args:
+            path: Index file; None keeps the index in memory only
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {'uploaded': {}, 'partial': {}}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.state.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable upload index {path}: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    def url(self, digest):
+        with self.lock:
+            entry = self.state['uploaded'].get(digest)
+        return entry['url'] if entry else None
+
+    def partial(self, digest):
+        with self.lock:
+            return dict(self.state['partial'].get(digest) or {}) or None
+
+    def set_partial(self, digest, upload_id, offset):
+        with self.lock:
+            self.state['partial'][digest] = {'upload_id': upload_id, 'offset': offset}
+            self._save()
+
+    def record(self, digest, url, size):
+        with self.lock:
+            self.state['uploaded'][digest] = {'url': url, 'size': size, 'uploaded_at': time.time()}
+            self.state['partial'].pop(digest, None)
+            self._save()
+
+
+class MediaUploader:
+    def __init__(self, backend, workers=4, index_path='upload_index.json',
+                 chunk_threshold=20 * 1024 * 1024, chunk_size=6 * 1024 * 1024, max_attempts=3):
+        """
+        Bounded pool of upload workers with content-hash dedupe
+
+        Args:
+            backend: StorageBackend
+            workers: Concurrent uploads
+            index_path: JSON index of uploaded hashes (None = in memory only)
+            chunk_threshold: Files at least this many bytes are uploaded in chunks
+            chunk_size: Bytes per chunk
+            max_attempts: Attempts per request (single upload or chunk) before giving up
+        """
+        self.backend = backend
+        self.index = UploadIndex(index_path)
+        self.chunk_threshold = chunk_threshold
+        self.chunk_size = chunk_size
+        self.max_attempts = max(1, max_attempts)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="media-upload")
+        self.lock = threading.Lock()
+        self.in_flight = {}  # digest -> Future, so concurrent submissions of one file upload once
+        self.stats = {
+            'uploaded': 0,
+            'deduplicated': 0,
+            'failed': 0,
+            'chunked': 0,
+            'resumed': 0,
+            'bytes_uploaded': 0,
+            'bytes_skipped': 0,
+        }
+
+    @staticmethod
+    def _digest(source):
+        digest = hashlib.sha256()
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            digest.update(source)
+            return digest.hexdigest(), len(source)
+        size = 0
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(_READ_BLOCK), b''):
+                digest.update(block)
+                size += len(block)
+        return digest.hexdigest(), size
+
+    def submit(self, source, resource_type='auto', filename=None):
+        """
+        Queue an upload
+
+        Args:
+            source: File path or bytes
+            resource_type: 'video', 'image', 'raw' or 'auto' (Cloudinary semantics)
+            filename: Name used for the upload (extension matters); defaults to the path's name
+
+        Returns:
+            Future: resolves to the URL, or None if the upload failed
+        """
+        if filename is None:
+            filename = Path(source).name if isinstance(source, (str, Path)) else 'media.bin'
+        return self.executor.submit(self._upload, source, resource_type, filename)
+
+    def upload(self, source, resource_type='auto', filename=None):
+        """Upload and wait for the URL (None on failure)"""
+        return self.submit(source, resource_type, filename).result()
+
+    def upload_many(self, sources, resource_type='auto'):
+        """Upload several files concurrently; returns their URLs in order"""
+        futures = [self.submit(source, resource_type) for source in sources]
+        return [future.result() for future in futures]
+
+    def close(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def _upload(self, source, resource_type, filename):
+        digest, size = self._digest(source)
+        url = self.index.url(digest)
+        if url:
+            self.stats['deduplicated'] += 1
+            self.stats['bytes_skipped'] += size
+            logger.info(f"{filename} already uploaded, reusing {url}")
+            return url
+
+        with self.lock:
+            pending = self.in_flight.get(digest)
+            if pending is None:
+                pending = self.in_flight[digest] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            # Same content is being uploaded by another worker right now
+            self.stats['deduplicated'] += 1
+            self.stats['bytes_skipped'] += size
+            return pending.result()
+
+        url = None
+        try:
+            if size >= self.chunk_threshold:
+                url = self._upload_chunked(source, digest, size, resource_type, filename)
+            else:
+                data = source if isinstance(source, (bytes, bytearray)) else Path(source).read_bytes()
+                url = self._attempt(self.backend.upload_single, bytes(data), digest, resource_type, filename)
+        except Exception as e:
+            logger.error(f"Upload of {filename} failed: {e}")
+        finally:
+            with self.lock:
+                self.in_flight.pop(digest, None)
+            pending.set_result(url)
+
+        if url:
+            self.index.record(digest, url, size)
+            self.stats['uploaded'] += 1
+            self.stats['bytes_uploaded'] += size
+            logger.info(f"Uploaded {filename} ({size / 1024:.0f} KiB): {url}")
+        else:
+            self.stats['failed'] += 1
+        return url
+
+    def _attempt(self, fn, *args):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return fn(*args)
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = min(30.0, 2 ** (attempt - 1))
+                logger.warning(f"Upload request failed ({e}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+
+    def _upload_chunked(self, source, digest, size, resource_type, filename):
+        # Continue an upload interrupted in an earlier run from its last acknowledged chunk
+        partial = self.index.partial(digest)
+        if partial:
+            upload_id, offset = partial['upload_id'], partial['offset']
+            self.stats['resumed'] += 1
+            logger.info(f"Resuming upload of {filename} at {offset / size:.0%}")
+        else:
+            upload_id, offset = uuid.uuid4().hex, 0
+        self.stats['chunked'] += 1
+
+        url = None
+        with (open(source, 'rb') if not isinstance(source, (bytes, bytearray)) else _BytesReader(source)) as f:
+            f.seek(offset)
+            while offset < size:
+                chunk = f.read(self.chunk_size)
+                url = self._attempt(self.backend.upload_chunk, chunk, digest, resource_type, filename,
+                                    upload_id, offset, size)
+                offset += len(chunk)
+                if offset < size:
+                    self.index.set_partial(digest, upload_id, offset)
+        return url
+
+
+class _BytesReader:
+    """Minimal file-like view over bytes for the chunked path"""
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.position = 0
+
+    def seek(self, position):
+        self.position = position
+
+    def read(self, size):
+        chunk = bytes(self.data[self.position:self.position + size])
+        self.position += len(chunk)
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def benchmark(directory, workers_list, latency=0.05, bandwidth=None, chunk_threshold=20 * 1024 * 1024):
+    """
+    Upload every file in a directory to a LocalStorageBackend with several pool sizes
+
+    Each run starts with an empty index, then repeats to measure the deduplicated pass.
+
+    Returns:
+        list: One dict per pool size with files, seconds, files/s and MB/s
+    """
+    files = sorted(path for path in Path(directory).rglob('*') if path.is_file())
+    total_bytes = sum(path.stat().st_size for path in files)
+    results = []
+    for workers in workers_list:
+        root = tempfile.mkdtemp(prefix='aniresq_upload_bench_')
+        try:
+            uploader = MediaUploader(
+                LocalStorageBackend(root, latency=latency, bandwidth=bandwidth),
+                workers=workers,
+                index_path=None,
+                chunk_threshold=chunk_threshold
+            )
+            started = time.perf_counter()
+            uploader.upload_many(files)
+            elapsed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            uploader.upload_many(files)
+            repeat = time.perf_counter() - started
+            uploader.close()
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+        results.append({
+            'workers': workers,
+            'files': len(files),
+            'seconds': round(elapsed, 2),
+            'files_per_s': round(len(files) / elapsed, 1) if elapsed > 0 else 0.0,
+            'mb_per_s': round(total_bytes / 1e6 / elapsed, 1) if elapsed > 0 else 0.0,
+            'repeat_seconds': round(repeat, 3),
+            'chunked': uploader.stats['chunked'],
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the media uploader against local storage")
+    parser.add_argument('directory', help="Directory of media files to upload")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8], help="Pool sizes to compare")
+    parser.add_argument('--latency', type=float, default=0.05, help="Simulated seconds per request")
+    parser.add_argument('--bandwidth', type=float, default=None, help="Simulated bytes/s per request")
+    parser.add_argument('--chunk-threshold-mb', type=float, default=20, help="Chunk files at least this large")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    for row in benchmark(args.directory, args.workers, args.latency, args.bandwidth,
+                         int(args.chunk_threshold_mb * 1024 * 1024)):
+        print(f"workers={row['workers']:>3}  {row['files']} files in {row['seconds']}s  "
+              f"({row['files_per_s']} files/s, {row['mb_per_s']} MB/s, {row['chunked']} chunked)  "
+              f"repeat (deduplicated): {row['repeat_seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+AniResQ ML Service - Background Alert Media
+Alerts are posted with a snapshot on a sender thread, off the detection loop;
+the clip (pre-event plus post-roll) is built, uploaded and attached to the
+alerts on a worker thread
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class MediaJob:
+    __slots__ = ('cctv_id', 'clip_buffer', 'alert_ids', 'focus', 'ready_at')
+
+    def __init__(self, cctv_id, clip_buffer, alert_ids, focus, ready_at):
+        self.cctv_id = cctv_id
+        self.clip_buffer = clip_buffer
+        self.alert_ids = alert_ids
+        self.focus = focus
+        self.ready_at = ready_at
+
+
+class AlertJob:
+    __slots__ = ('cctv_id', 'clip_buffer', 'alert', 'focus', 'ready_at')
+
+    def __init__(self, cctv_id, clip_buffer, alert, focus, ready_at):
+        self.cctv_id = cctv_id
+        self.clip_buffer = clip_buffer
+        self.alert = alert
+        self.focus = focus
+        self.ready_at = ready_at
+
+
+class MediaWorker:
+    def __init__(self, upload_fn, attach_fn, profile=None, post_roll=2.0, max_pending=16, thread_init=None,
+                 send_fn=None):
+        """
+        Post alerts and build, upload and attach their clips off the detection thread
+
+        Args:
+            upload_fn: Callable(data, resource_type) -> URL, or None on failure;
+                       resource_type is 'video' for clips and 'image' for previews
+            attach_fn: Callable(alert_ids, media) -> bool, e.g. PATCH the alerts with
+                       media = {'videoUrl': ..., 'previewUrl': ...}
+            profile: ClipProfile clips are encoded to (None = source remux / full-size encode)
+            post_roll: Seconds of footage after the alert to wait for before building the clip;
+                       the clip buffer must hold pre-event + post-roll seconds
+            max_pending: Clips waiting at most; further ones are dropped (their alerts were already sent)
+            thread_init: Optional callable run on the worker thread first (e.g. pin it to encode cores)
+            send_fn: Callable(cctv_id, alert) -> list of backend alert IDs, used by send_alert()
+        """
+        self.upload_fn = upload_fn
+        self.attach_fn = attach_fn
+        self.profile = profile
+        self.post_roll = post_roll
+        self.max_pending = max_pending
+        self.thread_init = thread_init
+        self.send_fn = send_fn
+        self.alerts = deque()
+        self.sending = False
+        self.jobs = deque()
+        self.cond = threading.Condition()
+        self.busy = False
+        self.hurry = False
+        self.stopping = False
+        self.stats = {
+            'alerts_sent': 0,
+            'alerts_failed': 0,
+            'submitted': 0,
+            'attached': 0,
+            'failed': 0,
+            'dropped': 0,
+        }
+        self.thread = threading.Thread(target=self._run, name="alert-media", daemon=True)
+        self.thread.start()
+        self.sender = None
+        if send_fn is not None:
+            self.sender = threading.Thread(target=self._send_loop, name="alert-sender", daemon=True)
+            self.sender.start()
+
+    def send_alert(self, cctv_id, clip_buffer, alert, focus=None):
+        """
+        Queue an alert for posting, then its clip once the alert has IDs
+
+        The detection loop only pays for queuing: the POST (and the backend's
+        snapshot upload) happen on the sender thread. The post-roll is counted
+        from now, not from when the POST returns.
+
+        Args:
+            cctv_id: Camera the alert came from
+            clip_buffer: Clip source to build the clip from (None = alert only)
+            alert: Opaque alert passed to send_fn
+            focus: Normalized region of the alerted animals (clip_encoder.focus_region)
+        """
+        with self.cond:
+            self.alerts.append(AlertJob(cctv_id, clip_buffer, alert, focus, time.monotonic() + self.post_roll))
+            self.cond.notify_all()
+
+    def submit(self, cctv_id, clip_buffer, alert_ids, focus=None):
+        """
+        Queue a clip for alerts that have already been posted
+
+        Args:
+            cctv_id: Camera the alerts came from
+            clip_buffer: PacketRingBuffer/JpegRingBuffer the camera keeps filling during post-roll
+            alert_ids: Backend IDs of the alerts to attach the clip to
+            focus: Normalized region of the alerted animals (clip_encoder.focus_region)
+
+        Returns:
+            bool: False if the clip was dropped because too many are pending
+        """
+        with self.cond:
+            return self._enqueue(MediaJob(cctv_id, clip_buffer, list(alert_ids), focus,
+                                          time.monotonic() + self.post_roll))
+
+    def _enqueue(self, job):
+        # Called with self.cond held
+        if len(self.jobs) >= self.max_pending:
+            self.stats['dropped'] += 1
+            logger.warning(f"Clip for CCTV {job.cctv_id} dropped: {len(self.jobs)} clips pending")
+            return False
+        self.jobs.append(job)
+        self.stats['submitted'] += 1
+        self.cond.notify_all()
+        return True
+
+    def flush(self, timeout=60.0):
+        """Post pending alerts, build their clips now (cutting post-roll short) and wait until done"""
+        with self.cond:
+            self.hurry = True
+            self.cond.notify_all()
+            done = self.cond.wait_for(
+                lambda: not self.alerts and not self.sending and not self.jobs and not self.busy, timeout
+            )
+            self.hurry = False
+        return done
+
+    def stop(self, timeout=60.0):
+        """Finish pending clips, then stop the worker"""
+        self.flush(timeout)
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+        if self.sender is not None:
+            self.sender.join(timeout)
+
+    def _process(self, job):
+        started = time.monotonic()
+        try:
+            clip = job.clip_buffer.clip(self.profile, job.focus)
+        except Exception as e:
+            logger.error(f"Clip for CCTV {job.cctv_id} could not be built: {e}")
+            clip = None
+        if not clip:
+            self.stats['failed'] += 1
+            return
+
+        media = {'videoUrl': self.upload_fn(clip, 'video')}
+        if not media['videoUrl']:
+            self.stats['failed'] += 1
+            return
+
+        uploaded = len(clip)
+        if self.profile is not None and self.profile.preview:
+            # The preview is optional: a failure here still attaches the clip
+            try:
+                preview = job.clip_buffer.preview(self.profile, job.focus)
+            except Exception as e:
+                logger.warning(f"Preview for CCTV {job.cctv_id} could not be built: {e}")
+                preview = None
+            preview_url = self.upload_fn(preview, 'image') if preview else None
+            if preview_url:
+                media['previewUrl'] = preview_url
+                uploaded += len(preview)
+
+        if not self.attach_fn(job.alert_ids, media):
+            self.stats['failed'] += 1
+            return
+
+        self.stats['attached'] += 1
+        logger.info(f"Clip for CCTV {job.cctv_id} ({uploaded / 1024:.0f} KiB uploaded) attached to "
+                    f"{len(job.alert_ids)} alert(s) in {time.monotonic() - started:.1f}s")
+
+    def _send_loop(self):
+        while True:
+            with self.cond:
+                while not self.alerts and not self.stopping:
+                    self.cond.wait()
+                if not self.alerts:
+                    return
+                job = self.alerts.popleft()
+                self.sending = True
+
+            try:
+                alert_ids = self.send_fn(job.cctv_id, job.alert)
+            except Exception as e:
+                logger.error(f"Alert for CCTV {job.cctv_id} failed: {e}")
+                alert_ids = None
+
+            with self.cond:
+                if alert_ids:
+                    self.stats['alerts_sent'] += 1
+                    if job.clip_buffer is not None:
+                        self._enqueue(MediaJob(job.cctv_id, job.clip_buffer, list(alert_ids),
+                                               job.focus, job.ready_at))
+                else:
+                    self.stats['alerts_failed'] += 1
+                self.sending = False
+                self.cond.notify_all()
+
+    def _run(self):
+        if self.thread_init is not None:
+            self.thread_init()
+        while True:
+            with self.cond:
+                while not self.jobs and not self.stopping:
+                    self.cond.wait()
+                if not self.jobs:
+                    return
+                delay = self.jobs[0].ready_at - time.monotonic()
+                if delay > 0 and not self.hurry:
+                    # Still recording post-roll; new jobs are never due earlier than the head
+                    self.cond.wait(delay)
+                    continue
+                job = self.jobs.popleft()
+                self.busy = True
+
+            try:
+                self._process(job)
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Clip job for CCTV {job.cctv_id} failed: {e}")
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
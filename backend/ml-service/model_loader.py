@@ -0,0 +1,140 @@
+"""
+AniResQ ML Service - Model Loading and Warmup
+Loads a YOLO model once, off the request path, and runs warmup inferences so
+the first real request does not pay for lazy initialisation
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def parse_image_sizes(spec):
+    """
+    Parse a WARMUP_IMAGE_SIZES value such as "640" or "320,640,1280"
+
+    Returns:
+        list: Image sizes in pixels (invalid entries are skipped)
+    """
+    sizes = []
+    for entry in str(spec).split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            sizes.append(int(entry))
+        except ValueError:
+            logger.warning(f"Ignoring invalid warmup image size '{entry}'")
+    return sizes
+
+
+def warmup(model, image_sizes, runs=1):
+    """
+    Run inferences on blank frames at each image size
+
+    The first call at a size builds the predictor, allocates buffers and lets
+    PyTorch pick kernels; doing it here keeps that cost off the first request.
+
+    Args:
+        model: ultralytics YOLO model
+        image_sizes: Inference sizes to warm up
+        runs: Inferences per size
+
+    Returns:
+        dict: {size: milliseconds of the first inference at that size}
+    """
+    import numpy as np
+
+    timings = {}
+    for size in image_sizes:
+        frame = np.zeros((size, size, 3), dtype=np.uint8)
+        for run in range(max(1, runs)):
+            started = time.perf_counter()
+            model.predict(frame, imgsz=size, verbose=False)
+            if run == 0:
+                timings[size] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
+
+
+class ModelLoader:
+    def __init__(self, model_path, image_sizes=(640,), warmup_runs=1):
+        """
+        Load and warm up a model on a background thread
+
+        Args:
+            model_path: Path to the YOLO weights
+            image_sizes: Inference sizes to warm up (empty = no warmup)
+            warmup_runs: Inferences per size
+        """
+        self.model_path = model_path
+        self.image_sizes = list(image_sizes)
+        self.warmup_runs = warmup_runs
+        self.model = None
+        self.state = 'pending'  # pending -> loading -> warming -> ready | failed
+        self.error = None
+        self.timings = {}
+        self.ready_event = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Start loading in the background; a no-op if already started"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.load, name="model-loader", daemon=True)
+        self.thread.start()
+
+    def load(self):
+        """Import, load and warm up the model on the calling thread"""
+        started = time.perf_counter()
+        try:
+            self.state = 'loading'
+            from ultralytics import YOLO
+            self.timings['import_s'] = round(time.perf_counter() - started, 2)
+
+            logger.info(f"Loading model from {self.model_path}")
+            load_started = time.perf_counter()
+            model = YOLO(self.model_path)
+            self.timings['load_s'] = round(time.perf_counter() - load_started, 2)
+
+            if self.image_sizes:
+                self.state = 'warming'
+                warmup_started = time.perf_counter()
+                self.timings['warmup_ms'] = warmup(model, self.image_sizes, self.warmup_runs)
+                self.timings['warmup_s'] = round(time.perf_counter() - warmup_started, 2)
+
+            self.model = model
+            self.state = 'ready'
+            self.timings['total_s'] = round(time.perf_counter() - started, 2)
+            logger.info(f"Model ready in {self.timings['total_s']}s "
+                        f"(load {self.timings['load_s']}s, warmup {self.timings.get('warmup_s', 0)}s)")
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            logger.error(f"Failed to load model: {e}")
+        finally:
+            self.ready_event.set()
+        return self.model
+
+    def wait(self, timeout=None):
+        """Block until loading finished (successfully or not); returns True if the model is ready"""
+        self.ready_event.wait(timeout)
+        return self.ready()
+
+    def ready(self):
+        return self.state == 'ready'
+
+    def status(self):
+        """Readiness report: state, model path, timings and the error if loading failed"""
+        status = {
+            'state': self.state,
+            'model_path': self.model_path,
+            'image_sizes': self.image_sizes,
+            'timings': dict(self.timings),
+        }
+        if self.error:
+            status['error'] = self.error
+        return status
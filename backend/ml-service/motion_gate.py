@@ -0,0 +1,90 @@
+"""
+AniResQ ML Service - Motion Gate
+Cheap inter-frame change check that decides whether a frame is worth running YOLO on
+"""
+
+import logging
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MotionGate:
+    def __init__(self, threshold=0.01, pixel_delta=25, width=160, force_interval=60.0, method='diff'):
+        """
+        Skip inference while the scene is static
+
+        Args:
+            threshold: Fraction of changed pixels that counts as motion
+            pixel_delta: Gray-level difference for a pixel to count as changed ('diff' method)
+            width: Width of the downscaled grayscale copy used for the comparison
+            force_interval: Seconds after which inference runs regardless of motion (0 = never force)
+            method: 'diff' (difference against the last checked frame) or 'mog2' (background subtraction)
+        """
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.width = width
+        self.force_interval = force_interval
+        self.method = method
+        self.reference = None
+        self.subtractor = None
+        if method == 'mog2':
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(history=200, detectShadows=False)
+        self.last_inference = 0.0
+        self.motion_detected = False
+        self.last_mask = None
+        self.stats = {
+            'checked': 0,
+            'skipped': 0,
+            'forced': 0,
+        }
+
+    def _prepare(self, frame):
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def motion_mask(self, frame):
+        """Return the downscaled binary mask (uint8, 0/255) of changed pixels"""
+        small = self._prepare(frame)
+        if self.subtractor is not None:
+            return self.subtractor.apply(small)
+
+        reference, self.reference = self.reference, small
+        if reference is None or reference.shape != small.shape:
+            return np.full(small.shape, 255, dtype=np.uint8)
+        _, mask = cv2.threshold(cv2.absdiff(small, reference), self.pixel_delta, 255, cv2.THRESH_BINARY)
+        return mask
+
+    def should_infer(self, frame):
+        """
+        Decide whether a frame should go to the detector
+
+        Returns:
+            bool: True on motion or when force_interval has elapsed since the last inference
+        """
+        self.stats['checked'] += 1
+        mask = self.last_mask = self.motion_mask(frame)
+        self.motion_detected = np.count_nonzero(mask) / mask.size >= self.threshold
+
+        now = time.monotonic()
+        if self.motion_detected:
+            self.last_inference = now
+            return True
+
+        if self.force_interval > 0 and now - self.last_inference >= self.force_interval:
+            self.stats['forced'] += 1
+            self.last_inference = now
+            return True
+
+        self.stats['skipped'] += 1
+        return False
+
+    def savings(self):
+        """Fraction of checked frames for which inference was skipped"""
+        return self.stats['skipped'] / self.stats['checked'] if self.stats['checked'] else 0.0
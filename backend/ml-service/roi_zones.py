@@ -0,0 +1,122 @@
+"""
+AniResQ ML Service - Per-camera Regions of Interest and Alert Zones
+Restricts model input to the ROI's bounding region and tests every box
+against the ROI and alert zones in one vectorized pass
+"""
+
+import logging
+
+import cv2
+import numpy as np
+import shapely
+from shapely import affinity
+
+logger = logging.getLogger(__name__)
+
+
+def _polygons(spec):
+    """Accept one polygon ([[x, y], ...]) or a list of polygons"""
+    if not spec:
+        return []
+    if isinstance(spec[0][0], (int, float)):
+        spec = [spec]
+    return [shapely.Polygon(points) for points in spec]
+
+
+class CameraZones:
+    def __init__(self, roi=None, zones=None, mask_outside=True):
+        """
+        ROI and alert zones for one camera, in normalized (0-1) frame coordinates
+
+        Args:
+            roi: Polygon or list of polygons the model should look at (None = whole frame)
+            zones: {zone_name: polygon}; a box alerts only if its ground point (bottom
+                   centre) lies in a zone. Without zones any box touching the ROI alerts
+            mask_outside: Black out pixels inside the ROI's bounding box but outside the ROI
+        """
+        roi_polygons = _polygons(roi)
+        self.roi = shapely.union_all(roi_polygons) if roi_polygons else None
+        self.zones = [shapely.union_all(_polygons(polygon)) for polygon in (zones or {}).values()]
+        self.mask_outside = mask_outside
+        self._scaled = {}  # (height, width) -> geometry and masks in pixels
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build from a camera_settings entry, or return None if it defines no ROI or zones"""
+        if not settings or not (settings.get('roi') or settings.get('zones')):
+            return None
+        return cls(settings.get('roi'), settings.get('zones'), settings.get('roi_mask', True))
+
+    def _geometry(self, frame_shape):
+        height, width = frame_shape[:2]
+        cached = self._scaled.get((height, width))
+        if cached is not None:
+            return cached
+
+        def scale(geometry):
+            geometry = affinity.scale(geometry, xfact=width, yfact=height, origin=(0, 0))
+            shapely.prepare(geometry)
+            return geometry
+
+        roi = scale(self.roi) if self.roi is not None else None
+        zones = [scale(zone) for zone in self.zones]
+
+        crop = None
+        mask = None
+        if roi is not None:
+            x1, y1, x2, y2 = roi.bounds
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            x2, y2 = min(width, int(np.ceil(x2))), min(height, int(np.ceil(y2)))
+            crop = (x1, y1, x2, y2)
+            if self.mask_outside and not roi.equals(shapely.box(x1, y1, x2, y2)):
+                mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+                for polygon in getattr(roi, 'geoms', [roi]):
+                    points = np.asarray(polygon.exterior.coords, dtype=np.float64) - (x1, y1)
+                    cv2.fillPoly(mask, [points.round().astype(np.int32)], 255)
+
+        cached = {'roi': roi, 'zones': zones, 'crop': crop, 'mask': mask}
+        self._scaled[(height, width)] = cached
+        return cached
+
+    def crop(self, frame):
+        """
+        Cut the frame down to the ROI's bounding region
+
+        Returns:
+            tuple: (model input, (x_offset, y_offset)) - add the offset to boxes
+                   found in the input to get frame coordinates
+        """
+        geometry = self._geometry(frame.shape)
+        if geometry['crop'] is None:
+            return frame, (0, 0)
+        x1, y1, x2, y2 = geometry['crop']
+        cropped = frame[y1:y2, x1:x2]
+        if geometry['mask'] is not None:
+            cropped = cv2.bitwise_and(cropped, cropped, mask=geometry['mask'])
+        return cropped, (x1, y1)
+
+    def alert_mask(self, detections, frame_shape):
+        """
+        Boolean mask of the rows of a DetectionResult that may raise alerts
+
+        Returns:
+            np.ndarray: True for boxes inside an alert zone (or touching the ROI when
+                        no zones are configured)
+        """
+        geometry = self._geometry(frame_shape)
+        boxes = detections.boxes
+        if not len(boxes):
+            return np.zeros(0, dtype=bool)
+
+        if geometry['zones']:
+            x = (boxes[:, 0] + boxes[:, 2]) / 2
+            y = boxes[:, 3]
+            inside = np.zeros(len(boxes), dtype=bool)
+            for zone in geometry['zones']:
+                inside |= shapely.contains_xy(zone, x, y)
+            return inside
+
+        if geometry['roi'] is not None:
+            return shapely.intersects(geometry['roi'], shapely.box(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]))
+
+        return np.ones(len(boxes), dtype=bool)
@@ -0,0 +1,146 @@
+"""
+AniResQ ML Service - Activity-adaptive Sampling Scheduler
+Decides by wall clock when each camera's next frame should be inferred,
+sharing one node-wide inference budget across all cameras
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingScheduler:
+    def __init__(self, fps_budget=0, idle_fps=1.0, active_fps=5.0, min_fps=0.1, active_hold=10.0):
+        """
+        Per-camera sampling rates that follow activity under one node-wide budget
+
+        Args:
+            fps_budget: Node-wide inferences per second shared by all cameras (0 = unlimited)
+            idle_fps: Default sampling rate for a camera without an active animal track
+            active_fps: Default sampling rate while a camera has an active track
+            min_fps: Floor every camera keeps even when the budget is exhausted
+            active_hold: Seconds a camera stays active after its last detection
+        """
+        self.fps_budget = fps_budget
+        self.idle_fps = idle_fps
+        self.active_fps = active_fps
+        self.min_fps = min_fps
+        self.active_hold = active_hold
+        self.lock = threading.Lock()
+        self.cameras = {}
+        self.rates = {}
+        self.allocated_at = 0.0
+        self.dirty = True
+
+    def register(self, cctv_id, idle_fps=None, active_fps=None):
+        """Add a camera, optionally with its own idle/active rates"""
+        with self.lock:
+            self.cameras[cctv_id] = {
+                'idle_fps': idle_fps or self.idle_fps,
+                'active_fps': active_fps or self.active_fps,
+                'active_until': 0.0,
+                'next_due': time.monotonic(),
+            }
+            self.dirty = True
+
+    def unregister(self, cctv_id):
+        with self.lock:
+            self.cameras.pop(cctv_id, None)
+            self.rates.pop(cctv_id, None)
+            self.dirty = True
+
+    def mark_active(self, cctv_id):
+        """Record a detection; the camera samples at its active rate for active_hold seconds"""
+        now = time.monotonic()
+        with self.lock:
+            camera = self.cameras.get(cctv_id)
+            if camera is None:
+                return
+            if camera['active_until'] <= now:
+                self.dirty = True
+            camera['active_until'] = now + self.active_hold
+            if self.dirty:
+                self._allocate(now)
+                # Pull the next sample forward to the new, faster cadence
+                camera['next_due'] = min(camera['next_due'], now + 1.0 / self.rates[cctv_id])
+
+    def is_active(self, cctv_id):
+        camera = self.cameras.get(cctv_id)
+        return camera is not None and camera['active_until'] > time.monotonic()
+
+    def rate(self, cctv_id):
+        """Current sampling rate (frames per second) granted to a camera"""
+        with self.lock:
+            self._refresh(time.monotonic())
+            return self.rates.get(cctv_id, 0.0)
+
+    def next_delay(self, cctv_id):
+        """Seconds until the camera's next frame is due (0 if already due)"""
+        camera = self.cameras.get(cctv_id)
+        if camera is None:
+            return 0.0
+        return max(0.0, camera['next_due'] - time.monotonic())
+
+    def is_due(self, cctv_id):
+        """
+        Check whether the camera should infer now; claims the slot if so
+
+        Returns:
+            bool: True if a frame should be processed now
+        """
+        now = time.monotonic()
+        with self.lock:
+            camera = self.cameras.get(cctv_id)
+            if camera is None or now < camera['next_due']:
+                return False
+            self._refresh(now)
+            rate = self.rates.get(cctv_id) or self.min_fps
+            camera['next_due'] = now + 1.0 / rate
+            return True
+
+    def _refresh(self, now):
+        # Re-run the allocation on changes, and every second to expire active holds
+        if self.dirty or now - self.allocated_at >= 1.0:
+            self._allocate(now)
+
+    def _allocate(self, now):
+        active = {}
+        idle = {}
+        for cctv_id, camera in self.cameras.items():
+            if camera['active_until'] > now:
+                active[cctv_id] = camera['active_fps']
+            else:
+                idle[cctv_id] = camera['idle_fps']
+
+        demands = {**idle, **active}
+        if not self.fps_budget or sum(demands.values()) <= self.fps_budget:
+            self.rates = demands
+        else:
+            # Every camera keeps the floor; active cameras are then served first
+            # and idle cameras share whatever budget is left
+            rates = {cctv_id: min(self.min_fps, demand) for cctv_id, demand in demands.items()}
+            remaining = max(0.0, self.fps_budget - sum(rates.values()))
+            for group in (active, idle):
+                extra = {cctv_id: demand - rates[cctv_id] for cctv_id, demand in group.items()}
+                granted = self._water_fill(extra, remaining)
+                for cctv_id, rate in granted.items():
+                    rates[cctv_id] += rate
+                remaining -= sum(granted.values())
+            self.rates = rates
+
+        self.allocated_at = now
+        self.dirty = False
+
+    @staticmethod
+    def _water_fill(demands, budget):
+        """Split budget so small demands are met in full and large ones share the rest"""
+        granted = {}
+        pending = len(demands)
+        for cctv_id, demand in sorted(demands.items(), key=lambda item: item[1]):
+            rate = min(demand, budget / pending) if budget > 0 else 0.0
+            granted[cctv_id] = rate
+            budget -= rate
+            pending -= 1
+        return granted
@@ -0,0 +1,291 @@
+"""
+AniResQ ML Service - Stream Health Manager
+Watches every camera for failed or stalled reads and reconnects in the background
+"""
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CONNECTING = 'connecting'
+HEALTHY = 'healthy'
+STALLED = 'stalled'
+RECONNECTING = 'reconnecting'
+STOPPED = 'stopped'
+
+
+class ManagedStream:
+    def __init__(self, manager, cctv_id, opener):
+        """
+        cv2.VideoCapture-compatible wrapper whose connection is kept alive by a manager
+
+        Args:
+            manager: Owning StreamHealthManager
+            cctv_id: Unique ID for this CCTV camera
+            opener: Callable returning a freshly opened capture object
+        """
+        self.manager = manager
+        self.cctv_id = cctv_id
+        self.opener = opener
+        self.cap = None
+        self.state = CONNECTING
+        self.cond = threading.Condition()
+        self.generation = 0
+        self.read_started = None
+        self.read_generation = 0
+        self.last_frame_time = None
+        self.attempts = 0
+        self.connected_once = False
+        self.reconnects = 0
+        self.dead_since = time.monotonic()
+        self.dead_time = 0.0
+
+    def __getattr__(self, name):
+        # Pass capture-specific extras (mark_activity, keyframes_only, stats) through
+        cap = self.__dict__.get('cap')
+        if cap is None:
+            raise AttributeError(name)
+        return getattr(cap, name)
+
+    def isOpened(self):
+        return self.state != STOPPED
+
+    def get(self, prop):
+        cap = self.cap
+        return cap.get(prop) if cap is not None else 0
+
+    def read(self, connect_wait=1.0):
+        """Return (ret, frame); fails fast while the stream is being reconnected"""
+        with self.cond:
+            if self.state != HEALTHY:
+                self.cond.wait(connect_wait)
+                if self.state != HEALTHY:
+                    return False, None
+            cap = self.cap
+            generation = self.generation
+            self.read_started = time.monotonic()
+            self.read_generation = generation
+
+        try:
+            ret, frame = cap.read()
+        except Exception as e:
+            logger.warning(f"Read error on CCTV {self.cctv_id}: {e}")
+            ret, frame = False, None
+
+        with self.cond:
+            self.read_started = None
+            if generation != self.generation:
+                # The watchdog replaced this capture while the read was stuck;
+                # the stuck reader is the one allowed to release it
+                stale = cap
+            else:
+                stale = None
+                if ret:
+                    self.last_frame_time = time.monotonic()
+
+        if stale is not None:
+            self.manager.release_capture(stale)
+            return False, None
+
+        if not ret:
+            self.manager.report_failure(self, 'read failed')
+        return ret, frame
+
+    def release(self):
+        self.manager.close(self)
+
+
+class StreamHealthManager:
+    def __init__(self, stall_timeout=30, backoff_base=0.5, backoff_max=60.0,
+                 watchdog_interval=1.0, reconnect_workers=4):
+        """
+        Track per-camera stream health and reconnect without blocking other cameras
+
+        Args:
+            stall_timeout: Seconds a read may hang before the stream is declared stalled
+            backoff_base: Delay before the second reconnect attempt (the first is immediate)
+            backoff_max: Upper bound for the reconnect delay
+            watchdog_interval: Seconds between watchdog sweeps
+            reconnect_workers: Threads shared by all cameras for (re)opening streams
+        """
+        self.stall_timeout = stall_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.watchdog_interval = watchdog_interval
+        self.streams = {}
+        self.retries = []  # heap of (due_time, seq, stream) waiting for a reconnect slot
+        self.retry_seq = itertools.count()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=reconnect_workers, thread_name_prefix='reconnect')
+        self.watchdog = threading.Thread(target=self._watch, name="stream-watchdog", daemon=True)
+        self.watchdog.start()
+
+    def open(self, cctv_id, opener):
+        """Register a camera and connect it in the background"""
+        stream = ManagedStream(self, cctv_id, opener)
+        with self.lock:
+            previous = self.streams.get(cctv_id)
+            self.streams[cctv_id] = stream
+        if previous is not None:
+            self.close(previous)
+        self._schedule(stream, 0.0)
+        return stream
+
+    def close(self, stream):
+        """Stop managing a stream and release its capture"""
+        with self.lock:
+            if self.streams.get(stream.cctv_id) is stream:
+                del self.streams[stream.cctv_id]
+        with stream.cond:
+            stream.state = STOPPED
+            cap, stream.cap = stream.cap, None
+            stream.generation += 1
+            reading = stream.read_started is not None
+            stream.cond.notify_all()
+        if cap is not None and not reading:
+            self.release_capture(cap)
+
+    def release_capture(self, cap):
+        try:
+            cap.release()
+        except Exception as e:
+            logger.debug(f"Error releasing capture: {e}")
+
+    def report_failure(self, stream, reason, state=RECONNECTING, since=None):
+        """Take a stream out of service and schedule a reconnect (once)"""
+        with stream.cond:
+            if stream.state != HEALTHY:
+                return
+            stream.state = state
+            stream.dead_since = since or time.monotonic()
+        logger.warning(f"CCTV {stream.cctv_id} {reason}, reconnecting in background")
+        self._schedule(stream, 0.0)
+
+    def _backoff(self, attempts):
+        if attempts <= 0:
+            return 0.0
+        # Cap the exponent: attempts keeps growing for as long as a camera stays offline
+        delay = min(self.backoff_max, self.backoff_base * (2 ** min(attempts - 1, 20)))
+        return delay * random.uniform(0.5, 1.5)
+
+    def _schedule(self, stream, delay):
+        if self.stop_event.is_set():
+            return
+        if delay <= 0:
+            self.executor.submit(self._reconnect, stream)
+            return
+        # Backed-off retries wait in a heap drained by the watchdog, so sleeping
+        # cameras never tie up the shared reconnect threads
+        with self.lock:
+            heapq.heappush(self.retries, (time.monotonic() + delay, next(self.retry_seq), stream))
+
+    def _reconnect(self, stream):
+        # Runs on the executor, whose Future would swallow an exception: always leave a retry behind
+        try:
+            self._connect(stream)
+        except Exception as e:
+            logger.error(f"Reconnect of CCTV {stream.cctv_id} failed unexpectedly: {e}")
+            if stream.state in (HEALTHY, STOPPED):
+                return
+            stream.attempts += 1
+            self._schedule(stream, self._backoff(stream.attempts) or self.backoff_base)
+
+    def _connect(self, stream):
+        if stream.state == STOPPED:
+            return
+
+        with stream.cond:
+            old_cap, stream.cap = stream.cap, None
+            stream.generation += 1
+            reading = stream.read_started is not None
+        if old_cap is not None and not reading:
+            self.release_capture(old_cap)
+
+        try:
+            cap = stream.opener()
+            opened = cap.isOpened()
+        except Exception as e:
+            logger.error(f"Failed to open CCTV {stream.cctv_id}: {e}")
+            cap, opened = None, False
+
+        with stream.cond:
+            if stream.state == STOPPED:
+                opened = False
+            elif opened:
+                stream.cap = cap
+                stream.state = HEALTHY
+                stream.attempts = 0
+                stream.dead_time += time.monotonic() - stream.dead_since
+                if stream.connected_once:
+                    stream.reconnects += 1
+                stream.connected_once = True
+                stream.cond.notify_all()
+
+        if opened:
+            logger.info(f"CCTV {stream.cctv_id} connected")
+            return
+
+        if cap is not None:
+            self.release_capture(cap)
+        if stream.state == STOPPED:
+            return
+
+        stream.attempts += 1
+        retry_in = self._backoff(stream.attempts)
+        logger.warning(f"CCTV {stream.cctv_id} connect attempt {stream.attempts} failed, retrying in {retry_in:.1f}s")
+        self._schedule(stream, retry_in)
+
+    def _watch(self):
+        while not self.stop_event.wait(self.watchdog_interval):
+            now = time.monotonic()
+            with self.lock:
+                streams = list(self.streams.values())
+                due = []
+                while self.retries and self.retries[0][0] <= now:
+                    due.append(heapq.heappop(self.retries)[2])
+            for stream in due:
+                self.executor.submit(self._reconnect, stream)
+
+            for stream in streams:
+                started = stream.read_started
+                # A read still stuck on an already replaced capture doesn't count again
+                if (stream.state == HEALTHY and started is not None
+                        and stream.read_generation == stream.generation
+                        and now - started > self.stall_timeout):
+                    self.report_failure(stream, f"read stalled for {now - started:.0f}s",
+                                        state=STALLED, since=started)
+
+    def metrics(self):
+        """Return {cctv_id: {state, dead_time, reconnects, last_frame_age}}"""
+        now = time.monotonic()
+        with self.lock:
+            streams = list(self.streams.values())
+
+        metrics = {}
+        for stream in streams:
+            dead_time = stream.dead_time
+            if stream.state != HEALTHY:
+                dead_time += now - stream.dead_since
+            metrics[stream.cctv_id] = {
+                'state': stream.state,
+                'dead_time': round(dead_time, 1),
+                'reconnects': stream.reconnects,
+                'last_frame_age': round(now - stream.last_frame_time, 1) if stream.last_frame_time else None,
+            }
+        return metrics
+
+    def shutdown(self):
+        """Close every stream and stop the watchdog"""
+        self.stop_event.set()
+        with self.lock:
+            streams = list(self.streams.values())
+        for stream in streams:
+            self.close(stream)
+        self.executor.shutdown(wait=False)
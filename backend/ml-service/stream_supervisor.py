@@ -0,0 +1,218 @@
+"""
+AniResQ ML Service - Multi-camera Stream Supervisor
+Runs every configured CCTV stream concurrently against one shared MLService
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def parse_stream_specs(stream_urls):
+    """
+    Turn CCTV_STREAM_URLS entries into (cctv_id, stream_url) pairs
+
+    Args:
+        stream_urls: List of entries, either plain URLs or "cctv_id=url" pairs
+
+    Returns:
+        list: (cctv_id, stream_url) tuples, plain URLs are numbered cctv_001, cctv_002, ...
+    """
+    specs = []
+    for index, entry in enumerate(stream_urls, 1):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        name, sep, url = entry.partition('=')
+        if sep and name and '://' not in name:
+            specs.append((name.strip(), url.strip()))
+        else:
+            specs.append((f"cctv_{index:03d}", entry))
+    return specs
+
+
+def load_camera_settings(path):
+    """
+    Load per-camera overrides from a JSON file
+
+    The file maps camera IDs to option dicts, e.g.
+    {"cctv_001": {"motion_gate": true, "motion_threshold": 0.02}}
+
+    Args:
+        path: Path to the JSON file; empty or missing means no overrides
+
+    Returns:
+        dict: {cctv_id: {option: value}}
+    """
+    if not path or not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as f:
+            settings = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to load camera settings from {path}: {e}")
+        return {}
+    if not isinstance(settings, dict):
+        logger.error(f"Camera settings in {path} must be a JSON object")
+        return {}
+    return settings
+
+
+class CameraWorker:
+    def __init__(self, service, cctv_id, stream_url, fps=1):
+        """
+        Run one camera's stream loop on its own thread
+
+        Args:
+            service: Shared MLService instance (one model for all cameras)
+            cctv_id: Unique ID for this CCTV camera
+            stream_url: URL of the CCTV stream
+            fps: Frames per second to process
+        """
+        self.service = service
+        self.cctv_id = cctv_id
+        self.stream_url = stream_url
+        self.fps = fps
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.restarts = 0
+
+    def start(self):
+        """Start the capture/inference thread for this camera"""
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self.service.process_cctv_stream,
+            args=(self.cctv_id, self.stream_url),
+            kwargs={'fps': self.fps, 'stop_event': self.stop_event},
+            name=f"camera-{self.cctv_id}",
+            daemon=True
+        )
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Signal the stream loop to exit and wait for it"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+
+class StreamSupervisor:
+    def __init__(self, service, fps=1, restart_delay=5, health_log_interval=60):
+        """
+        Supervise many CCTV streams sharing a single MLService
+
+        Args:
+            service: Shared MLService instance
+            fps: Frames per second to process per camera
+            restart_delay: Seconds to wait before restarting a camera whose loop exited
+            health_log_interval: Seconds between stream health summaries in the log
+        """
+        self.service = service
+        self.fps = fps
+        self.restart_delay = restart_delay
+        self.health_log_interval = health_log_interval
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.shutdown_event = threading.Event()
+
+    def add_camera(self, cctv_id, stream_url):
+        """Start processing a camera; a no-op if it is already running"""
+        with self.lock:
+            if cctv_id in self.workers:
+                logger.warning(f"CCTV {cctv_id} is already supervised")
+                return False
+
+            worker = CameraWorker(self.service, cctv_id, stream_url, fps=self.fps)
+            self.workers[cctv_id] = worker
+
+        worker.start()
+        logger.info(f"Camera {cctv_id} started ({len(self.workers)} active)")
+        return True
+
+    def remove_camera(self, cctv_id, timeout=10):
+        """Stop processing a camera without touching the others"""
+        with self.lock:
+            worker = self.workers.pop(cctv_id, None)
+
+        if worker is None:
+            return False
+
+        worker.stop(timeout)
+        self.service.release_camera(cctv_id)
+        logger.info(f"Camera {cctv_id} stopped ({len(self.workers)} active)")
+        return True
+
+    def cameras(self):
+        """Return {cctv_id: stream_url} for every supervised camera"""
+        with self.lock:
+            return {cctv_id: w.stream_url for cctv_id, w in self.workers.items()}
+
+    def check_workers(self):
+        """Restart camera loops that exited without being asked to stop"""
+        with self.lock:
+            workers = list(self.workers.values())
+
+        for worker in workers:
+            if worker.is_alive() or worker.stop_event.is_set():
+                continue
+            worker.restarts += 1
+            logger.warning(f"Stream loop for CCTV {worker.cctv_id} exited, restarting (#{worker.restarts})")
+            worker.start()
+
+    def log_health(self):
+        """Log each camera's stream state and accumulated dead time, plus inference stats"""
+        for cctv_id, health in sorted(self.service.stream_health().items()):
+            logger.info(f"CCTV {cctv_id}: {health['state']}, dead {health['dead_time']}s, "
+                        f"{health['reconnects']} reconnect(s)")
+        stats = self.service.inference_stats()
+        for priority, latency in stats.get('queue', {}).items():
+            logger.info(f"Inference queue [{priority}]: {latency['count']} frames, avg {latency['avg_ms']} ms, "
+                        f"p95 {latency['p95_ms']} ms, max {latency['max_ms']} ms")
+        latency = stats.get('latency')
+        if latency:
+            logger.info(f"Inference latency: p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, "
+                        f"p99 {latency['p99_ms']} ms, jitter {latency['jitter_ms']} ms")
+        cascade = stats.get('cascade')
+        if cascade:
+            logger.info(f"Cascade gate: {cascade['passed']}/{cascade['frames']} frames passed "
+                        f"({cascade['pass_rate']:.0%}), est. speedup {cascade['speedup']}x")
+
+    def run_forever(self, check_interval=None):
+        """Block until stop_all() is called, restarting dead camera loops"""
+        check_interval = check_interval or self.restart_delay
+        next_health_log = time.monotonic() + self.health_log_interval
+        try:
+            while not self.shutdown_event.wait(check_interval):
+                self.check_workers()
+                if time.monotonic() >= next_health_log:
+                    self.log_health()
+                    next_health_log = time.monotonic() + self.health_log_interval
+        except KeyboardInterrupt:
+            logger.info("Supervisor interrupted")
+        finally:
+            self.stop_all()
+
+    def stop_all(self, timeout=10):
+        """Stop every camera"""
+        self.shutdown_event.set()
+        for cctv_id in list(self.cameras()):
+            self.remove_camera(cctv_id, timeout=timeout)
+
+
+def run_supervisor(service, stream_specs, fps=1):
+    """Start every (cctv_id, stream_url) pair and block until interrupted"""
+    supervisor = StreamSupervisor(service, fps=fps)
+    for cctv_id, stream_url in stream_specs:
+        supervisor.add_camera(cctv_id, stream_url)
+        # Stagger connection attempts so cameras don't all hit the NVR at once
+        time.sleep(0.1)
+    supervisor.run_forever()
+    return supervisor
@@ -0,0 +1,113 @@
+"""
+Tests for batched alert delivery: one request per alert event, with or without a snapshot
+"""
+
+import json
+
+import pytest
+
+import live_detection
+from live_detection import LiveAnimalDetector
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+        self.text = json.dumps(self.body)
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    calls = []
+
+    def post(url, **kwargs):
+        calls.append((url, kwargs))
+        count = len(json.loads(kwargs['data']['detections']) if 'data' in kwargs else kwargs['json']['detections'])
+        return FakeResponse(201, {'data': [{'_id': f"id{index}"} for index in range(count)]})
+
+    monkeypatch.setattr(live_detection.requests, 'post', post)
+    return calls
+
+
+@pytest.fixture
+def detector():
+    # Only what send_alert needs; no model is loaded
+    detector = LiveAnimalDetector.__new__(LiveAnimalDetector)
+    detector.backend_url = 'http://backend'
+    detector.stats = {'alerts_sent': 0}
+    return detector
+
+
+DETECTIONS = [
+    {'track_id': 1, 'animal': 'tiger', 'confidence': 0.91},
+    {'track_id': 2, 'animal': 'hyena', 'confidence': 0.734},
+]
+
+
+def test_event_is_sent_as_one_json_request(detector, posts):
+    ids = detector.send_alert(DETECTIONS, 'cam1', location={'locationName': 'Gate', 'latitude': 1.5})
+
+    assert ids == ['id0', 'id1']
+    assert len(posts) == 1
+    url, kwargs = posts[0]
+    assert url == 'http://backend/api/wildDetection/detections/batch'
+    body = kwargs['json']
+    assert body['cctv_id'] == 'cam1'
+    assert body['locationName'] == 'Gate'
+    assert [d['animal'] for d in body['detections']] == ['tiger', 'hyena']
+    assert [d['confidence'] for d in body['detections']] == [91.0, 73.4]
+    assert detector.stats['alerts_sent'] == 2
+
+
+def test_snapshot_is_shared_by_the_whole_event(detector, posts):
+    ids = detector.send_alert(DETECTIONS, 'cam1', snapshot=b'jpeg')
+
+    assert ids == ['id0', 'id1']
+    url, kwargs = posts[0]
+    assert kwargs['files']['media'] == ('cam1.jpg', b'jpeg', 'image/jpeg')
+    # Multipart fields are flat: detections travel as JSON, unset location fields are left out
+    assert json.loads(kwargs['data']['detections'])[1]['animal'] == 'hyena'
+    assert 'locationName' not in kwargs['data']
+
+
+def test_no_detections_sends_nothing(detector, posts):
+    assert detector.send_alert([], 'cam1') == []
+    assert posts == []
+
+
+@pytest.mark.parametrize('outcome', ['rejected', 'unreachable'])
+def test_failed_request_returns_no_ids(detector, monkeypatch, outcome):
+    def post(url, **kwargs):
+        if outcome == 'unreachable':
+            raise live_detection.requests.ConnectionError("backend down")
+        return FakeResponse(400, {'success': False})
+
+    monkeypatch.setattr(live_detection.requests, 'post', post)
+
+    assert detector.send_alert(DETECTIONS, 'cam1') == []
+    assert detector.stats['alerts_sent'] == 0
+
+
+def test_ml_service_posts_to_the_batch_endpoint(posts, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app.requests, 'post', live_detection.requests.post)
+    service = app.MLService.__new__(app.MLService)
+    service.backend_url = 'http://backend'
+    payload = {
+        'cctv_id': 'cam1',
+        'timestamp': '2026-01-01T00:00:00',
+        'detections': [{'animal': 'tiger', 'confidence': 91.0, 'bbox': {}}],
+        'total_detections': 1,
+        'frame_shape': [480, 640, 3],
+    }
+
+    assert service._post_detection(payload, b'jpeg') == ['id0']
+    url, kwargs = posts[0]
+    assert url == 'http://backend/api/wildDetection/detections/batch'
+    assert kwargs['files']['media'][2] == 'image/jpeg'
+    assert json.loads(kwargs['data']['detections']) == payload['detections']
@@ -0,0 +1,102 @@
+"""
+Tests for the alert dedup index: repeats are suppressed within the cooldown and expire after it
+"""
+
+import numpy as np
+import pytest
+
+import alert_dedup
+from alert_dedup import AlertDedupIndex
+from detection_result import DetectionResult
+
+FRAME = (400, 400, 3)
+NAMES = {0: 'tiger', 1: 'hyena'}
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(alert_dedup.time, 'monotonic', fake)
+    return fake
+
+
+def detections(*rows):
+    """rows: (class_id, x_min, y_min, x_max, y_max)"""
+    return DetectionResult(
+        boxes=np.array([row[1:] for row in rows], dtype=np.float32).reshape(-1, 4),
+        scores=np.full(len(rows), 0.9, dtype=np.float32),
+        class_ids=np.array([row[0] for row in rows], dtype=np.int32),
+        names=NAMES
+    )
+
+
+def test_repeat_is_suppressed_until_the_cooldown_expires(clock):
+    index = AlertDedupIndex(cooldown=30, cell_size=0.25)
+    tiger = detections((0, 10, 10, 50, 50))
+    index.record('cam1', tiger, FRAME)
+
+    clock.now += 29
+    assert len(index.filter_new('cam1', tiger, FRAME)) == 0
+
+    clock.now += 2
+    assert len(index.filter_new('cam1', tiger, FRAME)) == 1
+    assert len(index) == 0
+
+
+def test_keys_are_per_camera_class_and_cell(clock):
+    index = AlertDedupIndex(cooldown=30, cell_size=0.25)
+    index.record('cam1', detections((0, 10, 10, 50, 50)), FRAME)
+
+    assert len(index.filter_new('cam2', detections((0, 10, 10, 50, 50)), FRAME)) == 1
+    assert len(index.filter_new('cam1', detections((1, 10, 10, 50, 50)), FRAME)) == 1
+    # Two cells away on both axes is a different location
+    assert len(index.filter_new('cam1', detections((0, 250, 250, 290, 290)), FRAME)) == 1
+
+
+def test_neighbouring_cell_counts_as_duplicate(clock):
+    index = AlertDedupIndex(cooldown=30, cell_size=0.25)
+    index.record('cam1', detections((0, 10, 10, 50, 50)), FRAME)
+    moved = detections((0, 110, 10, 150, 50))
+
+    assert len(index.filter_new('cam1', moved, FRAME)) == 0
+    assert len(AlertDedupIndex(cooldown=30, match_neighbors=False).filter_new('cam1', moved, FRAME)) == 1
+
+
+def test_re_recording_extends_the_cooldown(clock):
+    index = AlertDedupIndex(cooldown=30, cell_size=0.25)
+    tiger = detections((0, 10, 10, 50, 50))
+    index.record('cam1', tiger, FRAME)
+    clock.now += 20
+    index.record('cam1', tiger, FRAME)
+
+    clock.now += 20
+    assert len(index.filter_new('cam1', tiger, FRAME)) == 0
+    clock.now += 11
+    assert len(index.filter_new('cam1', tiger, FRAME)) == 1
+
+
+def test_long_idle_gap_clears_every_key(clock):
+    index = AlertDedupIndex(cooldown=5, cell_size=0.25)
+    index.record('cam1', detections((0, 10, 10, 50, 50), (1, 300, 300, 350, 350)), FRAME)
+    assert len(index) == 2
+
+    clock.now += 1000
+    assert len(index.filter_new('cam1', detections((0, 10, 10, 50, 50)), FRAME)) == 1
+    assert len(index) == 0
+
+
+def test_key_count_stays_bounded(clock):
+    index = AlertDedupIndex(cooldown=30, cell_size=0.01, max_keys=10, match_neighbors=False)
+    for step in range(50):
+        clock.now += 0.5
+        x = step * 7
+        index.record('cam1', detections((0, x, 0, x + 2, 2)), FRAME)
+        assert len(index) <= 10
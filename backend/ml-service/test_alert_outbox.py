@@ -0,0 +1,104 @@
+"""
+Tests for the alert outbox: undelivered alerts are spooled to SQLite and replayed after a restart
+"""
+
+import os
+import time
+
+from alert_outbox import AlertOutbox
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def open_outbox(tmp_path, send_fn, **options):
+    return AlertOutbox(send_fn, spool_path=str(tmp_path / 'spool.db'), spool_dir=str(tmp_path / 'spool'),
+                       backoff_base=0.01, **options)
+
+
+def test_delivered_alert_is_not_spooled(tmp_path):
+    sent = []
+    outbox = open_outbox(tmp_path, lambda payload, video: sent.append(payload) or True)
+    outbox.enqueue({'cctv_id': 'cam1'})
+
+    assert wait_for(lambda: outbox.stats['delivered'] == 1)
+    outbox.stop()
+    assert sent == [{'cctv_id': 'cam1'}]
+    assert outbox.stats['spooled'] == 0
+
+
+def test_spooled_alert_is_replayed_after_restart(tmp_path):
+    down = open_outbox(tmp_path, lambda payload, video: False, max_attempts=2)
+    down.enqueue({'cctv_id': 'cam1', 'detections': [{'animal': 'tiger'}]}, video_data=b'snapshot')
+
+    assert wait_for(lambda: down.pending()[1] == 1)
+    assert down.stats['retries'] == 1
+    down.stop()
+
+    delivered = []
+
+    def send_fn(payload, video):
+        # Replayed media arrives as the path of the spooled file
+        with open(video, 'rb') as f:
+            delivered.append((payload, f.read(), video))
+        return True
+
+    restarted = open_outbox(tmp_path, send_fn)
+    assert wait_for(lambda: restarted.stats['replayed'] == 1)
+    assert restarted.pending() == (0, 0)
+    restarted.stop()
+
+    payload, media, path = delivered[0]
+    assert payload == {'cctv_id': 'cam1', 'detections': [{'animal': 'tiger'}]}
+    assert media == b'snapshot'
+    assert not os.path.exists(path)
+
+
+def test_stop_spools_alerts_still_in_memory(tmp_path):
+    outbox = open_outbox(tmp_path, lambda payload, video: True)
+    # Park the worker so the alerts are still queued in memory when stop() runs
+    outbox.stop_event.set()
+    outbox.thread.join(5)
+    for index in range(3):
+        outbox.enqueue({'n': index})
+    outbox.stop()
+    assert outbox.stats['spooled'] == 3
+
+    replayed = []
+    restarted = open_outbox(tmp_path, lambda payload, video: replayed.append(payload) or True)
+    assert wait_for(lambda: restarted.stats['replayed'] == 3)
+    restarted.stop()
+    assert replayed == [{'n': 0}, {'n': 1}, {'n': 2}]
+
+
+def test_full_queue_spools_instead_of_blocking(tmp_path):
+    outbox = open_outbox(tmp_path, lambda payload, video: False, max_queue=1, max_attempts=1)
+    outbox.stop_event.set()
+    outbox.thread.join(5)
+
+    outbox.enqueue({'n': 1})
+    outbox.enqueue({'n': 2})
+
+    assert outbox.pending() == (1, 1)
+    outbox.stop()
+    assert outbox.stats['spooled'] == 2
+
+
+def test_spool_keeps_only_the_newest_alerts(tmp_path):
+    outbox = open_outbox(tmp_path, lambda payload, video: False, max_spool=2)
+    outbox.stop_event.set()
+    outbox.thread.join(5)
+
+    for index in range(4):
+        outbox._spool({'payload': {'n': index}, 'video_path': None, 'attempts': 0})
+
+    rows = outbox.db.execute("SELECT payload FROM alerts ORDER BY id").fetchall()
+    assert [row[0] for row in rows] == ['{"n": 2}', '{"n": 3}']
+    assert outbox.stats['discarded'] == 2
+    outbox.stop()
@@ -0,0 +1,137 @@
+"""
+Tests for the batched inference engine: every future resolves, whatever happens to the engine
+"""
+
+import threading
+
+import pytest
+
+from batch_inference import PRIORITY_CRITICAL, PRIORITY_LOW, BatchInferenceEngine
+
+
+def wait_all(futures, timeout=5):
+    for future in futures:
+        future.exception(timeout)  # raises TimeoutError if the future never resolves
+
+
+def test_results_come_back_in_order():
+    engine = BatchInferenceEngine(lambda frames: [frame * 10 for frame in frames], max_batch_size=4, max_wait_ms=5)
+    engine.start()
+    try:
+        assert engine.infer_many([1, 2, 3, 4, 5], timeout=5) == [10, 20, 30, 40, 50]
+    finally:
+        engine.stop()
+
+
+def test_stop_fails_queued_requests():
+    engine = BatchInferenceEngine(lambda frames: frames)
+    futures = [engine.submit(frame) for frame in range(3)]
+
+    engine.stop()
+
+    wait_all(futures)
+    for future in futures:
+        with pytest.raises(RuntimeError, match="stopped"):
+            future.result(0)
+
+
+def test_submit_after_stop_fails_immediately():
+    engine = BatchInferenceEngine(lambda frames: frames)
+    engine.start()
+    engine.stop()
+
+    future = engine.submit(1)
+
+    assert future.done()
+    with pytest.raises(RuntimeError, match="stopped"):
+        engine.infer(1, timeout=1)
+
+
+def test_stop_during_a_batch_resolves_running_and_queued_requests():
+    started = threading.Event()
+    release = threading.Event()
+
+    def infer_fn(frames):
+        started.set()
+        release.wait(5)
+        return frames
+
+    engine = BatchInferenceEngine(infer_fn, max_batch_size=1, max_wait_ms=0)
+    engine.start()
+    running = engine.submit('running')
+    assert started.wait(5)
+    queued = [engine.submit(frame) for frame in range(3)]
+
+    stopper = threading.Thread(target=engine.stop)
+    stopper.start()
+    release.set()
+    stopper.join(5)
+
+    wait_all([running] + queued)
+    assert running.result(0) == 'running'
+    for future in queued:
+        with pytest.raises(RuntimeError):
+            future.result(0)
+
+
+def test_short_results_fail_the_leftover_frames():
+    engine = BatchInferenceEngine(lambda frames: frames[:1], max_batch_size=3, max_wait_ms=200)
+    futures = [engine.submit(frame) for frame in ('a', 'b', 'c')]
+    engine.start()
+    try:
+        wait_all(futures)
+    finally:
+        engine.stop()
+
+    assert futures[0].result(0) == 'a'
+    for future in futures[1:]:
+        with pytest.raises(RuntimeError, match="1 results for 3 frames"):
+            future.result(0)
+
+
+def test_generator_results_are_matched_to_frames():
+    engine = BatchInferenceEngine(lambda frames: (frame.upper() for frame in frames), max_batch_size=2,
+                                  max_wait_ms=200)
+    futures = [engine.submit(frame) for frame in ('a', 'b')]
+    engine.start()
+    try:
+        wait_all(futures)
+    finally:
+        engine.stop()
+
+    assert [future.result(0) for future in futures] == ['A', 'B']
+
+
+def test_infer_fn_errors_reach_every_caller():
+    def infer_fn(frames):
+        raise ValueError("model crashed")
+
+    engine = BatchInferenceEngine(infer_fn, max_batch_size=2, max_wait_ms=200)
+    futures = [engine.submit(frame) for frame in range(2)]
+    engine.start()
+    try:
+        wait_all(futures)
+    finally:
+        engine.stop()
+
+    for future in futures:
+        with pytest.raises(ValueError, match="model crashed"):
+            future.result(0)
+
+
+def test_urgent_frames_are_served_first():
+    served = []
+
+    def infer_fn(frames):
+        served.extend(frames)
+        return frames
+
+    engine = BatchInferenceEngine(infer_fn, max_batch_size=1, max_wait_ms=0, aging_ms=10000)
+    futures = [engine.submit('low', PRIORITY_LOW), engine.submit('critical', PRIORITY_CRITICAL)]
+    engine.start()
+    try:
+        wait_all(futures)
+    finally:
+        engine.stop()
+
+    assert served == ['critical', 'low']
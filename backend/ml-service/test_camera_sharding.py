@@ -0,0 +1,94 @@
+"""
+Tests for camera sharding: consistent-hash key movement and coordinator rebalancing
+"""
+
+from camera_sharding import Coordinator, HashRing, InMemoryStore
+
+CAMERAS = [f"cam{index}" for index in range(400)]
+
+
+def owners(ring):
+    return {camera: ring.node_for(camera) for camera in CAMERAS}
+
+
+def test_joining_node_only_takes_keys():
+    before = owners(HashRing({'a': 1, 'b': 1, 'c': 1}))
+    after = owners(HashRing({'a': 1, 'b': 1, 'c': 1, 'd': 1}))
+
+    moved = [camera for camera in CAMERAS if before[camera] != after[camera]]
+    assert moved
+    # Every moved key goes to the new node; nothing shuffles between the old ones
+    assert all(after[camera] == 'd' for camera in moved)
+    # Roughly its fair share (1/4), not a reshuffle of everything
+    assert 0.15 * len(CAMERAS) < len(moved) < 0.35 * len(CAMERAS)
+
+
+def test_leaving_node_only_gives_up_its_own_keys():
+    before = owners(HashRing({'a': 1, 'b': 1, 'c': 1, 'd': 1}))
+    after = owners(HashRing({'a': 1, 'b': 1, 'c': 1}))
+
+    moved = [camera for camera in CAMERAS if before[camera] != after[camera]]
+    assert sorted(moved) == sorted(camera for camera in CAMERAS if before[camera] == 'd')
+    assert 'd' not in after.values()
+
+
+def test_share_follows_weight():
+    assignment = owners(HashRing({'small': 1, 'large': 3}))
+    large = sum(1 for node in assignment.values() if node == 'large')
+    assert 0.6 * len(CAMERAS) < large < 0.9 * len(CAMERAS)
+
+
+def test_empty_ring_owns_nothing():
+    assert HashRing({}).node_for('cam1') is None
+
+
+def heartbeat(store, node_id, capacity, utilization=0.0):
+    store.heartbeat(node_id, {'capacity': capacity, 'utilization': utilization})
+
+
+def test_rebalance_moves_cameras_to_a_joining_node():
+    store = InMemoryStore()
+    store.set_cameras({camera: {} for camera in CAMERAS[:40]})
+    heartbeat(store, 'a', 10.0)
+    coordinator = Coordinator(store)
+    coordinator.rebalance()
+    assert set(store.assignments().values()) == {'a'}
+
+    # A node that has not run inference yet reports no capacity but still gets a share
+    heartbeat(store, 'b', 0.0)
+    moves = coordinator.rebalance()
+
+    assert moves and all(new == 'b' for _, new in moves.values())
+    assert set(store.assignments().values()) == {'a', 'b'}
+
+
+def test_rebalance_hands_a_departed_nodes_cameras_to_the_rest():
+    store = InMemoryStore()
+    store.set_cameras({camera: {} for camera in CAMERAS[:40]})
+    for node_id in ('a', 'b', 'c'):
+        heartbeat(store, node_id, 10.0)
+    coordinator = Coordinator(store)
+    coordinator.rebalance()
+    held_by_c = {camera for camera, node in store.assignments().items() if node == 'c'}
+
+    store.remove_node('c')
+    moves = coordinator.rebalance()
+
+    assert set(moves) == held_by_c
+    assert set(store.assignments().values()) <= {'a', 'b'}
+
+
+def test_utilization_hovering_at_the_threshold_does_not_flap():
+    store = InMemoryStore()
+    store.set_cameras({camera: {} for camera in CAMERAS[:40]})
+    heartbeat(store, 'a', 10.0)
+    heartbeat(store, 'b', 10.0)
+    coordinator = Coordinator(store, saturation=0.9, saturation_exit=0.7, saturation_hold=60.0)
+    coordinator.rebalance()
+
+    moved = 0
+    for round_index in range(10):
+        heartbeat(store, 'a', 10.0, utilization=0.95 if round_index % 2 else 0.85)
+        heartbeat(store, 'b', 10.0)
+        moved += len(coordinator.rebalance())
+    assert moved == 0
@@ -0,0 +1,129 @@
+"""
+Tests for the pre-event clip buffers: packet remux starts on a keyframe and decodes, JPEG ring stays bounded
+"""
+
+import io
+
+import numpy as np
+import pytest
+
+from clip_buffer import JpegRingBuffer, PacketRingBuffer
+from clip_encoder import ClipProfile
+
+av = pytest.importorskip('av')
+
+FPS = 25
+GOP = 10
+
+
+def make_video(path, frames=75, size=(160, 120)):
+    """Write a small MPEG-4 file with a keyframe every GOP frames"""
+    with av.open(str(path), mode='w') as output:
+        stream = output.add_stream('mpeg4', rate=FPS)
+        stream.width, stream.height = size
+        stream.pix_fmt = 'yuv420p'
+        stream.codec_context.gop_size = GOP
+        for index in range(frames):
+            # A small moving square: enough change to encode, too little for a scene-cut keyframe
+            image = np.full((size[1], size[0], 3), 96, dtype=np.uint8)
+            image[40:60, index % (size[0] - 20):index % (size[0] - 20) + 20] = 255
+            frame = av.VideoFrame.from_ndarray(image, format='bgr24')
+            for packet in stream.encode(frame):
+                output.mux(packet)
+        for packet in stream.encode(None):
+            output.mux(packet)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'source.mp4'
+    make_video(path)
+    container = av.open(str(path))
+    yield container
+    container.close()
+
+
+def fill(container, seconds):
+    stream = container.streams.video[0]
+    buffer = PacketRingBuffer(stream, seconds=seconds)
+    for packet in container.demux(stream):
+        buffer.append(packet)
+    return buffer
+
+
+def decode_all(data):
+    with av.open(io.BytesIO(data)) as clip:
+        packets = [packet for packet in clip.demux(video=0) if packet.size]
+    with av.open(io.BytesIO(data)) as clip:
+        frames = list(clip.decode(video=0))
+    return packets, frames
+
+
+def test_remux_starts_on_a_keyframe_and_decodes(source):
+    buffer = fill(source, seconds=1.0)
+
+    data = buffer.clip()
+
+    packets, frames = decode_all(data)
+    assert packets[0].is_keyframe
+    assert len(frames) == len(buffer.packets)
+    assert (frames[0].width, frames[0].height) == (160, 120)
+
+
+def test_window_covers_the_requested_seconds_plus_at_most_one_gop(source):
+    buffer = fill(source, seconds=1.0)
+
+    assert buffer.packets[0][3]  # oldest buffered packet is a keyframe
+    assert 1.0 <= buffer.duration() < 1.0 + GOP / FPS
+    assert buffer.nbytes == sum(len(packet[4]) for packet in buffer.packets)
+
+
+def test_packets_before_the_first_keyframe_are_ignored(source):
+    stream = source.streams.video[0]
+    buffer = PacketRingBuffer(stream, seconds=1.0)
+    packets = [packet for packet in source.demux(stream) if packet.size]
+    second_keyframe = next(index for index, packet in enumerate(packets) if index and packet.is_keyframe)
+    for packet in packets[1:second_keyframe]:
+        buffer.append(packet)
+    assert buffer.clip() is None
+
+    buffer.append(packets[second_keyframe])
+    assert len(buffer.packets) == 1
+
+
+def test_re_encoded_clip_decodes(source):
+    buffer = fill(source, seconds=1.0)
+    profile = ClipProfile(codec='mpeg4', bitrate=200_000, max_width=80, fps=10, max_bytes=None, focus=False)
+
+    data = buffer.clip(profile)
+
+    _, frames = decode_all(data)
+    assert frames
+    assert frames[0].width == 80
+
+
+def test_jpeg_ring_keeps_only_the_window(monkeypatch):
+    import clip_buffer
+
+    now = [100.0]
+    monkeypatch.setattr(clip_buffer.time, 'monotonic', lambda: now[0])
+    buffer = JpegRingBuffer(seconds=1.0, size=(80, 60))
+    for _ in range(30):
+        buffer.append(np.zeros((120, 160, 3), dtype=np.uint8))
+        now[0] += 0.1
+
+    assert buffer.duration() == pytest.approx(1.0)
+    assert buffer.nbytes == sum(encoded.nbytes for _, encoded in buffer.frames)
+    assert next(buffer.decoded()).shape == (60, 80, 3)
+
+
+def test_jpeg_ring_round_trips_through_entries():
+    buffer = JpegRingBuffer(seconds=5.0)
+    for _ in range(3):
+        buffer.append(np.zeros((60, 80, 3), dtype=np.uint8))
+
+    copy = JpegRingBuffer(seconds=5.0, max_frames=None)
+    copy.load(buffer.entries())
+
+    assert len(copy.frames) == 3
+    assert copy.nbytes == buffer.nbytes
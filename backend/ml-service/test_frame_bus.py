@@ -0,0 +1,104 @@
+"""
+Tests for the shared-memory frame bus and the capture process that feeds it
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from frame_bus import FrameBus, SharedFrameCapture
+
+SHAPE = (48, 64, 3)
+
+
+def frame(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+
+@pytest.fixture
+def bus():
+    bus = FrameBus(SHAPE, slots=4)
+    yield bus
+    bus.close()
+
+
+def test_frames_are_read_back_by_sequence(bus):
+    assert bus.latest() == -1
+    for value in range(3):
+        assert bus.write(frame(value)) == value
+
+    assert bus.latest() == 2
+    assert bus.view(1)[0, 0, 0] == 1
+    assert bus.copy(2)[0, 0, 0] == 2
+
+
+def test_overwritten_frames_are_gone(bus):
+    for value in range(6):
+        bus.write(frame(value))
+
+    # Four slots: sequences 0 and 1 were overwritten by 4 and 5
+    assert bus.view(0) is None
+    assert bus.copy(1) is None
+    assert not bus.is_current(1)
+    assert bus.copy(5)[0, 0, 0] == 5
+
+
+def test_attached_bus_shares_the_frames(bus):
+    reader = FrameBus.attach(bus.name, SHAPE, 4)
+    try:
+        bus.write(frame(7))
+        assert reader.view(0)[0, 0, 0] == 7
+
+        bus.close_writer()
+        assert reader.closed
+    finally:
+        reader.close()
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = str(tmp_path / 'stream.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (160, 120))
+    for index in range(40):
+        image = np.full((120, 160, 3), 96, dtype=np.uint8)
+        image[40:60, index * 3:index * 3 + 20] = 255
+        writer.write(image)
+    writer.release()
+    return path
+
+
+def test_capture_process_fills_the_ring_and_the_clip_buffer(video):
+    cap = SharedFrameCapture(video, slots=8, read_timeout=2.0, clip_seconds=60.0, clip_size=(80, 60))
+    try:
+        assert cap.isOpened()
+        assert cap.get(cv2.CAP_PROP_FRAME_WIDTH) == 160
+
+        read = 0
+        while True:
+            ok, view = cap.read()
+            if not ok:
+                break
+            read += 1
+            assert view.shape == (120, 160, 3)
+        assert read + cap.stats['dropped'] == 40
+
+        # The stream has ended, but the capture process still serves its clip frames
+        entries = cap.clip_entries()
+        assert len(entries) == 40
+        first = cv2.imdecode(entries[0][1], cv2.IMREAD_COLOR)
+        assert first.shape == (60, 80, 3)
+        assert len(list(cap.clip_buffer.snapshot().decoded())) == 40
+    finally:
+        cap.release()
+    assert not cap.process.is_alive()
+    assert cap.clip_entries() == []
+
+
+def test_ring_is_capped_by_memory(video):
+    frame_bytes = 120 * 160 * 3
+    cap = SharedFrameCapture(video, slots=32, max_ring_mb=frame_bytes * 5 / (1024 * 1024))
+    try:
+        assert cap.slots == 5
+        assert cap.clip_buffer is None
+    finally:
+        cap.release()
@@ -0,0 +1,155 @@
+"""
+Tests for the alert media worker: alerts are posted first, clips follow, and flush() always returns
+"""
+
+import time
+
+import pytest
+
+from media_worker import MediaWorker
+
+
+class FakeClipBuffer:
+    def __init__(self, clip=b'clip', preview=b'preview', error=None):
+        self.clip_data = clip
+        self.preview_data = preview
+        self.error = error
+        self.built_at = None
+
+    def clip(self, profile=None, focus=None):
+        self.built_at = time.monotonic()
+        if self.error:
+            raise self.error
+        return self.clip_data
+
+    def preview(self, profile, focus=None):
+        return self.preview_data
+
+
+class Recorder:
+    def __init__(self, alert_ids=('id1',), upload_ok=True, attach_ok=True):
+        self.alert_ids = list(alert_ids)
+        self.upload_ok = upload_ok
+        self.attach_ok = attach_ok
+        self.sent = []
+        self.uploaded = []
+        self.attached = []
+
+    def send(self, cctv_id, alert):
+        self.sent.append((cctv_id, alert))
+        return self.alert_ids
+
+    def upload(self, data, resource_type):
+        self.uploaded.append((data, resource_type))
+        return f"https://media/{resource_type}" if self.upload_ok else None
+
+    def attach(self, alert_ids, media):
+        self.attached.append((alert_ids, media))
+        return self.attach_ok
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+def worker_for(recorder, **options):
+    options.setdefault('post_roll', 0.0)
+    return MediaWorker(recorder.upload, recorder.attach, send_fn=recorder.send, **options)
+
+
+def test_alert_is_posted_then_its_clip_attached(recorder):
+    worker = worker_for(recorder)
+    worker.send_alert('cam1', FakeClipBuffer(), {'detections': ['tiger']})
+
+    assert worker.flush(5)
+    worker.stop(5)
+    assert recorder.sent == [('cam1', {'detections': ['tiger']})]
+    assert recorder.uploaded == [(b'clip', 'video')]
+    assert recorder.attached == [(['id1'], {'videoUrl': 'https://media/video'})]
+    assert worker.stats['alerts_sent'] == 1
+    assert worker.stats['attached'] == 1
+
+
+def backend_down(cctv_id, alert):
+    raise ConnectionError("backend down")
+
+
+@pytest.mark.parametrize('send_fn', [
+    lambda cctv_id, alert: [],
+    lambda cctv_id, alert: None,
+    backend_down,
+])
+def test_flush_returns_when_send_fn_fails(recorder, send_fn):
+    worker = MediaWorker(recorder.upload, recorder.attach, post_roll=30.0, send_fn=send_fn)
+    for _ in range(3):
+        worker.send_alert('cam1', FakeClipBuffer(), {'detections': []})
+
+    started = time.monotonic()
+    assert worker.flush(5)
+    assert time.monotonic() - started < 5
+    worker.stop(5)
+    assert worker.stats['alerts_failed'] == 3
+    # Without alert IDs there is nothing to attach a clip to
+    assert recorder.uploaded == []
+    assert recorder.attached == []
+
+
+def test_clip_waits_for_the_post_roll(recorder):
+    worker = worker_for(recorder, post_roll=0.3)
+    clip_buffer = FakeClipBuffer()
+    queued_at = time.monotonic()
+    worker.send_alert('cam1', clip_buffer, {})
+
+    deadline = time.monotonic() + 5
+    while worker.stats['attached'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    worker.stop(5)
+    assert clip_buffer.built_at - queued_at >= 0.3
+
+
+def test_flush_cuts_the_post_roll_short(recorder):
+    worker = worker_for(recorder, post_roll=30.0)
+    worker.send_alert('cam1', FakeClipBuffer(), {})
+
+    started = time.monotonic()
+    assert worker.flush(5)
+    assert time.monotonic() - started < 5
+    assert worker.stats['attached'] == 1
+    worker.stop(5)
+
+
+def test_failed_clip_or_upload_is_counted_not_attached(recorder):
+    worker = worker_for(recorder)
+    worker.send_alert('cam1', FakeClipBuffer(error=ValueError("no frames")), {})
+    worker.send_alert('cam1', FakeClipBuffer(clip=None), {})
+    assert worker.flush(5)
+
+    recorder.upload_ok = False
+    worker.send_alert('cam1', FakeClipBuffer(), {})
+    assert worker.flush(5)
+    worker.stop(5)
+
+    assert worker.stats['failed'] == 3
+    assert recorder.attached == []
+
+
+def test_pending_clips_are_capped(recorder):
+    worker = worker_for(recorder, post_roll=30.0, max_pending=2)
+    for _ in range(4):
+        worker.submit('cam1', FakeClipBuffer(), ['id1'])
+
+    assert worker.stats['dropped'] == 2
+    assert worker.flush(5)
+    worker.stop(5)
+    assert worker.stats['attached'] == 2
+
+
+def test_alert_without_clip_buffer_sends_only_the_alert(recorder):
+    worker = worker_for(recorder)
+    worker.send_alert('cam1', None, {'detections': ['hyena']})
+
+    assert worker.flush(5)
+    worker.stop(5)
+    assert len(recorder.sent) == 1
+    assert worker.stats['submitted'] == 0
@@ -0,0 +1,76 @@
+"""
+Tests for the sampling scheduler: budget allocation across idle and active cameras
+"""
+
+import pytest
+
+from sampling_scheduler import SamplingScheduler
+
+
+@pytest.mark.parametrize('demands, budget', [
+    ({'a': 1.0, 'b': 2.0, 'c': 10.0}, 6.0),
+    ({'a': 5.0, 'b': 5.0}, 4.0),
+    ({'a': 0.5, 'b': 0.5, 'c': 0.5}, 10.0),
+    ({'a': 3.0}, 0.0),
+])
+def test_water_fill_never_exceeds_budget_or_demand(demands, budget):
+    granted = SamplingScheduler._water_fill(demands, budget)
+
+    assert set(granted) == set(demands)
+    assert sum(granted.values()) == pytest.approx(min(budget, sum(demands.values())))
+    for cctv_id, rate in granted.items():
+        assert 0.0 <= rate <= demands[cctv_id] + 1e-9
+
+
+def test_water_fill_meets_small_demands_and_splits_the_rest():
+    granted = SamplingScheduler._water_fill({'a': 1.0, 'b': 2.0, 'c': 10.0}, 6.0)
+    assert granted == pytest.approx({'a': 1.0, 'b': 2.0, 'c': 3.0})
+
+    granted = SamplingScheduler._water_fill({'a': 5.0, 'b': 5.0}, 4.0)
+    assert granted == pytest.approx({'a': 2.0, 'b': 2.0})
+
+
+def test_unlimited_budget_grants_every_demand():
+    scheduler = SamplingScheduler(fps_budget=0, idle_fps=1.0, active_fps=5.0)
+    for cctv_id in ('a', 'b'):
+        scheduler.register(cctv_id)
+    scheduler.mark_active('a')
+
+    assert scheduler.rate('a') == 5.0
+    assert scheduler.rate('b') == 1.0
+
+
+def test_active_cameras_are_served_before_idle_ones():
+    scheduler = SamplingScheduler(fps_budget=6.0, idle_fps=2.0, active_fps=5.0, min_fps=0.1)
+    for cctv_id in ('a', 'b', 'c'):
+        scheduler.register(cctv_id)
+    scheduler.mark_active('a')
+
+    rates = {cctv_id: scheduler.rate(cctv_id) for cctv_id in ('a', 'b', 'c')}
+    assert sum(rates.values()) == pytest.approx(6.0)
+    assert rates['a'] == pytest.approx(5.0)
+    # The idle cameras split what is left evenly, never below the floor
+    assert rates['b'] == pytest.approx(rates['c'])
+    assert rates['b'] >= 0.1
+
+
+def test_floor_is_kept_when_active_demand_exceeds_the_budget():
+    scheduler = SamplingScheduler(fps_budget=4.0, idle_fps=1.0, active_fps=5.0, min_fps=0.5)
+    for cctv_id in ('a', 'b', 'c'):
+        scheduler.register(cctv_id)
+    scheduler.mark_active('a')
+    scheduler.mark_active('b')
+
+    rates = {cctv_id: scheduler.rate(cctv_id) for cctv_id in ('a', 'b', 'c')}
+    assert sum(rates.values()) == pytest.approx(4.0)
+    assert rates['c'] == pytest.approx(0.5)
+    assert rates['a'] == pytest.approx(rates['b']) == pytest.approx(1.75)
+
+
+def test_is_due_claims_the_slot():
+    scheduler = SamplingScheduler(idle_fps=1.0)
+    scheduler.register('a')
+
+    assert scheduler.is_due('a')
+    assert not scheduler.is_due('a')
+    assert 0.0 < scheduler.next_delay('a') <= 1.0
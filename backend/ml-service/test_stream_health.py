@@ -0,0 +1,137 @@
+"""
+Tests for the stream health manager: background connects, reconnects with backoff and stall detection
+"""
+
+import threading
+import time
+
+import pytest
+
+from stream_health import HEALTHY, STOPPED, StreamHealthManager
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class FakeCapture:
+    def __init__(self, frames=None, block=None):
+        self.frames = list(frames or [])
+        self.block = block
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        if self.block is not None:
+            self.block.wait(5)
+            return False, None
+        if not self.frames:
+            return False, None
+        return True, self.frames.pop(0)
+
+    def get(self, prop):
+        return 25.0
+
+    def release(self):
+        self.released = True
+
+
+@pytest.fixture
+def manager():
+    manager = StreamHealthManager(stall_timeout=0.2, backoff_base=0.01, backoff_max=0.05, watchdog_interval=0.01)
+    yield manager
+    manager.shutdown()
+
+
+def test_stream_connects_in_the_background(manager):
+    stream = manager.open('cam1', lambda: FakeCapture(frames=['f1', 'f2']))
+
+    assert wait_for(lambda: stream.state == HEALTHY)
+    assert stream.read() == (True, 'f1')
+    assert stream.read() == (True, 'f2')
+    assert manager.metrics()['cam1']['reconnects'] == 0
+
+
+def test_failed_read_reconnects(manager):
+    captures = [FakeCapture(frames=['a']), FakeCapture(frames=['b'])]
+    stream = manager.open('cam1', lambda: captures.pop(0))
+    assert wait_for(lambda: stream.state == HEALTHY)
+
+    assert stream.read() == (True, 'a')
+    assert stream.read() == (False, None)  # first capture is exhausted
+
+    assert wait_for(lambda: stream.read() == (True, 'b'))
+    assert manager.metrics()['cam1']['reconnects'] == 1
+
+
+@pytest.mark.parametrize('failure', ['closed', 'raises'])
+def test_failing_opener_is_retried_until_it_connects(manager, failure):
+    attempts = []
+
+    class Closed(FakeCapture):
+        def isOpened(self):
+            return False
+
+    def opener():
+        attempts.append(time.monotonic())
+        if len(attempts) < 4:
+            if failure == 'raises':
+                raise OSError("camera offline")
+            return Closed()
+        return FakeCapture(frames=['up'])
+
+    stream = manager.open('cam1', opener)
+
+    assert wait_for(lambda: stream.state == HEALTHY)
+    assert len(attempts) == 4
+    assert stream.attempts == 0
+    assert stream.read() == (True, 'up')
+
+
+def test_stalled_read_is_replaced(manager):
+    unblock = threading.Event()
+    stuck = FakeCapture(block=unblock)
+    fresh = FakeCapture(frames=['fresh'])
+    captures = [stuck, fresh]
+    stream = manager.open('cam1', lambda: captures.pop(0))
+    assert wait_for(lambda: stream.state == HEALTHY)
+
+    results = []
+    reader = threading.Thread(target=lambda: results.append(stream.read()))
+    reader.start()
+
+    # The watchdog declares the hung read stalled and connects a new capture behind its back
+    assert wait_for(lambda: stream.cap is fresh and stream.state == HEALTHY)
+    unblock.set()
+    reader.join(5)
+
+    assert results == [(False, None)]
+    assert stuck.released  # the stuck reader releases the capture it was blocked on
+    assert stream.read() == (True, 'fresh')
+
+
+def test_backoff_is_capped_for_long_outages(manager):
+    for attempts in (1, 10, 1000, 10 ** 6):
+        assert manager._backoff(attempts) <= manager.backoff_max * 1.5
+    assert manager._backoff(0) == 0.0
+
+
+def test_closed_stream_stops_and_releases(manager):
+    capture = FakeCapture(frames=['a'])
+    stream = manager.open('cam1', lambda: capture)
+    assert wait_for(lambda: stream.state == HEALTHY)
+
+    stream.release()
+
+    assert stream.state == STOPPED
+    assert capture.released
+    assert not stream.isOpened()
+    assert stream.read(connect_wait=0) == (False, None)
+    assert 'cam1' not in manager.metrics()
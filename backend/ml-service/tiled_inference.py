@@ -0,0 +1,136 @@
+"""
+AniResQ ML Service - Tiled Inference
+Runs the detector on overlapping native-resolution tiles so small, distant
+animals survive, skipping tiles where nothing moved
+"""
+
+import logging
+import math
+
+import cv2
+import numpy as np
+
+from detection_result import DetectionResult
+
+logger = logging.getLogger(__name__)
+
+
+def tile_grid(width, height, tile_size=640, overlap=0.2):
+    """
+    Overlapping tiles covering a frame
+
+    Returns:
+        list: (x1, y1, x2, y2) per tile, evenly spread so the last tile ends at the frame edge
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = tile_size * (1 - overlap)
+        count = math.ceil((length - tile_size) / step) + 1
+        return [round(i * (length - tile_size) / (count - 1)) for i in range(count)]
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+
+class TiledDetector:
+    def __init__(self, detect_fn, tile_size=640, overlap=0.2, iou_threshold=0.5,
+                 min_tile_motion=0.002, overview=True, batch_size=16):
+        """
+        Split frames into tiles, detect on them as a batch and merge with NMS
+
+        Args:
+            detect_fn: Callable taking a list of images and returning one DetectionResult each
+            tile_size: Tile edge in native pixels
+            overlap: Fraction of a tile shared with its neighbour, so animals on a seam are whole in one tile
+            iou_threshold: IoU above which boxes of the same class from different tiles are merged
+            min_tile_motion: Fraction of changed pixels a tile needs to be inferred (0 = infer every tile)
+            overview: Also run the whole, downscaled frame to catch animals larger than a tile
+            batch_size: Largest number of images per detector call
+        """
+        self.detect_fn = detect_fn
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.iou_threshold = iou_threshold
+        self.min_tile_motion = min_tile_motion
+        self.overview = overview
+        self.batch_size = batch_size
+        self.grids = {}  # (height, width) -> tiles
+        self.stats = {'frames': 0, 'tiles': 0, 'tiles_run': 0}
+
+    def _tiles(self, frame_shape):
+        height, width = frame_shape[:2]
+        tiles = self.grids.get((height, width))
+        if tiles is None:
+            tiles = self.grids[(height, width)] = tile_grid(width, height, self.tile_size, self.overlap)
+        return tiles
+
+    def _active_tiles(self, tiles, frame_shape, motion_mask):
+        if motion_mask is None or self.min_tile_motion <= 0:
+            return tiles
+        height, width = frame_shape[:2]
+        scale_x = motion_mask.shape[1] / width
+        scale_y = motion_mask.shape[0] / height
+        active = []
+        for x1, y1, x2, y2 in tiles:
+            region = motion_mask[int(y1 * scale_y):max(int(y1 * scale_y) + 1, math.ceil(y2 * scale_y)),
+                                 int(x1 * scale_x):max(int(x1 * scale_x) + 1, math.ceil(x2 * scale_x))]
+            if region.size and np.count_nonzero(region) / region.size >= self.min_tile_motion:
+                active.append((x1, y1, x2, y2))
+        return active
+
+    def detect(self, frame, motion_mask=None, **infer_kwargs):
+        """
+        Detect on the tiles of one frame
+
+        Args:
+            frame: Native-resolution frame
+            motion_mask: Optional downscaled motion mask of the frame (MotionGate.motion_mask);
+                         tiles without motion are skipped
+            **infer_kwargs: Passed on to detect_fn (e.g. priority)
+
+        Returns:
+            DetectionResult: Merged detections in frame coordinates
+        """
+        tiles = self._tiles(frame.shape)
+        active = self._active_tiles(tiles, frame.shape, motion_mask)
+        self.stats['frames'] += 1
+        self.stats['tiles'] += len(tiles)
+        self.stats['tiles_run'] += len(active)
+
+        images = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in active]
+        offsets = [(x1, y1) for x1, y1, _, _ in active]
+        if self.overview and len(tiles) > 1:
+            images.append(frame)
+            offsets.append((0, 0))
+        if not images:
+            return DetectionResult.empty()
+
+        results = []
+        for start in range(0, len(images), self.batch_size):
+            results.extend(self.detect_fn(images[start:start + self.batch_size], **infer_kwargs))
+
+        parts = [result.offset(x, y) for result, (x, y) in zip(results, offsets) if len(result)]
+        if not parts:
+            return DetectionResult.empty(results[0].names)
+        if len(parts) == 1:
+            return parts[0]
+        return self._merge(parts)
+
+    def _merge(self, parts):
+        merged = DetectionResult(
+            boxes=np.concatenate([part.boxes for part in parts]),
+            scores=np.concatenate([part.scores for part in parts]),
+            class_ids=np.concatenate([part.class_ids for part in parts]),
+            names=parts[0].names
+        )
+        xywh = merged.boxes.copy()
+        xywh[:, 2:] -= xywh[:, :2]
+        keep = cv2.dnn.NMSBoxesBatched(
+            xywh.tolist(), merged.scores.tolist(), merged.class_ids.tolist(), 0.0, self.iou_threshold
+        )
+        return merged.select(np.asarray(keep, dtype=np.int64).reshape(-1))
+
+    def tile_savings(self):
+        """Fraction of tiles skipped for lack of motion"""
+        return 1.0 - self.stats['tiles_run'] / self.stats['tiles'] if self.stats['tiles'] else 0.0
@@ -204,9 +204,10 @@ import argparse
 from pathlib import Path
 from datetime import datetime
 import cloudinary
-import cloudinary.uploader
 from dotenv import load_dotenv
 
+from media_uploader import uploader_from_config
+
 load_dotenv(dotenv_path=r"C:\Users\Shraddha\Desktop\CapP\aniresqget\AniResQ\backend\.env")
 
 CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
@@ -233,6 +234,7 @@ class VideoDatabase:
         self.ml_service_url = ml_service_url
         self.supported_video_formats = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv']
         self.supported_image_formats = ['.jpg', '.jpeg', '.png', '.bmp']
+        self.uploader = uploader_from_config()
 
     def get_media_files(self, directory):
         """Get all video and image files from directory"""
@@ -301,18 +303,12 @@ class VideoDatabase:
             return None
 
     def upload_to_cloudinary(self, file_path):
-        """Upload a video or image to Cloudinary"""
-        try:
-            logger.info(f"☁️ Uploading {file_path.name} to Cloudinary...")
-            response = cloudinary.uploader.upload_large(
-                str(file_path),
-                resource_type='auto'
-            )
-            logger.info(f"✅ Uploaded URL: {response.get('secure_url')}")
-            return response.get('secure_url')
-        except Exception as e:
-            logger.error(f"❌ Cloudinary upload failed: {e}")
-            return None
+        """Upload a video or image to Cloudinary (skipped if the same content was uploaded before)"""
+        logger.info(f"☁️ Uploading {file_path.name} to Cloudinary...")
+        url = self.uploader.upload(file_path, resource_type='auto')
+        if not url:
+            logger.error(f"❌ Cloudinary upload failed: {file_path.name}")
+        return url
 
     def send_to_backend(self, cctv_id, detections, cloud_url):
         """Send detection + Cloudinary URL to backend"""
@@ -348,6 +344,9 @@ class VideoDatabase:
         all_results = []
         start_time = datetime.now()
 
+        # Uploads run on the uploader's worker pool while videos go through the ML service
+        uploads = [self.uploader.submit(media_file, resource_type='auto') for media_file in media_files]
+
         for idx, media_file in enumerate(media_files, 1):
             logger.info(f"\n[{idx}/{len(media_files)}] Processing: {media_file.name}")
 
@@ -359,8 +358,10 @@ class VideoDatabase:
                 # For images, optionally run detection via ML API if supported
                 result = {"file_type": "image", "detections": []}
 
-            # Upload to Cloudinary
-            cloud_url = self.upload_to_cloudinary(media_file)
+            # Wait for this file's upload
+            cloud_url = uploads[idx - 1].result()
+            if not cloud_url:
+                logger.error(f"❌ Cloudinary upload failed: {media_file.name}")
 
             # Send to backend with Cloudinary URL
             self.send_to_backend(cctv_id="aniresq_cam_1", detections=result.get('detections', []), cloud_url=cloud_url)
@@ -375,6 +376,9 @@ class VideoDatabase:
         # Print summary
         elapsed = (datetime.now() - start_time).total_seconds()
         self.print_summary(all_results, elapsed)
+        stats = self.uploader.stats
+        logger.info(f"☁️ Uploads: {stats['uploaded']} sent, {stats['deduplicated']} already uploaded, "
+                    f"{stats['failed']} failed")
 
         # Save results to file if specified
         if output_file:
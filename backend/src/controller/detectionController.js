@@ -1,6 +1,16 @@
 import Detection from "../model/detectionModel.js";
 import cloudinary from "../config/cloudinary.js";
 
+// Upload a multer memory file to Cloudinary
+const uploadToCloudinary = (file) =>
+  new Promise((resolve, reject) => {
+    const stream = cloudinary.uploader.upload_stream(
+      { resource_type: "auto" },
+      (error, result) => { if (error) reject(error); else resolve(result); }
+    );
+    stream.end(file.buffer);
+  });
+
 // CREATE DETECTION
 export const createDetection = async (req, res) => {
   try {
@@ -13,23 +23,23 @@ export const createDetection = async (req, res) => {
       locationName,
       latitude,
       longitude,
-      videoUrl: videoUrlFromBody
+      videoUrl: videoUrlFromBody,
+      snapshotUrl: snapshotUrlFromBody
     } = req.body;
 
     let videoUrl = videoUrlFromBody || "";
+    let snapshotUrl = snapshotUrlFromBody || "";
     let publicId = "";
 
-    // If a file was uploaded directly, override videoUrl
+    // If a file was uploaded directly, it is the alert's snapshot (image) or clip (video)
     if (req.file) {
-      const uploadResult = await new Promise((resolve, reject) => {
-        const stream = cloudinary.uploader.upload_stream(
-          { resource_type: "auto" },
-          (error, result) => { if (error) reject(error); else resolve(result); }
-        );
-        stream.end(req.file.buffer);
-      });
+      const uploadResult = await uploadToCloudinary(req.file);
 
-      videoUrl = uploadResult.secure_url;
+      if (req.file.mimetype.startsWith("image/")) {
+        snapshotUrl = uploadResult.secure_url;
+      } else {
+        videoUrl = uploadResult.secure_url;
+      }
       publicId = uploadResult.public_id;
     }
 
@@ -43,6 +53,7 @@ export const createDetection = async (req, res) => {
       latitude,
       longitude,
       videoUrl,
+      snapshotUrl,
       publicId
     });
 
@@ -63,6 +74,115 @@ export const createDetection = async (req, res) => {
   }
 };
 
+// CREATE DETECTIONS IN BULK (one request and one write per alert event)
+export const createDetectionBatch = async (req, res) => {
+  try {
+    const {
+      cctv_id,
+      locationName,
+      latitude,
+      longitude,
+      videoUrl: videoUrlFromBody,
+      snapshotUrl: snapshotUrlFromBody
+    } = req.body;
+    let { detections } = req.body;
+
+    // Multipart requests carry the detections as a JSON string
+    if (typeof detections === "string") {
+      try {
+        detections = JSON.parse(detections);
+      } catch {
+        detections = null;
+      }
+    }
+
+    if (!Array.isArray(detections) || detections.length === 0) {
+      return res.status(400).json({
+        success: false,
+        message: "detections (non-empty array) is required"
+      });
+    }
+
+    let videoUrl = videoUrlFromBody || "";
+    let snapshotUrl = snapshotUrlFromBody || "";
+
+    // One uploaded file is shared by every detection of the event
+    if (req.file) {
+      const uploadResult = await uploadToCloudinary(req.file);
+      if (req.file.mimetype.startsWith("image/")) {
+        snapshotUrl = uploadResult.secure_url;
+      } else {
+        videoUrl = uploadResult.secure_url;
+      }
+    }
+
+    const created = await Detection.insertMany(
+      detections.map((d) => ({
+        cctv_id,
+        animal: d.animal,
+        confidence: d.confidence,
+        behavior: d.behavior,
+        distance: d.distance,
+        locationName,
+        latitude,
+        longitude,
+        videoUrl,
+        snapshotUrl
+      }))
+    );
+
+    res.status(201).json({
+      success: true,
+      message: `${created.length} detection(s) saved`,
+      count: created.length,
+      data: created
+    });
+
+  } catch (error) {
+    console.error(error);
+    res.status(500).json({
+      success: false,
+      message: "Server Error"
+    });
+  }
+};
+
+// ATTACH CLIP TO DETECTIONS (ML service uploads the clip after the alert was sent)
+export const updateDetectionMedia = async (req, res) => {
+  try {
+    const { ids, videoUrl, previewUrl } = req.body;
+
+    if (!Array.isArray(ids) || ids.length === 0 || !(videoUrl || previewUrl)) {
+      return res.status(400).json({
+        success: false,
+        message: "ids (non-empty array) and videoUrl or previewUrl are required"
+      });
+    }
+
+    const media = {};
+    if (videoUrl) media.videoUrl = videoUrl;
+    if (previewUrl) media.previewUrl = previewUrl;
+
+    const result = await Detection.updateMany(
+      { _id: { $in: ids } },
+      { $set: media }
+    );
+
+    res.status(200).json({
+      success: true,
+      matched: result.matchedCount,
+      modified: result.modifiedCount
+    });
+
+  } catch (error) {
+    console.error(error);
+    res.status(500).json({
+      success: false,
+      message: "Server Error"
+    });
+  }
+};
+
 // GET ALL DETECTIONS (For Frontend Alert Screen)
 export const getAllDetections = async (req, res) => {
   try {
@@ -14,6 +14,8 @@ const detectionSchema = new mongoose.Schema({
   latitude: Number,
   longitude: Number,
   videoUrl: String,
+  snapshotUrl: String,
+  previewUrl: String,
   status: {
     type: String,
     default: "Critical Alert"
@@ -37,8 +37,10 @@ import express from "express";
 import upload from "../middleware/upload.js";
 import {
   createDetection,
+  createDetectionBatch,
   getAllDetections,
-  getSingleDetection
+  getSingleDetection,
+  updateDetectionMedia
 } from "../controller/detectionController.js";
 
 const detectionRoutes = express.Router();
@@ -50,6 +52,17 @@ detectionRoutes.post(
   createDetection
 );
 
+// All detections of one alert event in one request: { cctv_id, location..., detections: [...] }
+// plus an optional "media" file (the event's snapshot) shared by all of them
+detectionRoutes.post(
+  "/detections/batch",
+  upload.single("media"),
+  createDetectionBatch
+);
+
+// Attach a clip uploaded after the alert: { ids: [...], videoUrl, previewUrl }
+detectionRoutes.patch("/detections/media", updateDetectionMedia);
+
 detectionRoutes.get("/getdetections", getAllDetections);
 detectionRoutes.get("/getdetections/:id", getSingleDetection);
 